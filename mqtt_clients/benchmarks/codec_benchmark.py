@@ -0,0 +1,118 @@
+"""
+ペイロード形式のベンチマーク
+
+機能:
+- センサーデータ（測定値）とアラートの、テキスト / JSON / バイナリ形式を比較
+- 1件あたりのエンコード・デコード時間（ナノ秒）とペイロードのバイト数を計測
+- 値は multi_sensor_publisher.py と同じ範囲・桁数のランダムな値を使う
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.codec import decode_alert, decode_reading, encode_alert, encode_reading
+
+def make_readings(count, rng):
+    """(種別, 値) のリスト（publisher と同じ丸め）"""
+    readings = []
+    for _ in range(count):
+        readings.append(("temperature", round(rng.uniform(15.0, 35.0), 2)))
+        readings.append(("humidity", round(rng.uniform(20.0, 80.0), 1)))
+        readings.append(("light", int(rng.uniform(0, 1000))))
+    return readings
+
+def make_alerts(count, rng):
+    """アラートの辞書のリスト（check_alert と同じ形）"""
+    alerts = []
+    for i in range(count):
+        kind, names = rng.choice([("temperature", ("低温警報", "高温警報")),
+                                  ("humidity", ("低湿度警報", "高湿度警報"))])
+        alerts.append({
+            "sensor_id": f"MultiSensor{i % 100:02d}",
+            "type": kind,
+            "value": round(rng.uniform(10.0, 90.0), 2),
+            "alert": rng.choice(names),
+            "timestamp": datetime.now().isoformat()
+        })
+    return alerts
+
+def measure(func, items, repeat):
+    """items の全件に func を適用し、1件あたりの最短時間（ns）と結果を返す"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        results = [func(item) for item in items]
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(items), results
+
+# 測定値: (名前, エンコード, デコード)
+READING_FORMATS = [
+    ("text", lambda r: str(r[1]).encode(), lambda p: decode_reading(p)[0]),
+    ("json", lambda r: json.dumps({"value": r[1], "timestamp": time.time()}).encode(),
+     lambda p: json.loads(p)["value"]),
+    ("binary", lambda r: encode_reading(r[0], r[1]), lambda p: decode_reading(p)[0]),
+]
+
+# アラート: (名前, エンコード, デコード)
+ALERT_FORMATS = [
+    ("json", lambda a: encode_alert(a, "text").encode('utf-8'), decode_alert),
+    ("binary", lambda a: encode_alert(a, "binary"), decode_alert),
+]
+
+def run_formats(kind, formats, items, repeat):
+    results = []
+    for name, encode, decode in formats:
+        encode_ns, payloads = measure(encode, items, repeat)
+        decode_ns, _ = measure(decode, payloads, repeat)
+        size = sum(len(p) for p in payloads) / len(payloads)
+        results.append({
+            "kind": kind,
+            "format": name,
+            "encode_ns": round(encode_ns, 1),
+            "decode_ns": round(decode_ns, 1),
+            "bytes": round(size, 1),
+        })
+        print(f"  {kind:<8} {name:<7} | エンコード {encode_ns:8.0f} ns | デコード {decode_ns:8.0f} ns | "
+              f"{size:6.1f} バイト")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="ペイロード形式のベンチマーク")
+    parser.add_argument("--count", type=int, default=20000, help="1回の計測に使う件数")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数（最短時間を採用）")
+    parser.add_argument("--seed", type=int, default=1, help="乱数シード")
+    parser.add_argument("--output", help="結果の保存先（JSON）")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    readings = make_readings(args.count // 3 or 1, rng)
+    alerts = make_alerts(args.count, rng)
+
+    print("🧪 ペイロード形式のベンチマーク")
+    print(f"🔢 測定値 {len(readings)}件 / アラート {len(alerts)}件 × {args.repeat}回")
+    print("-" * 80)
+    results = run_formats("reading", READING_FORMATS, readings, args.repeat)
+    results += run_formats("alert", ALERT_FORMATS, alerts, args.repeat)
+    print("-" * 80)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "timestamp": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "count": args.count,
+                "repeat": args.repeat,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"💾 保存しました: {args.output}")
+
+if __name__ == "__main__":
+    main()
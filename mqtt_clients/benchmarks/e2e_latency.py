@@ -0,0 +1,292 @@
+"""
+エンドツーエンド・レイテンシベンチマーク
+
+機能:
+- N個のPublisherとM個のSubscriberを同一プロセス内で起動
+- Publisherは送信時刻（monotonic）とシーケンス番号をペイロードに埋め込む
+- Subscriberで Publisher → ブローカー → Subscriber の遅延を計測
+- QoS・ペイロードサイズごとに HDR風ヒストグラム、欠損、順序入れ替わり、重複を集計
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.histogram import LatencyHistogram, bucket_value
+from common.mini_broker import format_stats, start_broker_thread
+from common.probe import decode_probe, encode_probe
+
+BROKER = "localhost"
+PORT = 1883
+
+def parse_list(text):
+    """カンマ区切りの整数リスト"""
+    return [int(x) for x in text.split(',') if x]
+
+class BenchSubscriber:
+    """プローブを受信して遅延・欠損・順序を記録するSubscriber"""
+
+    def __init__(self, index, args, topic, qos):
+        self.index = index
+        self.topic = topic
+        self.qos = qos
+        self.hist = LatencyHistogram()
+        self.last_seq = {}      # stream -> 最後に受信した seq
+        self.seen = {}          # stream -> 受信済み seq の集合
+        self.reordered = 0
+        self.duplicates = 0
+        self.subscribed = threading.Event()
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1,
+                                  f"e2e-sub-{os.getpid()}-{index}")
+        self.client.on_connect = self.on_connect
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_message = self.on_message
+        self.client.connect(args.host, args.port, 60)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(self.topic, qos=self.qos)
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        self.subscribed.set()
+
+    def on_message(self, client, userdata, msg):
+        now = time.monotonic_ns()
+        probe = decode_probe(msg.payload)
+        if probe is None:
+            return
+        stream, seq, sent = probe
+        self.hist.record((now - sent) // 1000)
+
+        seen = self.seen.get(stream)
+        if seen is None:
+            seen = self.seen[stream] = set()
+        if seq in seen:
+            self.duplicates += 1
+            return
+        seen.add(seq)
+
+        last = self.last_seq.get(stream, -1)
+        if seq < last:
+            self.reordered += 1
+        else:
+            self.last_seq[stream] = seq
+
+    def unique(self):
+        return sum(len(s) for s in self.seen.values())
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def run_publisher(index, args, topic, qos, size, stats):
+    """一定レートでプローブを送信"""
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"e2e-pub-{os.getpid()}-{index}")
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    interval = 1.0 / args.rate
+    next_send = time.monotonic()
+    messages = []
+    errors = 0
+
+    for seq in range(args.count):
+        delay = next_send - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        next_send += interval
+
+        payload = encode_probe(index, seq, size, clock=time.monotonic_ns)
+        info = client.publish(topic, payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            errors += 1
+        elif qos > 0:
+            messages.append(info)
+
+    # QoS 1/2 はブローカーの確認応答まで待つ
+    for info in messages:
+        info.wait_for_publish(timeout=args.drain)
+
+    client.loop_stop()
+    client.disconnect()
+    stats[index] = errors
+
+def run_case(args, run_id, qos, size, broker=None):
+    """1条件（QoS・サイズ）のベンチマーク"""
+    topic = f"{args.topic_prefix}/{run_id}/qos{qos}/s{size}"
+    if broker is not None:
+        broker.reset_stats()
+
+    subscribers = [BenchSubscriber(i, args, topic, qos) for i in range(args.subscribers)]
+    for sub in subscribers:
+        if not sub.subscribed.wait(timeout=10):
+            print(f"⚠️  Subscriber {sub.index} の購読が完了しません")
+
+    stats = {}
+    threads = [
+        threading.Thread(target=run_publisher, args=(i, args, topic, qos, size, stats))
+        for i in range(args.publishers)
+    ]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    send_elapsed = time.monotonic() - start
+
+    # 配信しきるまで待つ（全件届くか、受信が止まったら終了）
+    expected_unique = args.publishers * args.count
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline:
+        if all(sub.unique() >= expected_unique for sub in subscribers):
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - start
+
+    broker_stats = broker.stats() if broker is not None else None
+    for sub in subscribers:
+        sub.close()
+
+    hist = LatencyHistogram()
+    for sub in subscribers:
+        hist.merge(sub.hist)
+
+    delivered = sum(sub.unique() for sub in subscribers)
+    expected = expected_unique * args.subscribers
+    p50, p90, p99, p999 = hist.percentiles([50, 90, 99, 99.9])
+
+    return {
+        "qos": qos,
+        "size": size,
+        "publishers": args.publishers,
+        "subscribers": args.subscribers,
+        "fan_out": args.subscribers,
+        "sent": expected_unique,
+        "publish_errors": sum(stats.values()),
+        "expected_deliveries": expected,
+        "delivered": delivered,
+        "lost": expected - delivered,
+        "loss_rate": (expected - delivered) / expected if expected else 0,
+        "reordered": sum(sub.reordered for sub in subscribers),
+        "duplicates": sum(sub.duplicates for sub in subscribers),
+        "send_elapsed_s": send_elapsed,
+        "delivery_rate_msg_s": delivered / elapsed if elapsed > 0 else 0,
+        "latency_us": {
+            "mean": hist.mean(),
+            "min": hist.min,
+            "p50": p50,
+            "p90": p90,
+            "p99": p99,
+            "p99.9": p999,
+            "max": hist.max,
+        },
+        "histogram": hist.to_dict(),
+        "broker": broker_stats,
+    }
+
+def print_histogram(hist_dict, width=40):
+    """ヒストグラムを対数スケールの棒グラフで表示"""
+    buckets = {int(b): n for b, n in hist_dict["buckets"].items()}
+    if not buckets:
+        return
+
+    # 2倍ごとの区間にまとめて表示
+    bins = {}
+    for bucket, n in buckets.items():
+        value = max(bucket_value(bucket), 1)
+        upper = 1 << value.bit_length()
+        bins[upper] = bins.get(upper, 0) + n
+
+    peak = max(bins.values())
+    total = sum(bins.values())
+    cumulative = 0
+    for upper in sorted(bins):
+        n = bins[upper]
+        cumulative += n
+        bar = "█" * max(1, int(n / peak * width))
+        print(f"  < {upper / 1000:9.3f}ms | {bar:{width}} | {n:8} ({cumulative / total:7.2%})")
+
+def print_result(r, show_histogram):
+    lat = r["latency_us"]
+    print(f"\nQoS {r['qos']} | {r['size']}B | Pub {r['publishers']} × Sub {r['subscribers']}"
+          f"（ファンアウト {r['fan_out']}）")
+    print(f"  配信: {r['delivered']}/{r['expected_deliveries']} | 欠損 {r['lost']} ({r['loss_rate']:.3%}) | "
+          f"順序入替 {r['reordered']} | 重複 {r['duplicates']} | 送信エラー {r['publish_errors']}")
+    print(f"  受信レート: {r['delivery_rate_msg_s']:.0f} msg/s")
+    if lat["p50"] is None:
+        print("  レイテンシ: データなし")
+        return
+    print(f"  レイテンシ: p50 {lat['p50'] / 1000:.3f}ms | p90 {lat['p90'] / 1000:.3f}ms | "
+          f"p99 {lat['p99'] / 1000:.3f}ms | p99.9 {lat['p99.9'] / 1000:.3f}ms | 最大 {lat['max'] / 1000:.3f}ms")
+    if r["broker"]:
+        print(f"  🧩 ブローカー: {format_stats(r['broker'])}")
+    if show_histogram:
+        print_histogram(r["histogram"])
+
+def main():
+    parser = argparse.ArgumentParser(description="エンドツーエンド・レイテンシベンチマーク")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--publishers", type=int, default=1, help="Publisher数 (N)")
+    parser.add_argument("--subscribers", type=int, default=1, help="Subscriber数 (M)")
+    parser.add_argument("--qos", type=parse_list, default=[0, 1, 2], help="QoSレベル (例: 0,1,2)")
+    parser.add_argument("--sizes", type=parse_list, default=[64], help="ペイロードサイズ (例: 64,1024)")
+    parser.add_argument("--rate", type=float, default=1000, help="Publisherごとの送信レート (msg/s)")
+    parser.add_argument("--count", type=int, default=2000, help="Publisherごとの送信数")
+    parser.add_argument("--drain", type=float, default=10.0, help="送信後に配信を待つ最大秒数")
+    parser.add_argument("--topic-prefix", default="bench/e2e", help="ベンチマーク用トピック")
+    parser.add_argument("--histogram", action="store_true", help="ヒストグラムを表示")
+    parser.add_argument("--output", help="結果の保存先 (.json)")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を起動して使う")
+    args = parser.parse_args()
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread()
+        args.host, args.port = broker.host, broker.port
+
+    print("⏱️  エンドツーエンド・レイテンシベンチマーク")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print(f"📤 Publisher {args.publishers} × {args.rate:g} msg/s × {args.count}件")
+    print(f"📥 Subscriber {args.subscribers}")
+    print("=" * 60)
+
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    results = []
+    for size in args.sizes:
+        for qos in args.qos:
+            result = run_case(args, run_id, qos, size, broker)
+            results.append(result)
+            print_result(result, args.histogram)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now().isoformat(),
+                    "broker": f"{args.host}:{args.port}",
+                    "embedded_broker": args.embedded_broker,
+                    "rate_per_publisher": args.rate,
+                    "count_per_publisher": args.count,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 結果を保存しました: {args.output}")
+
+    if broker is not None:
+        broker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+MQTTトラフィック記録ツール
+
+機能:
+- sensors/# と alerts/# のメッセージをすべて受信してバイナリ形式で記録（common/traffic_log.py）
+- トピック・ペイロード・QoS・Retain・受信時刻を保存
+- 記録したファイルは replay_traffic.py で同じ順序・同じ間隔のまま再送信できる
+- 記録時間・件数を指定して自動終了
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.traffic_log import TrafficWriter
+
+BROKER = "localhost"
+PORT = 1883
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTTトラフィック記録ツール")
+    parser.add_argument("output", help="記録ファイル（例: traffic.mqtl）")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--topics", default="sensors/#,alerts/#", help="記録するトピック（カンマ区切り）")
+    parser.add_argument("--duration", type=float, help="記録秒数（省略時は Ctrl+C まで）")
+    parser.add_argument("--count", type=int, help="記録件数（達したら終了）")
+    parser.add_argument("--skip-retained", action="store_true",
+                        help="購読直後に届く Retain メッセージを記録しない")
+    args = parser.parse_args()
+
+    topics = [t for t in args.topics.split(',') if t]
+    writer = TrafficWriter(args.output)
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print(f"✅ ブローカーに接続しました: {args.host}:{args.port}")
+            # 送信側の QoS をそのまま記録するため QoS 2 で購読
+            client.subscribe([(topic, 2) for topic in topics])
+            print(f"📡 記録中: {', '.join(topics)}")
+        else:
+            print(f"❌ 接続失敗: {rc}")
+
+    def on_message(client, userdata, msg):
+        if args.skip_retained and msg.retain:
+            return
+        with lock:
+            if done.is_set():
+                return
+            writer.write(msg.topic, msg.payload, msg.qos, msg.retain)
+            if args.count is not None and writer.count >= args.count:
+                done.set()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"TrafficRecorder-{os.getpid()}")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    print("🎬 MQTTトラフィック記録ツール")
+    print(f"💾 記録先: {args.output}")
+    print("Ctrl+C で停止")
+    print("-" * 60)
+
+    start = time.monotonic()
+    last_count = 0
+    try:
+        while not done.is_set():
+            if args.duration is not None and time.monotonic() - start >= args.duration:
+                break
+            done.wait(1.0)
+            with lock:
+                count, size = writer.count, writer.bytes
+            print(f"[{time.monotonic() - start:7.1f}s] {count:9d}件 "
+                  f"(+{count - last_count}) | {size / 1024:,.1f} KB")
+            last_count = count
+    except KeyboardInterrupt:
+        print("\n🛑 記録を停止します...")
+
+    client.loop_stop()
+    client.disconnect()
+    with lock:
+        done.set()
+        writer.close()
+
+    elapsed = time.monotonic() - start
+    print("-" * 60)
+    print(f"📊 記録 {writer.count}件 / {elapsed:.1f}秒 | トピック {len(writer.topics)}種類 | "
+          f"{writer.bytes / 1024:,.1f} KB")
+    print(f"✅ 保存しました: {args.output}")
+
+if __name__ == "__main__":
+    main()
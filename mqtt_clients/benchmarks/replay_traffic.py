@@ -0,0 +1,195 @@
+"""
+MQTTトラフィック再生ツール
+
+機能:
+- record_traffic.py で記録したファイルを同じ順序で再送信
+- 記録時の間隔のまま（--speed 1）、N倍速（--speed N）、最大速度（--speed 0）を選択
+- 複数の再生ストリームを並列に実行（ストリームごとに別の接続）
+- --rename でストリームごとにセンサーIDを変え、N倍の台数として再生
+- ストリームごとの送信レートと予定時刻からの遅れを表示
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.codec import decode_alert, encode_alert, is_binary
+from common.histogram import LatencyHistogram
+from common.mini_broker import format_stats, start_broker_thread
+from common.traffic_log import read_traffic
+
+BROKER = "localhost"
+PORT = 1883
+
+def rename_topic(topic, stream):
+    """sensors/<ID>/... の ID にストリーム番号を付ける（ストリーム0はそのまま）"""
+    if stream == 0:
+        return topic
+    parts = topic.split('/')
+    if len(parts) >= 3 and parts[0] == "sensors":
+        parts[1] = f"{parts[1]}-r{stream}"
+    return '/'.join(parts)
+
+def rename_payload(topic, payload, stream):
+    """alerts/# に含まれる sensor_id にもストリーム番号を付ける（テキスト / バイナリは元の形式のまま）"""
+    if stream == 0 or not topic.startswith("alerts/"):
+        return payload
+    try:
+        data = decode_alert(payload)
+        data["sensor_id"] = f"{data['sensor_id']}-r{stream}"
+        if is_binary(payload):
+            return encode_alert(data, "binary")
+        return encode_alert(data, "text").encode('utf-8')
+    except (ValueError, KeyError, TypeError):
+        return payload
+
+class ReplayStream:
+    """1本の再生ストリーム（1接続）"""
+
+    def __init__(self, index, args, messages):
+        self.index = index
+        self.args = args
+        self.sent = 0
+        self.completed = 0              # on_publish まで届いた件数（QoS 1/2 は確認応答）
+        self.errors = 0
+        self.acked = threading.Condition()
+        self.lag = LatencyHistogram()   # 予定時刻からの遅れ（µs、速度指定時のみ）
+        self.elapsed = 0.0
+
+        # トピックとペイロードの書き換えは再生前に済ませておく（時刻は最初のメッセージを0とする）
+        first_us = messages[0][0]
+        self.messages = []
+        for t_us, topic, payload, qos, retain in messages:
+            t_us -= first_us
+            if args.rename:
+                payload = rename_payload(topic, payload, index)
+                topic = rename_topic(topic, index)
+            if args.qos is not None:
+                qos = args.qos
+            self.messages.append((t_us, topic, payload, qos, retain and not args.no_retain))
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"TrafficReplay-{os.getpid()}-{index}")
+        self.client.max_inflight_messages_set(args.max_inflight)
+        self.client.on_publish = self.on_publish
+        self.client.connect(args.host, args.port, 60)
+        self.client.loop_start()
+
+    def on_publish(self, client, userdata, mid):
+        with self.acked:
+            self.completed += 1
+            self.acked.notify_all()
+
+    def run(self, barrier):
+        args = self.args
+        publish = self.client.publish
+        barrier.wait()
+        start_ns = time.monotonic_ns()
+
+        for loop in range(args.loop):
+            offset_us = loop * (self.messages[-1][0] + 1)
+            for t_us, topic, payload, qos, retain in self.messages:
+                if args.speed > 0:
+                    due_ns = start_ns + int((t_us + offset_us) * 1000 / args.speed)
+                    wait_ns = due_ns - time.monotonic_ns()
+                    # 1ms未満の待ちは sleep せずに送る（sleep の精度が粗いため）
+                    if wait_ns > 1_000_000:
+                        time.sleep(wait_ns / 1e9)
+                    self.lag.record(max(0, time.monotonic_ns() - due_ns) // 1000)
+                result = publish(topic, payload, qos, retain)
+                if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                    self.errors += 1
+                else:
+                    self.sent += 1
+
+        # 送信した全件の on_publish（QoS 1/2 は確認応答）まで待つ
+        with self.acked:
+            self.acked.wait_for(lambda: self.completed >= self.sent, timeout=args.drain)
+        self.elapsed = (time.monotonic_ns() - start_ns) / 1e9
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTTトラフィック再生ツール")
+    parser.add_argument("input", help="record_traffic.py の記録ファイル")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="再生速度（1: 記録時の間隔、N: N倍速、0: 最大速度）")
+    parser.add_argument("--streams", type=int, default=1, help="並列に再生するストリーム数")
+    parser.add_argument("--rename", action="store_true",
+                        help="ストリームごとにセンサーIDを変える（<ID>-r1, <ID>-r2, ...）")
+    parser.add_argument("--loop", type=int, default=1, help="繰り返し回数")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], help="QoSを上書き（省略時は記録時のQoS）")
+    parser.add_argument("--no-retain", action="store_true", help="Retain フラグを外して送信")
+    parser.add_argument("--max-inflight", type=int, default=100, help="QoS 1/2 の同時送信数の上限")
+    parser.add_argument("--drain", type=float, default=10.0, help="送信後に完了を待つ最大秒数")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を起動して使う")
+    args = parser.parse_args()
+
+    start_ns, messages = read_traffic(args.input)
+    if not messages:
+        print(f"❌ メッセージが記録されていません: {args.input}")
+        sys.exit(1)
+    span = (messages[-1][0] - messages[0][0]) / 1e6
+    topics = len({m[1] for m in messages})
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread()
+        args.host, args.port = broker.host, broker.port
+
+    print("▶️  MQTTトラフィック再生ツール")
+    print(f"📂 {args.input}: {len(messages)}件 / {span:.1f}秒 | トピック {topics}種類 | "
+          f"記録開始 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_ns / 1e9))}")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    speed = "最大速度" if args.speed <= 0 else f"{args.speed:g}倍速"
+    print(f"⚙️  {speed} | ストリーム {args.streams}本 | 繰り返し {args.loop}回")
+    print("-" * 80)
+
+    streams = [ReplayStream(i, args, messages) for i in range(args.streams)]
+    barrier = threading.Barrier(len(streams))
+    threads = [threading.Thread(target=s.run, args=(barrier,), daemon=True) for s in streams]
+
+    start = time.monotonic()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        print("\n🛑 再生を中断します...")
+    elapsed = time.monotonic() - start
+
+    for stream in streams:
+        rate = stream.completed / stream.elapsed if stream.elapsed > 0 else 0
+        line = (f"  ストリーム{stream.index}: 送信 {stream.sent}件 | 完了 {stream.completed}件 | "
+                f"{rate:9.0f} msg/s | エラー {stream.errors}")
+        if stream.lag.count:
+            p50, p99 = stream.lag.percentiles([50, 99])
+            line += (f" | 遅れ p50 {p50 / 1000:.2f}ms p99 {p99 / 1000:.2f}ms "
+                     f"最大 {stream.lag.max / 1000:.2f}ms")
+        print(line)
+        stream.close()
+
+    sent = sum(s.sent for s in streams)
+    completed = sum(s.completed for s in streams)
+    print("-" * 80)
+    print(f"📊 合計 {completed}件 / {elapsed:.1f}秒（平均 {completed / elapsed:.0f} msg/s）")
+    if completed < sent:
+        print(f"⚠️  {sent - completed}件は --drain {args.drain:g}秒以内に完了しませんでした")
+    if broker is not None:
+        broker.wait_for_clients()
+        print(f"🧩 ブローカー: {format_stats(broker.stats())}")
+        broker.stop()
+    print("✅ 再生完了")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+MQTTクライアント共通モジュール
+
+step4 / step5 の各サンプルから共有して使う部品をまとめたパッケージです。
+各スクリプトは自身の位置から mqtt_clients ディレクトリを sys.path に追加して
+`from common.xxx import ...` の形で利用します。
+"""
@@ -0,0 +1,184 @@
+"""
+高頻度センサー向けのまとめ送り（マイクロバッチ）
+
+機能:
+- サンプルをセンサー・種別ごとに溜め、件数か待ち時間の上限で1件の系列メッセージとして送信
+- 系列は sensors/<ID>/<種別>/series に common/codec.py の系列形式で送る
+- バッチ化の倍率（サンプル数 / メッセージ数）と、溜めたことによる追加遅延を集計
+- 受信側は unbatch() で元の測定時刻つきの1サンプルずつに戻す
+
+100Hz のセンサーを1サンプル1メッセージで送ると、センサー1台で毎秒100件の
+PUBLISH になります。max_samples=100, max_delay=0.1 なら毎秒10件程度に減り、
+遅延は最大でも約0.1秒です。
+"""
+
+import threading
+import time
+
+from common.codec import SERIES_MAX_SAMPLES, SERIES_MAX_SPAN_US, decode_series, encode_series
+from common.histogram import LatencyHistogram
+
+MAX_SPAN = SERIES_MAX_SPAN_US / 2_000_000   # 最初のサンプルから前後この秒数までを1つの系列に入れる
+INT32_MAX = 2 ** 31 - 1
+
+def series_topic(sensor_id, kind):
+    """系列のトピック"""
+    return f"sensors/{sensor_id}/{kind}/series"
+
+def unbatch(topic, payload):
+    """系列メッセージから (センサーID, 種別, 測定時刻, 値) を1サンプルずつ返す"""
+    parts = topic.split('/')
+    if len(parts) != 4 or parts[0] != "sensors" or parts[3] != "series":
+        return
+    sensor_id, kind = parts[1], parts[2]
+    for timestamp, value in decode_series(payload):
+        yield sensor_id, kind, timestamp, value
+
+class BatchingPublisher:
+    """mqtt.Client.publish をまとめ送りにするラッパー
+
+    add() でサンプルを溜め、max_samples 件に達したらその場で送信します。
+    待ち時間の上限（max_delay 秒）は poll() を定期的に呼ぶか、start() で
+    バックグラウンドのスレッドに任せます。close() で残りをすべて送ります。
+    スレッドはいちばん早く溜め始めたバッファの期限まで待つので、追加遅延は max_delay を
+    スレッドの起床の遅れ以上には超えません。
+    """
+
+    def __init__(self, client, max_samples=100, max_delay=0.1, qos=0, fmt="binary", digits=2):
+        if not 1 <= max_samples <= SERIES_MAX_SAMPLES:
+            raise ValueError(f"max_samples は 1〜{SERIES_MAX_SAMPLES} にしてください: {max_samples}")
+        self.client = client
+        self.max_samples = max_samples
+        self.max_delay = max_delay
+        self.qos = qos
+        self.fmt = fmt
+        self.digits = digits
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)   # 新しいバッファができた / 停止
+        self.buffers = {}       # (センサーID, 種別) -> [(測定時刻, 値), ...]
+        self.first_added = {}   # (センサーID, 種別) -> 最初のサンプルを溜めた時刻（monotonic、溜め始めた順）
+        self.thread = None
+        self.stopping = threading.Event()
+
+        self.samples = 0
+        self.messages = 0
+        self.bytes = 0
+        self.errors = 0
+        self.reasons = {"size": 0, "delay": 0, "close": 0}
+        self.latency = LatencyHistogram()   # 測定時刻から送信までの追加遅延（µs）
+
+    def add(self, sensor_id, kind, value, timestamp=None):
+        """サンプルを1件溜める（上限に達したら送信）
+
+        系列の形式に入らない値は溜めずに ValueError にします。
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.fmt == "binary" and abs(round(value * 10 ** self.digits)) > INT32_MAX:
+            raise ValueError(f"{sensor_id}/{kind}: 系列に入らない値です: {value}")
+        key = (sensor_id, kind)
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is not None and abs(timestamp - buffer[0][0]) > MAX_SPAN:
+                # 系列に入る時間幅を超えるので、溜めた分を先に送る
+                self._flush(key, "size")
+                buffer = None
+            if buffer is None:
+                buffer = self.buffers[key] = []
+                self.first_added[key] = time.monotonic()
+                self.changed.notify()
+            buffer.append((timestamp, value))
+            if len(buffer) >= self.max_samples:
+                self._flush(key, "size")
+
+    def poll(self):
+        """待ち時間の上限を過ぎたバッファを送信"""
+        with self.lock:
+            self._poll()
+
+    def _poll(self):
+        deadline = time.monotonic() - self.max_delay
+        for key in [k for k, t in self.first_added.items() if t <= deadline]:
+            self._flush(key, "delay")
+
+    def flush(self, reason="close"):
+        """溜めているサンプルをすべて送信"""
+        with self.lock:
+            for key in list(self.buffers):
+                self._flush(key, reason)
+
+    def _flush(self, key, reason):
+        # 送れる形にしてからバッファを外す（失敗してもサンプルは残る）
+        samples = self.buffers[key]
+        payload = encode_series(samples, self.fmt, self.digits)
+        del self.buffers[key]
+        del self.first_added[key]
+        result = self.client.publish(series_topic(*key), payload, self.qos)
+        if result.rc != 0:
+            self.errors += 1
+            return
+        now = time.time()
+        for timestamp, _ in samples:
+            self.latency.record(max(0, int((now - timestamp) * 1_000_000)))
+        self.samples += len(samples)
+        self.messages += 1
+        self.bytes += len(payload)
+        self.reasons[reason] += 1
+
+    def start(self):
+        """待ち時間の上限を監視するスレッドを開始"""
+
+        def run():
+            with self.changed:
+                while not self.stopping.is_set():
+                    timeout = None
+                    if self.first_added:
+                        # 溜め始めた順なので、先頭がいちばん早い期限
+                        timeout = next(iter(self.first_added.values())) + self.max_delay - time.monotonic()
+                        if timeout <= 0:
+                            self._poll()
+                            continue
+                    self.changed.wait(timeout)
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """監視スレッドを止め、残りのサンプルを送信"""
+        with self.changed:
+            self.stopping.set()
+            self.changed.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush("close")
+
+    @property
+    def batching_factor(self):
+        """1メッセージあたりのサンプル数"""
+        return self.samples / self.messages if self.messages else 0.0
+
+    def stats(self):
+        """集計結果の辞書"""
+        with self.lock:
+            p50, p99 = self.latency.percentiles([50, 99]) if self.latency.count else (0, 0)
+            return {
+                "samples": self.samples,
+                "messages": self.messages,
+                "bytes": self.bytes,
+                "errors": self.errors,
+                "batching_factor": round(self.batching_factor, 1),
+                "reasons": dict(self.reasons),
+                "latency_p50_ms": p50 / 1000,
+                "latency_p99_ms": p99 / 1000,
+                "latency_max_ms": self.latency.max / 1000 if self.latency.count else 0,
+                "pending": sum(len(b) for b in self.buffers.values()),
+            }
+
+def format_stats(stats):
+    """stats() の1行表示"""
+    reasons = stats["reasons"]
+    return (f"サンプル {stats['samples']}件 → メッセージ {stats['messages']}件 "
+            f"(×{stats['batching_factor']:.1f}) | 追加遅延 p50 {stats['latency_p50_ms']:.1f}ms "
+            f"p99 {stats['latency_p99_ms']:.1f}ms 最大 {stats['latency_max_ms']:.1f}ms | "
+            f"送信理由 件数{reasons['size']} 時間{reasons['delay']} 終了{reasons['close']}")
@@ -0,0 +1,301 @@
+"""
+センサーデータ・アラートのペイロード形式（テキスト / バイナリ）
+
+機能:
+- 従来のテキスト形式（数値の文字列・JSON のアラート）と、固定長のバイナリ形式を相互に変換
+- 受信側はどちらの形式でも同じ関数で読める（先頭1バイトで判別）
+- バイナリ形式は先頭にバージョンを持ち、将来レイアウトを変えても判別できる
+- 1サンプルの全種別（または複数サンプル）をまとめたバッチ（sensors/<ID>/batch）
+- 高頻度センサーの1種別の連続サンプルをまとめた系列（sensors/<ID>/<種別>/series）
+
+バイナリ形式（ビッグエンディアン）:
+    先頭1バイト  上位4ビット: バージョン（1）、下位4ビット: 種類（1: 測定値, 2: アラート, 3: バッチ, 4: 系列）
+    測定値   14バイト  先頭, センサー種別(uint8), 値×100(int32), 測定時刻ms(int64)
+    アラート 15バイト + センサーID(UTF-8)
+                       先頭, センサー種別(uint8), 警報(int8: -1 低 / 1 高), 値×100(int32), 発生時刻ms(int64)
+    バッチ   4バイト + サンプル数 × (8 + 4 × 種別数)バイト
+                       先頭, 含む種別(uint8: bit0 温度, bit1 湿度, bit2 照度), サンプル数(uint16)
+                       サンプルごとに 測定時刻ms(int64), 種別ごとの 値×100(int32)
+    系列     12バイト + サンプル数 × 8バイト
+                       先頭, 小数桁数(uint8), サンプル数(uint16), 最初の測定時刻µs(int64)
+                       サンプルごとに 最初からの経過µs(uint32), 値×10^桁数(int32)
+
+バッチ・系列のテキスト形式は JSON です:
+    {"samples": [{"timestamp": 1700000000.0, "temperature": 25.3, "humidity": 50.1, "light": 500}]}
+    {"samples": [[1700000000.0, 0.0123], [1700000000.01, 0.0131]]}
+
+テキストの先頭は数字・符号・'{' なので、0x20 未満の先頭バイトをバイナリとみなします。
+値は 1/100 単位の整数で持つため、小数2桁までの値（publisher が丸めた値）はそのまま復元されます。
+"""
+
+import json
+import struct
+import time
+from datetime import datetime
+
+VERSION = 1
+TYPE_READING = 1
+TYPE_ALERT = 2
+TYPE_BATCH = 3
+TYPE_SERIES = 4
+
+FORMATS = ("text", "binary")
+
+# センサー種別とコード
+KINDS = ("temperature", "humidity", "light")
+KIND_CODES = {kind: i + 1 for i, kind in enumerate(KINDS)}
+
+# 警報名（multi_sensor_publisher.py の check_alert と同じ）
+ALERT_NAMES = {
+    ("temperature", 1): "高温警報",
+    ("temperature", -1): "低温警報",
+    ("humidity", 1): "高湿度警報",
+    ("humidity", -1): "低湿度警報",
+}
+ALERT_LEVELS = {name: level for (_, level), name in ALERT_NAMES.items()}
+
+READING = struct.Struct("!BBiq")
+ALERT = struct.Struct("!BBbiq")
+BATCH = struct.Struct("!BBH")
+SERIES = struct.Struct("!BBHq")
+SERIES_SAMPLE = struct.Struct("!Ii")
+SERIES_MAX_SAMPLES = 0xFFFF         # 系列のサンプル数（uint16）
+SERIES_MAX_SPAN_US = 0xFFFFFFFF     # 系列の最初からの経過µs（uint32、約71分）
+
+READING_HEADER = (VERSION << 4) | TYPE_READING
+ALERT_HEADER = (VERSION << 4) | TYPE_ALERT
+BATCH_HEADER = (VERSION << 4) | TYPE_BATCH
+SERIES_HEADER = (VERSION << 4) | TYPE_SERIES
+
+# バッチのサンプル部分（含む種別ごとに作って使い回す）
+_sample_structs = {}
+
+def _mismatch(payload, header):
+    """先頭バイトが想定と違う理由"""
+    version, msg_type = payload[0] >> 4, payload[0] & 0x0F
+    if version != VERSION:
+        return ValueError(f"未対応のバージョンです: {version}")
+    if msg_type != header & 0x0F:
+        return ValueError(f"ペイロードの種類が違います: {msg_type}")
+    return ValueError(f"ペイロードの長さが不正です: {len(payload)}バイト")
+
+def is_binary(payload):
+    """バイナリ形式のペイロードか"""
+    return len(payload) > 0 and payload[0] < 0x20
+
+def encode_reading(kind, value, fmt="binary", timestamp=None):
+    """測定値をペイロードに変換（text は従来どおり数値の文字列）"""
+    if fmt == "text":
+        return str(value)
+    if timestamp is None:
+        timestamp = time.time()
+    return READING.pack(READING_HEADER, KIND_CODES[kind], round(value * 100), int(timestamp * 1000))
+
+def decode_reading(payload):
+    """測定値のペイロードから (値, 測定時刻) を返す（テキスト形式の測定時刻は None）"""
+    if not payload or payload[0] >= 0x20:
+        return float(payload), None
+    if payload[0] != READING_HEADER or len(payload) != READING.size:
+        raise _mismatch(payload, READING_HEADER)
+    _, _, centi, ms = READING.unpack(payload)
+    return centi / 100, ms / 1000
+
+def decode_value(payload):
+    """測定値のペイロードから値だけを返す"""
+    return decode_reading(payload)[0]
+
+def _sample_struct(mask):
+    """含む種別（ビットマスク）に対応するサンプルの struct と種別のリスト"""
+    entry = _sample_structs.get(mask)
+    if entry is None:
+        kinds = [kind for i, kind in enumerate(KINDS) if mask & (1 << i)]
+        entry = _sample_structs[mask] = (struct.Struct("!q" + "i" * len(kinds)), kinds)
+    return entry
+
+def encode_batch(samples, fmt="binary"):
+    """サンプル（timestamp と種別ごとの値を持つ辞書）のリストをバッチのペイロードに変換
+
+    バイナリ形式では、最初のサンプルに含まれる種別を全サンプル共通の種別とします。
+    """
+    if fmt == "text":
+        return json.dumps({"samples": samples})
+    kinds = [kind for kind in KINDS if kind in samples[0]]
+    mask = sum(1 << (KIND_CODES[kind] - 1) for kind in kinds)
+    sample, _ = _sample_struct(mask)
+    parts = [BATCH.pack(BATCH_HEADER, mask, len(samples))]
+    for s in samples:
+        parts.append(sample.pack(int(s["timestamp"] * 1000), *[round(s[kind] * 100) for kind in kinds]))
+    return b"".join(parts)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _load_samples(payload):
+    """テキスト形式（JSON）のバッチ・系列から samples のリストを取り出す"""
+    data = json.loads(payload)
+    if not isinstance(data, dict) or not isinstance(data.get("samples"), list):
+        raise ValueError("samples のリストがありません")
+    return data["samples"]
+
+def decode_batch(payload):
+    """バッチのペイロードをサンプルの辞書のリストに変換（テキスト形式と同じ形）"""
+    if not payload or payload[0] >= 0x20:
+        samples = _load_samples(payload)
+        for s in samples:
+            if not isinstance(s, dict):
+                raise ValueError(f"サンプルが辞書ではありません: {s!r}")
+            for key, value in s.items():
+                if key != "timestamp" and key not in KIND_CODES:
+                    raise ValueError(f"不明なセンサー種別です: {key!r}")
+                if not _is_number(value):
+                    raise ValueError(f"{key} が数値ではありません: {value!r}")
+        return samples
+    if payload[0] != BATCH_HEADER or len(payload) < BATCH.size:
+        raise _mismatch(payload, BATCH_HEADER)
+    _, mask, count = BATCH.unpack_from(payload)
+    sample, kinds = _sample_struct(mask)
+    if len(payload) != BATCH.size + count * sample.size:
+        raise _mismatch(payload, BATCH_HEADER)
+    samples = []
+    for fields in sample.iter_unpack(payload[BATCH.size:]):
+        s = {"timestamp": fields[0] / 1000}
+        for kind, centi in zip(kinds, fields[1:]):
+            s[kind] = centi / 100
+        samples.append(s)
+    return samples
+
+def encode_series(samples, fmt="binary", digits=2):
+    """1種別の (測定時刻, 値) のリストを系列のペイロードに変換（digits は残す小数桁数）
+
+    最初の測定時刻は系列の中でいちばん早い時刻にするので、時計が戻って順序が
+    入れ替わったサンプルも送れます。形式に入らない件数・時間幅・値は ValueError です。
+    """
+    if fmt == "text":
+        return json.dumps({"samples": [[t, round(v, digits)] for t, v in samples]})
+    if len(samples) > SERIES_MAX_SAMPLES:
+        raise ValueError(f"系列のサンプル数が多すぎます: {len(samples)}")
+    times = [int(t * 1_000_000) for t, _ in samples]
+    base_us = min(times)
+    if max(times) - base_us > SERIES_MAX_SPAN_US:
+        raise ValueError(f"系列の時間幅が長すぎます: {(max(times) - base_us) / 1_000_000:.0f}秒")
+    scale = 10 ** digits
+    pack = SERIES_SAMPLE.pack
+    try:
+        parts = [SERIES.pack(SERIES_HEADER, digits, len(samples), base_us)]
+        for t_us, (_, v) in zip(times, samples):
+            parts.append(pack(t_us - base_us, round(v * scale)))
+    except struct.error as e:
+        raise ValueError(f"系列に入らない値です: {e}") from e
+    return b"".join(parts)
+
+def decode_series(payload):
+    """系列のペイロードを (測定時刻, 値) のリストに変換"""
+    if not payload or payload[0] >= 0x20:
+        samples = []
+        for s in _load_samples(payload):
+            if not isinstance(s, list) or len(s) != 2 or not all(_is_number(x) for x in s):
+                raise ValueError(f"サンプルが [測定時刻, 値] ではありません: {s!r}")
+            samples.append((s[0], s[1]))
+        return samples
+    if payload[0] != SERIES_HEADER or len(payload) < SERIES.size:
+        raise _mismatch(payload, SERIES_HEADER)
+    _, digits, count, base_us = SERIES.unpack_from(payload)
+    if len(payload) != SERIES.size + count * SERIES_SAMPLE.size:
+        raise _mismatch(payload, SERIES_HEADER)
+    scale = 10 ** digits
+    return [((base_us + offset) / 1_000_000, value / scale)
+            for offset, value in SERIES_SAMPLE.iter_unpack(payload[SERIES.size:])]
+
+def is_reading_topic(topic):
+    """測定値のトピック（sensors/<ID>/<種別>、sensors/<ID>/batch、sensors/<ID>/<種別>/series）か"""
+    parts = topic.split('/')
+    if len(parts) == 4:
+        return parts[0] == "sensors" and parts[3] == "series"
+    return len(parts) == 3 and parts[0] == "sensors" and (parts[2] in KIND_CODES or parts[2] == "batch")
+
+def iter_samples(topic, payload):
+    """測定値のトピックから (センサーID, 測定時刻, {種別: 値}) を返す
+
+    種別ごとのトピックでは辞書は1種別だけ、テキスト形式の測定時刻は None です。
+    系列（sensors/<ID>/<種別>/series）は元の測定時刻ごとに1件ずつ返します。
+    """
+    parts = topic.split('/')
+    if len(parts) == 4 and parts[0] == "sensors" and parts[3] == "series":
+        for timestamp, value in decode_series(payload):
+            yield parts[1], timestamp, {parts[2]: value}
+        return
+    if len(parts) != 3 or parts[0] != "sensors":
+        return
+    if parts[2] == "batch":
+        for s in decode_batch(payload):
+            timestamp = s.pop("timestamp", None)
+            yield parts[1], timestamp, s
+    elif parts[2] in KIND_CODES:
+        value, timestamp = decode_reading(payload)
+        yield parts[1], timestamp, {parts[2]: value}
+
+def iter_readings(topic, payload):
+    """sensors/# のメッセージから (センサーID, 種別, 値, 測定時刻) を1件ずつ返す"""
+    for sensor_id, timestamp, values in iter_samples(topic, payload):
+        for kind, value in values.items():
+            yield sensor_id, kind, value, timestamp
+
+class SampleReader:
+    """種別ごとのトピックとバッチの両方を受信する購読者向け
+
+    移行期間中の publisher（--format both）は同じ値を両方の形式で送ります。
+    バッチを一度でも受信したセンサーは、種別ごとのトピックを無視して二重に数えないようにします。
+    """
+
+    def __init__(self):
+        self.batched = set()
+
+    def samples(self, topic, payload):
+        """(センサーID, 測定時刻, {種別: 値}) のリスト"""
+        samples = list(iter_samples(topic, payload))
+        if samples and not self.accept(topic, samples[0][0]):
+            return []
+        return samples
+
+    def accept(self, topic, sensor_id):
+        """デコード済みのサンプルを使うか（別のスレッドやプロセスでデコードした場合）"""
+        if topic.endswith("/batch"):
+            self.batched.add(sensor_id)
+            return True
+        return sensor_id not in self.batched or topic.endswith("/series")
+
+    def readings(self, topic, payload):
+        """(センサーID, 種別, 値, 測定時刻) のリスト"""
+        return [(sensor_id, kind, value, timestamp)
+                for sensor_id, timestamp, values in self.samples(topic, payload)
+                for kind, value in values.items()]
+
+def encode_alert(alert_data, fmt="binary"):
+    """アラート（sensor_id, type, value, alert, timestamp の辞書）をペイロードに変換"""
+    if fmt == "text":
+        return json.dumps(alert_data, ensure_ascii=False)
+    timestamp = datetime.fromisoformat(alert_data["timestamp"]).timestamp()
+    sensor_id = alert_data["sensor_id"].encode('utf-8')
+    return ALERT.pack(ALERT_HEADER, KIND_CODES[alert_data["type"]],
+                      ALERT_LEVELS[alert_data["alert"]], round(alert_data["value"] * 100),
+                      int(timestamp * 1000)) + sensor_id
+
+def decode_alert(payload):
+    """アラートのペイロードを辞書に変換（テキスト形式と同じキー）"""
+    if not payload or payload[0] >= 0x20:
+        return json.loads(payload)
+    if payload[0] != ALERT_HEADER or len(payload) < ALERT.size:
+        raise _mismatch(payload, ALERT_HEADER)
+    _, kind_code, level, centi, ms = ALERT.unpack_from(payload)
+    if not 1 <= kind_code <= len(KINDS):
+        raise ValueError(f"不明なセンサー種別です: {kind_code}")
+    kind = KINDS[kind_code - 1]
+    if (kind, level) not in ALERT_NAMES:
+        raise ValueError(f"不明な警報です: {kind} {level}")
+    return {
+        "sensor_id": payload[ALERT.size:].decode('utf-8'),
+        "type": kind,
+        "value": centi / 100,
+        "alert": ALERT_NAMES[(kind, level)],
+        "timestamp": datetime.fromtimestamp(ms / 1000).isoformat()
+    }
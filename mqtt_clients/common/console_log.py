@@ -0,0 +1,169 @@
+"""
+非同期コンソール出力
+
+機能:
+- 出力行をキューに積み、バックグラウンドスレッドでまとめて書き出す
+- 文字列の組み立て（format）も書き出しスレッド側で行う
+- 出力モードを選択可能
+    quiet   : 重要なメッセージ（アラート・エラー）のみ
+    sample  : キーごとに一定間隔で1行だけ表示
+    summary : キーごとに1秒に1行の集計を表示
+    verbose : すべて表示（従来どおり）
+
+paho のネットワークスレッドでは print せずにキューへ渡すだけなので、
+標準出力が遅くてもメッセージ受信が止まりません。
+"""
+
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+MODES = ("quiet", "sample", "summary", "verbose")
+
+class ConsoleLog:
+    """バックグラウンドで書き出すコンソールロガー"""
+
+    def __init__(self, mode="verbose", sample_interval=1.0, summary_interval=1.0,
+                 stream=None, max_queue=10000):
+        if mode not in MODES:
+            raise ValueError(f"不明な出力モード: {mode}")
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.summary_interval = summary_interval
+        self.stream = stream or sys.stdout
+        self.queue = queue.Queue(maxsize=max_queue)
+
+        self.last_emit = {}     # key -> 最後に表示した時刻（sample）
+        self.aggregates = {}    # key -> [件数, 合計, 最小, 最大, 最新, 単位]（summary）
+        self.lock = threading.Lock()
+        self.suppressed = 0
+        self.dropped = 0
+
+        self._running = False
+        self._thread = None
+
+    # ---- 出力（どのスレッドからでも呼べる） ----
+
+    def info(self, key, template, *args, value=None, unit=""):
+        """通常のメッセージ（モードに応じて間引き・集計）"""
+        mode = self.mode
+
+        if mode == "verbose":
+            self._put(template, args)
+
+        elif mode == "sample":
+            now = time.monotonic()
+            if now - self.last_emit.get(key, 0.0) >= self.sample_interval:
+                self.last_emit[key] = now
+                self._put(template, args)
+            else:
+                self.suppressed += 1
+
+        elif mode == "summary":
+            with self.lock:
+                agg = self.aggregates.get(key)
+                if agg is None:
+                    self.aggregates[key] = [1, value or 0.0, value, value, value, unit]
+                else:
+                    agg[0] += 1
+                    if value is not None:
+                        agg[1] += value
+                        agg[2] = value if agg[2] is None else min(agg[2], value)
+                        agg[3] = value if agg[3] is None else max(agg[3], value)
+                        agg[4] = value
+
+        else:
+            self.suppressed += 1
+
+    def important(self, template, *args):
+        """重要なメッセージ（すべてのモードで表示）"""
+        self._put(template, args)
+
+    def _put(self, template, args):
+        try:
+            self.queue.put_nowait((template, args))
+        except queue.Full:
+            self.dropped += 1
+
+    # ---- 書き出しスレッド ----
+
+    def start(self):
+        """書き出しスレッドを開始"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """残りを書き出してスレッドを停止"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+        self._write(self._drain() + self._summary_lines())
+
+    def _drain(self):
+        lines = []
+        while True:
+            try:
+                template, args = self.queue.get_nowait()
+            except queue.Empty:
+                return lines
+            lines.append(template.format(*args) if args else template)
+
+    def _summary_lines(self):
+        with self.lock:
+            aggregates, self.aggregates = self.aggregates, {}
+        if not aggregates:
+            return []
+
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        lines = []
+        for key in sorted(aggregates):
+            count, total, min_val, max_val, last, unit = aggregates[key]
+            if last is None:
+                lines.append(f"[{timestamp}] {key}: {count}件")
+            else:
+                lines.append(
+                    f"[{timestamp}] {key}: {count}件 | 最新 {last}{unit} | "
+                    f"平均 {total / count:.2f}{unit} | 範囲 {min_val}〜{max_val}{unit}"
+                )
+        return lines
+
+    def _write(self, lines):
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _run(self):
+        next_summary = time.monotonic() + self.summary_interval
+        while self._running:
+            try:
+                template, args = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                lines = []
+            else:
+                lines = [template.format(*args) if args else template]
+                lines.extend(self._drain())
+
+            if self.mode == "summary" and time.monotonic() >= next_summary:
+                next_summary += self.summary_interval
+                lines.extend(self._summary_lines())
+
+            self._write(lines)
+
+def add_log_arguments(parser):
+    """argparse に出力モードのオプションを追加"""
+    parser.add_argument(
+        "--log-mode", choices=MODES, default="verbose",
+        help="コンソール出力モード (既定: verbose)"
+    )
+    parser.add_argument(
+        "--sample-interval", type=float, default=1.0,
+        help="sample モードでキーごとに表示する間隔（秒）"
+    )
+
+def from_args(args):
+    """argparse の結果から ConsoleLog を作成して開始"""
+    return ConsoleLog(mode=args.log_mode, sample_interval=args.sample_interval).start()
@@ -0,0 +1,147 @@
+"""
+長時間の履歴を描画するための間引き（デシメーション）
+
+機能:
+- 測定時刻と値をリングバッファ（NumPy 配列）で長時間保持する SeriesStore
+- LTTB（Largest-Triangle-Three-Buckets）で形を保ったまま指定点数に間引く
+- 画素列ごとの最小値・最大値（min-max）で、山や谷を落とさずに間引く
+- 描画する点数はグラフの幅（画素数）で決まるので、保持件数が増えても描画時間は変わらない
+
+ダッシュボードは1秒ごとに全件を set_data していたため、50〜100点に制限していました。
+保持は数万〜数十万件、描画は幅の画素数程度、と分けることで1時間・1日分を表示できます。
+"""
+
+import threading
+import time
+
+import numpy as np
+
+METHODS = ("lttb", "minmax", "none")
+
+def lttb(x, y, n_out):
+    """LTTB で n_out 点に間引く（最初と最後の点は必ず残す）"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # 最初と最後を除いた点を n_out - 2 個のバケットに等分
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    # 各バケットの平均はまとめて計算しておく（最後のバケットの次は最後の点）
+    sizes = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / sizes, y[-1])
+    out = np.empty(n_out, dtype=np.intp)
+    out[0] = 0
+    out[-1] = n - 1
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        # 前に選んだ点・次のバケットの平均と作る三角形の面積が最大の点を選ぶ
+        ax, ay = x[selected], y[selected]
+        area = np.abs((ax - next_x) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y - ay))
+        selected = start + int(area.argmax())
+        out[i + 1] = selected
+    return x[out], y[out]
+
+def minmax(x, y, columns):
+    """x の範囲を columns 列に等分し、列ごとに最小値と最大値の点を残す（最大 2 × columns 点）"""
+    n = len(x)
+    if n <= 2 * columns or columns < 1:
+        return x, y
+
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], columns + 1)[1:-1])
+    bounds = np.concatenate(([0], edges, [n]))
+    indices = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+        segment = y[start:end]
+        low = start + int(segment.argmin())
+        high = start + int(segment.argmax())
+        # 元の順序のまま並べる（線が列の中で往復しないように）
+        if low < high:
+            indices.extend((low, high))
+        elif high < low:
+            indices.extend((high, low))
+        else:
+            indices.append(low)
+    indices = np.asarray(indices, dtype=np.intp)
+    return x[indices], y[indices]
+
+def decimate(x, y, n_out, method="lttb"):
+    """method で n_out 点程度に間引く（minmax は n_out / 2 列）"""
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return minmax(x, y, max(n_out // 2, 1))
+    return x, y
+
+class SeriesStore:
+    """(測定時刻, 値) のリングバッファ
+
+    MQTT の受信スレッドから append() し、描画側から decimated() / stats() を呼びます。
+    容量を超えると古いものから上書きします。
+    """
+
+    def __init__(self, capacity=86400):
+        self.capacity = capacity
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.count = 0     # 保持している件数
+        self.next = 0      # 次に書き込む位置
+        self.total = 0     # これまでに追加した件数
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value, timestamp=None):
+        """1件追加（timestamp を省略すると現在時刻）"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            self.times[self.next] = timestamp
+            self.values[self.next] = value
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.total += 1
+
+    def arrays(self):
+        """古い順に並べた (測定時刻, 値) の配列のコピー"""
+        with self.lock:
+            if self.count < self.capacity:
+                return self.times[:self.count].copy(), self.values[:self.count].copy()
+            order = np.r_[self.next:self.capacity, 0:self.next]
+            return self.times[order], self.values[order]
+
+    def latest(self):
+        """最新の値（空なら None）"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            return float(self.values[self.next - 1])
+
+    def stats(self):
+        """保持している全件の (最新, 平均, 最小, 最大)"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            values = self.values[:self.count]
+            return (float(self.values[self.next - 1]), float(values.mean()),
+                    float(values.min()), float(values.max()))
+
+    def decimated(self, n_out, method="lttb"):
+        """描画用に n_out 点程度に間引いた (測定時刻, 値)
+
+        測定時刻が前後して届くこと（複数センサー・バッチ）があるため、時刻順に並べ替えてから間引きます。
+        """
+        x, y = self.arrays()
+        if len(x) > 1 and np.any(x[1:] < x[:-1]):
+            order = np.argsort(x, kind="stable")
+            x, y = x[order], y[order]
+        return decimate(x, y, n_out, method)
+
+def axes_width(ax):
+    """グラフ（Axes）の幅の画素数"""
+    return max(int(ax.get_window_extent().width), 1)
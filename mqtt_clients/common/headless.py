@@ -0,0 +1,214 @@
+"""
+ダッシュボードのヘッドレス描画（画面のないサーバー向け）
+
+機能:
+- Agg バックエンドで、plt.show() を使わずに一定間隔でグラフを描画
+- PNG（最新の1枚を上書き、または連番）・GIF・MP4 に出力
+- 描画は1フレーム1回（fig.canvas.draw()）で、その画素をそのまま各形式に書き出す
+- Figure と線（Line2D）・タイトルは作り直さず、毎フレーム update_plot で値だけ更新
+- 1フレームの更新・描画・書き出しの時間を集計して表示
+
+出力先の拡張子で形式を選びます。
+    snapshot.png          毎フレーム同じファイルを上書き（Web サーバーなどから最新の1枚を配信する用途）
+    frames/{frame:05d}.png  連番で保存
+    dashboard.gif         終了時に GIF アニメーションとして保存（フレームはメモリに保持するので --frames が必要）
+    dashboard.mp4         ffmpeg にフレームを渡して MP4 に書き出し（ffmpeg が必要）
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+from common.histogram import LatencyHistogram
+
+FORMATS = (".png", ".gif", ".mp4")
+GIF_MAX_FRAMES = 600    # 1200×600 で約0.7MB/フレーム、600フレームで約430MB
+
+def add_headless_arguments(parser):
+    """ヘッドレス描画のオプションを追加"""
+    parser.add_argument("--headless", metavar="OUTPUT",
+                        help="画面を使わずに描画して保存（.png / {frame:05d}.png / .gif / .mp4）")
+    parser.add_argument("--interval", type=float, default=1.0, help="描画間隔（秒）")
+    parser.add_argument("--frames", type=int,
+                        help=f"描画するフレーム数（省略時は Ctrl+C まで。.gif では必須、{GIF_MAX_FRAMES}まで）")
+    parser.add_argument("--fps", type=float,
+                        help="GIF / MP4 の再生フレームレート（省略時は 1 / --interval、大きくすると早送り）")
+
+def use_agg():
+    """画面のない環境でも動く Agg バックエンドに切り替える（Figure を作る前に呼ぶ）"""
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+
+class PngSink:
+    """PNG に保存（パスに {frame} があれば連番、なければ最新の1枚を上書き）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.numbered = "{frame" in path
+
+    def write(self, image, frame):
+        if self.numbered:
+            image.save(self.path.format(frame=frame))
+        else:
+            # 書きかけのファイルを読まれないように、別名で保存してから置き換える
+            tmp = self.path + ".tmp"
+            image.save(tmp, format="PNG")
+            os.replace(tmp, self.path)
+
+    def close(self):
+        pass
+
+class GifSink:
+    """GIF アニメーションとして保存（終了時にまとめて書き出す）
+
+    全フレームをメモリに保持するので、フレーム数を決めて使います（check_frames()）。
+    """
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.duration_ms = int(1000 / fps)
+        self.images = []
+
+    def write(self, image, frame):
+        # GIF は256色なので、ここで減色しておく（保持するメモリも1/4になる）
+        self.images.append(image.convert("RGB").quantize(256))
+
+    def close(self):
+        if self.images:
+            self.images[0].save(self.path, save_all=True, append_images=self.images[1:],
+                                duration=self.duration_ms, loop=0)
+
+class Mp4Sink:
+    """ffmpeg の標準入力に RGBA の画素を渡して MP4 に書き出す"""
+
+    def __init__(self, path, fps, size):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg が見つかりません。MP4 の出力には ffmpeg が必要です（.gif / .png は不要）")
+        width, height = size
+        self.proc = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-y",
+             "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", f"{fps:g}", "-i", "-",
+             # yuv420p は縦横が偶数である必要がある
+             "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", "-vcodec", "libx264", path],
+            stdin=subprocess.PIPE)
+
+    def write(self, image, frame):
+        self.proc.stdin.write(image.tobytes())
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+def check_frames(path, frames):
+    """出力形式とフレーム数の組み合わせを確認（問題があれば理由の文字列、なければ None）"""
+    if os.path.splitext(path)[1].lower() != ".gif":
+        return None
+    if frames is None:
+        return ("GIF は全フレームをメモリに保持するので --frames を指定してください"
+                "（長時間の記録は .mp4 か連番の .png を使ってください）")
+    if frames > GIF_MAX_FRAMES:
+        return (f"GIF は {GIF_MAX_FRAMES}フレームまでです（--frames {frames}）。"
+                "長時間の記録は .mp4 か連番の .png を使ってください")
+    return None
+
+def open_sink(path, fps, size):
+    """出力先の拡張子に応じた書き出し先"""
+    ext = os.path.splitext(path)[1].lower()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if ext == ".png":
+        return PngSink(path)
+    if ext == ".gif":
+        return GifSink(path, fps)
+    if ext == ".mp4":
+        return Mp4Sink(path, fps, size)
+    raise ValueError(f"未対応の出力形式です: {path}（{' / '.join(FORMATS)}）")
+
+class HeadlessRenderer:
+    """update_plot を一定間隔で呼び、描画した画像を書き出す"""
+
+    def __init__(self, fig, update, output, interval=1.0, fps=None, init=None):
+        from PIL import Image
+        self.Image = Image
+        self.fig = fig
+        self.update = update
+        self.output = output
+        self.interval = interval
+        self.fps = fps or 1.0 / interval
+        if init is not None:
+            init()
+        # 最初に1回描画して大きさを決める（MP4 は途中で大きさを変えられない）
+        fig.canvas.draw()
+        self.size = fig.canvas.get_width_height()
+        self.sink = open_sink(output, self.fps, self.size)
+
+        self.frames = 0
+        self.late = 0                          # 描画が間に合わずに予定より遅れたフレーム数
+        self.update_time = LatencyHistogram()  # update_plot の時間（µs）
+        self.draw_time = LatencyHistogram()    # fig.canvas.draw() の時間（µs）
+        self.write_time = LatencyHistogram()   # 書き出しの時間（µs）
+
+    def render(self):
+        """1フレームを描画して書き出す"""
+        t0 = time.perf_counter_ns()
+        self.update(self.frames)
+        t1 = time.perf_counter_ns()
+        self.fig.canvas.draw()
+        image = self.Image.frombuffer("RGBA", self.size, self.fig.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        t2 = time.perf_counter_ns()
+        self.sink.write(image, self.frames)
+        t3 = time.perf_counter_ns()
+
+        self.update_time.record((t1 - t0) // 1000)
+        self.draw_time.record((t2 - t1) // 1000)
+        self.write_time.record((t3 - t2) // 1000)
+        self.frames += 1
+
+    def run(self, frames=None, report_every=10):
+        """frames 枚（None なら Ctrl+C まで）描画する"""
+        start = time.monotonic()
+        try:
+            while frames is None or self.frames < frames:
+                due = start + self.frames * self.interval
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -self.interval:
+                    self.late += 1
+                self.render()
+                if report_every and self.frames % report_every == 0:
+                    print(f"🖼️  {self.frames}フレーム | {self.format_stats()}")
+        except KeyboardInterrupt:
+            print("\n🛑 描画を停止します...")
+        finally:
+            self.sink.close()
+
+    def format_stats(self):
+        """1フレームあたりの時間の1行表示"""
+        parts = []
+        for name, hist in (("更新", self.update_time), ("描画", self.draw_time), ("書き出し", self.write_time)):
+            if hist.count:
+                p50, p99 = hist.percentiles([50, 99])
+                parts.append(f"{name} p50 {p50 / 1000:.1f}ms p99 {p99 / 1000:.1f}ms")
+        return " | ".join(parts) + f" | 遅れ {self.late}回"
+
+def run_headless(fig, update, init, args):
+    """add_headless_arguments() のオプションでヘッドレス描画を実行"""
+    problem = check_frames(args.headless, args.frames)
+    if problem:
+        print(f"❌ {problem}")
+        return None
+    try:
+        renderer = HeadlessRenderer(fig, update, args.headless, args.interval, args.fps, init)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        return None
+    width, height = renderer.size
+    print(f"🖼️  ヘッドレス描画: {args.headless}（{width}×{height}、{args.interval:g}秒ごと）")
+    renderer.run(args.frames)
+    print(f"📊 {renderer.frames}フレーム | {renderer.format_stats()}")
+    print(f"💾 保存しました: {args.headless}")
+    return renderer
@@ -0,0 +1,118 @@
+"""
+レイテンシヒストグラム（HDR風）
+
+機能:
+- 対数線形バケットで値を記録（記録は O(1)、相対誤差は約1%）
+- p50 / p95 / p99 などのパーセンタイルを計算
+- 複数ヒストグラムの合算
+
+値は整数（マイクロ秒など）で記録します。すべての値を保存しないので、
+数百万件を記録してもメモリは数百バケット分で済みます。
+"""
+
+SUB_BITS = 7
+SUB_MASK = (1 << SUB_BITS) - 1
+
+def bucket_of(value):
+    """値が入るバケット番号"""
+    if value < (1 << SUB_BITS):
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return (shift << SUB_BITS) + (value >> shift)
+
+def bucket_value(bucket):
+    """バケットの代表値（中央値）"""
+    shift = bucket >> SUB_BITS
+    mantissa = bucket & SUB_MASK
+    if shift == 0:
+        return mantissa
+    return (mantissa << shift) + (1 << (shift - 1))
+
+class LatencyHistogram:
+    """対数線形バケットのヒストグラム"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """記録をすべて消去"""
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """値を1件記録"""
+        value = int(value)
+        if value < 0:
+            value = 0
+        bucket = bucket_of(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """別のヒストグラムを合算"""
+        for bucket, n in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def mean(self):
+        """平均値"""
+        return self.total / self.count if self.count else None
+
+    def percentiles(self, ps):
+        """パーセンタイル（0〜100）のリストに対応する値を返す"""
+        if self.count == 0:
+            return [None for _ in ps]
+
+        targets = sorted((p, i) for i, p in enumerate(ps))
+        results = [None] * len(ps)
+        seen = 0
+        t = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            while t < len(targets) and seen >= targets[t][0] / 100.0 * self.count:
+                value = bucket_value(bucket)
+                results[targets[t][1]] = min(max(value, self.min), self.max)
+                t += 1
+            if t == len(targets):
+                break
+        while t < len(targets):
+            results[targets[t][1]] = self.max
+            t += 1
+        return results
+
+    def percentile(self, p):
+        """パーセンタイル（0〜100）"""
+        return self.percentiles([p])[0]
+
+    def summary(self, ps=(50, 95, 99)):
+        """件数・平均・最小・最大・パーセンタイルの辞書"""
+        values = self.percentiles(ps)
+        result = {
+            "count": self.count,
+            "mean": self.mean(),
+            "min": self.min,
+            "max": self.max,
+        }
+        for p, v in zip(ps, values):
+            result[f"p{p:g}"] = v
+        return result
+
+    def to_dict(self):
+        """保存用の辞書（バケット番号 -> 件数）"""
+        return {
+            "sub_bits": SUB_BITS,
+            "buckets": {str(b): n for b, n in sorted(self.buckets.items())},
+            **self.summary(),
+        }
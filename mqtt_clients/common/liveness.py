@@ -0,0 +1,235 @@
+"""
+死活監視（ライブネス）トラッカー
+
+機能:
+- 通常のデータ受信から各センサーの最終受信時刻を記録
+- センサーごとの想定送信間隔を超えた沈黙を検知
+- 階層型タイマーホイールで期限を管理（1メッセージ・1tickあたり O(1)）
+
+Retainのステータスや Last Will はTCP切断時にしか発火しないため、
+接続を保ったままハングしたセンサーはこのトラッカーで検出します。
+"""
+
+import json
+import threading
+import time
+
+class TimerWheel:
+    """階層型タイマーホイール
+
+    tick 単位の期限をレベルごとのスロットに振り分けて保持する。
+    レベル0は1tick刻み、レベル1は slots tick刻み…と粒度が粗くなり、
+    上位レベルのスロットは境界に到達したときに下位レベルへ再配置される。
+    """
+
+    def __init__(self, tick=0.1, slots=64, levels=4, start=0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = int(start / tick)
+        self.spans = [slots ** level for level in range(levels)]
+        # wheels[level][slot] = {key: 期限tick}
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        # key -> (level, slot)  取り消しをO(1)で行うための索引
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def _place(self, key, deadline):
+        """期限tickに応じたレベルとスロットへ登録"""
+        for level, span in enumerate(self.spans):
+            if deadline // span - self.current // span < self.slots:
+                slot = (deadline // span) % self.slots
+                self.wheels[level][slot][key] = deadline
+                self.index[key] = (level, slot)
+                return
+
+        # 最上位レベルにも収まらない遠い期限は末尾スロットに置き、
+        # 再配置のたびに本来の期限で置き直す
+        level = self.levels - 1
+        span = self.spans[level]
+        slot = (self.current // span + self.slots - 1) % self.slots
+        self.wheels[level][slot][key] = deadline
+        self.index[key] = (level, slot)
+
+    def schedule(self, key, when):
+        """key の期限を時刻 when（秒）に設定（既存の期限は置き換え）"""
+        self.cancel(key)
+        deadline = max(int(when / self.tick), self.current + 1)
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        """key の期限を取り消し"""
+        position = self.index.pop(key, None)
+        if position is not None:
+            level, slot = position
+            del self.wheels[level][slot][key]
+
+    def _cascade(self, level):
+        """上位レベルの現在スロットを下位レベルへ再配置"""
+        slot = (self.current // self.spans[level]) % self.slots
+        entries = self.wheels[level][slot]
+        if not entries:
+            return
+        self.wheels[level][slot] = {}
+        for key, deadline in entries.items():
+            del self.index[key]
+            if deadline <= self.current:
+                deadline = self.current
+            self._place(key, deadline)
+
+    def advance(self, now):
+        """時刻 now（秒）まで進め、期限切れになった key のリストを返す"""
+        target = int(now / self.tick)
+        expired = []
+
+        while self.current < target:
+            self.current += 1
+
+            # 境界に到達した上位レベルから順に下ろす
+            for level in range(self.levels - 1, 0, -1):
+                if self.current % self.spans[level] == 0:
+                    self._cascade(level)
+
+            slot = self.current % self.slots
+            entries = self.wheels[0][slot]
+            if entries:
+                self.wheels[0][slot] = {}
+                for key in entries:
+                    del self.index[key]
+                expired.extend(entries)
+
+        return expired
+
+class LivenessTracker:
+    """センサーの死活監視
+
+    touch() は最終受信時刻を書き換えるだけでタイマーを動かさない（遅延再設定）。
+    タイマーが満了した時点で最終受信時刻を確認し、まだ猶予があれば
+    残り時間で再登録するため、メッセージごとのコストは一定になる。
+    """
+
+    def __init__(self, default_interval=5.0, misses=3, tick=0.1,
+                 on_timeout=None, on_recover=None, clock=time.monotonic):
+        self.default_interval = default_interval
+        self.misses = misses
+        self.on_timeout = on_timeout
+        self.on_recover = on_recover
+        self.clock = clock
+        self.wheel = TimerWheel(tick=tick, start=clock())
+        self.intervals = {}
+        self.last_seen = {}
+        self.stale = set()
+        self.lock = threading.Lock()
+        self._thread = None
+        self._running = False
+
+    def set_interval(self, sensor_id, interval):
+        """センサーの想定送信間隔（秒）を設定"""
+        with self.lock:
+            self.intervals[sensor_id] = interval
+
+    def timeout_of(self, sensor_id):
+        """沈黙とみなすまでの秒数"""
+        return self.intervals.get(sensor_id, self.default_interval) * self.misses
+
+    def touch(self, sensor_id, now=None):
+        """データ受信を記録"""
+        if now is None:
+            now = self.clock()
+
+        recovered = False
+        with self.lock:
+            first_seen = sensor_id not in self.last_seen
+            self.last_seen[sensor_id] = now
+
+            if sensor_id in self.stale:
+                self.stale.discard(sensor_id)
+                recovered = True
+
+            if first_seen or recovered:
+                self.wheel.schedule(sensor_id, now + self.timeout_of(sensor_id))
+
+        if recovered and self.on_recover:
+            self.on_recover(sensor_id)
+
+    def forget(self, sensor_id):
+        """監視対象から外す（正常なOFFLINE通知を受けたときなど）"""
+        with self.lock:
+            self.wheel.cancel(sensor_id)
+            self.last_seen.pop(sensor_id, None)
+            self.stale.discard(sensor_id)
+
+    def poll(self, now=None):
+        """期限を確認し、新たに沈黙したセンサーIDのリストを返す"""
+        if now is None:
+            now = self.clock()
+
+        timed_out = []
+        with self.lock:
+            for sensor_id in self.wheel.advance(now):
+                deadline = self.last_seen[sensor_id] + self.timeout_of(sensor_id)
+                if deadline > now:
+                    # 期限内に受信があったので残り時間で再登録
+                    self.wheel.schedule(sensor_id, deadline)
+                else:
+                    self.stale.add(sensor_id)
+                    timed_out.append((sensor_id, now - self.last_seen[sensor_id]))
+
+        if self.on_timeout:
+            for sensor_id, silence in timed_out:
+                self.on_timeout(sensor_id, silence)
+
+        return [sensor_id for sensor_id, _ in timed_out]
+
+    def is_alive(self, sensor_id):
+        """センサーが沈黙していなければ True"""
+        return sensor_id in self.last_seen and sensor_id not in self.stale
+
+    def silence(self, sensor_id, now=None):
+        """最終受信からの経過秒数"""
+        if sensor_id not in self.last_seen:
+            return None
+        if now is None:
+            now = self.clock()
+        return now - self.last_seen[sensor_id]
+
+    def start(self):
+        """バックグラウンドで定期的に poll() を呼ぶスレッドを開始"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """バックグラウンドスレッドを停止"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _run(self):
+        while self._running:
+            time.sleep(self.wheel.tick)
+            self.poll()
+
+def load_intervals(config_path):
+    """config.json の sensors[].interval を {トピック第2階層: 秒} で返す
+
+    同じデバイスに複数センサーがある場合は最短の間隔を採用する。
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        cfg = json.load(f)
+
+    intervals = {}
+    for sensor in cfg.get('sensors', []):
+        if 'interval' not in sensor:
+            continue
+        parts = sensor['topic'].split('/')
+        device = parts[1] if len(parts) >= 2 else sensor['id']
+        interval = float(sensor['interval'])
+        intervals[device] = min(interval, intervals.get(device, interval))
+
+    return intervals
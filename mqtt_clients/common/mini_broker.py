@@ -0,0 +1,667 @@
+"""
+プロセス内で動かせる軽量MQTTブローカー（MQTT 3.1.1）
+
+機能:
+- asyncio で動く MQTT 3.1.1 ブローカー（Mosquitto コンテナなしで試験・計測ができる）
+- QoS 0/1/2、Retain、Last Will、ワイルドカード購読（+ / #）
+- clean_session=False のセッション保持（購読と QoS 1/2 の未配信メッセージ）
+- ブローカー自身の処理時間・転送数などのカウンター（クライアント側のコストと切り分け用）
+
+使い方:
+    # 別スレッドで起動（port=0 で空いているポートを自動選択）
+    broker = start_broker_thread(port=0)
+    client.connect("127.0.0.1", broker.port)
+    ...
+    print(broker.stats())
+    broker.stop()
+
+    # 単体のブローカーとして起動
+    python mini_broker.py --port 1883
+
+制限:
+- 認証（ユーザー名・パスワード）は受け付けるだけで検証しない
+- 確認応答待ちメッセージの再送は再接続時のみ（TCP 上での時間切れ再送はしない）
+- QoS 0 は購読者の送信バッファが上限を超えたら破棄する（カウンター dropped）
+"""
+
+import argparse
+import asyncio
+import itertools
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    from .histogram import LatencyHistogram
+except ImportError:
+    from histogram import LatencyHistogram
+
+# パケット種別
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PACKET_NAMES = {
+    CONNECT: "CONNECT", PUBLISH: "PUBLISH", PUBACK: "PUBACK", PUBREC: "PUBREC",
+    PUBREL: "PUBREL", PUBCOMP: "PUBCOMP", SUBSCRIBE: "SUBSCRIBE",
+    UNSUBSCRIBE: "UNSUBSCRIBE", PINGREQ: "PINGREQ", DISCONNECT: "DISCONNECT",
+}
+
+PINGRESP_PACKET = b"\xd0\x00"
+UINT16 = struct.Struct("!H")
+
+class ProtocolError(Exception):
+    """不正なパケット"""
+
+def encode_length(n):
+    """残りの長さ（可変長整数）"""
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def read_str(body, pos):
+    (length,) = UINT16.unpack_from(body, pos)
+    end = pos + 2 + length
+    if end > len(body):
+        raise ProtocolError("文字列の長さが不正です")
+    return body[pos + 2:end], end
+
+def ack_packet(ptype, packet_id, flags=0):
+    return bytes(((ptype << 4) | flags, 2)) + UINT16.pack(packet_id)
+
+def publish_packet(topic_bytes, payload, qos, retain=False, packet_id=None, dup=False):
+    """PUBLISH パケットを組み立てる"""
+    first = (PUBLISH << 4) | (qos << 1) | (1 if retain else 0) | (8 if dup else 0)
+    body_len = 2 + len(topic_bytes) + len(payload) + (2 if qos else 0)
+    head = bytes((first,)) + encode_length(body_len) + UINT16.pack(len(topic_bytes)) + topic_bytes
+    if qos:
+        head += UINT16.pack(packet_id)
+    return head + payload
+
+def topic_matches(topic_filter, topic):
+    """トピックフィルター（+ / # を含む）がトピックに一致するか"""
+    if topic.startswith('$') and topic_filter[:1] in ('+', '#'):
+        return False
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+def valid_filter(topic_filter):
+    if not topic_filter:
+        return False
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if '#' in level and (level != '#' or i != len(levels) - 1):
+            return False
+        if '+' in level and level != '+':
+            return False
+    return True
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children = {}
+        self.subscribers = {}   # Session -> QoS
+
+class SubscriptionTree:
+    """トピック階層ごとの木で購読を管理（ワイルドカードも木の枝として持つ）"""
+
+    def __init__(self):
+        self.root = _Node()
+        self.count = 0
+
+    def add(self, topic_filter, session, qos):
+        node = self.root
+        for level in topic_filter.split('/'):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if session not in node.subscribers:
+            self.count += 1
+        node.subscribers[session] = qos
+
+    def remove(self, topic_filter, session):
+        path = [self.root]
+        for level in topic_filter.split('/'):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        if path[-1].subscribers.pop(session, None) is not None:
+            self.count -= 1
+
+        # 空になった枝を削除
+        levels = topic_filter.split('/')
+        for i in range(len(levels), 0, -1):
+            node = path[i]
+            if node.subscribers or node.children:
+                break
+            del path[i - 1].children[levels[i - 1]]
+
+    def match(self, topic):
+        """トピックに一致する購読 {Session: 最大QoS}"""
+        result = {}
+        self._match(self.root, topic.split('/'), 0, result, topic.startswith('$'))
+        return result
+
+    def _match(self, node, levels, i, result, system):
+        if i == len(levels):
+            self._merge(result, node.subscribers)
+            hash_node = node.children.get('#')
+            if hash_node:
+                self._merge(result, hash_node.subscribers)
+            return
+
+        # $ で始まるトピックは先頭のワイルドカードに一致させない
+        if not (system and i == 0):
+            hash_node = node.children.get('#')
+            if hash_node:
+                self._merge(result, hash_node.subscribers)
+            plus = node.children.get('+')
+            if plus:
+                self._match(plus, levels, i + 1, result, system)
+
+        child = node.children.get(levels[i])
+        if child:
+            self._match(child, levels, i + 1, result, system)
+
+    @staticmethod
+    def _merge(result, subscribers):
+        for session, qos in subscribers.items():
+            if result.get(session, -1) < qos:
+                result[session] = qos
+
+class Session:
+    """クライアントのセッション（接続が切れても clean_session=False なら残る）"""
+
+    def __init__(self, client_id, clean):
+        self.client_id = client_id
+        self.clean = clean
+        self.writer = None
+        self.subscriptions = {}     # トピックフィルター -> QoS
+        self.inflight = {}          # パケットID -> 再送用パケット（送信側 QoS 1/2）
+        self.incoming = set()       # 受信側 QoS 2 で PUBREL 待ちのパケットID
+        self.pending = deque()      # 切断中に届いた QoS 1/2 のメッセージ
+        self._ids = itertools.cycle(range(1, 65536))
+
+    def next_packet_id(self):
+        for _ in range(65535):
+            packet_id = next(self._ids)
+            if packet_id not in self.inflight:
+                return packet_id
+        raise ProtocolError("パケットIDが不足しています")
+
+class MiniBroker:
+    """asyncio の MQTT 3.1.1 ブローカー"""
+
+    def __init__(self, host="127.0.0.1", port=1883, max_buffer=4 * 1024 * 1024, max_pending=10000):
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer        # 購読者ごとの送信バッファ上限（QoS 0 の破棄判定）
+        self.max_pending = max_pending      # 切断中セッションに貯める最大件数
+        self.sessions = {}
+        self.tree = SubscriptionTree()
+        self.retained = {}                  # トピック -> (ペイロード, QoS)
+        self.server = None
+        self.reset_stats()
+
+    # ---- 起動・停止 ----
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for session in list(self.sessions.values()):
+            if session.writer is not None:
+                session.writer.close()
+        try:
+            await asyncio.wait_for(self.server.wait_closed(), timeout=2)
+        except asyncio.TimeoutError:
+            pass
+        self.server = None
+
+    # ---- カウンター ----
+
+    def reset_stats(self):
+        """カウンターをリセット"""
+        self.counters = {
+            "connects": 0,
+            "disconnects": 0,
+            "wills": 0,
+            "publish_in": 0,
+            "publish_out": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "dropped": 0,
+            "packets": {name: 0 for name in PACKET_NAMES.values()},
+        }
+        self.busy_ns = 0                        # パケット処理に使った時間の合計
+        self.route_hist = LatencyHistogram()    # PUBLISH 1件の振り分け時間（マイクロ秒）
+        self.stats_since = time.monotonic()
+
+    def stats(self):
+        """カウンターのスナップショット"""
+        elapsed = time.monotonic() - self.stats_since
+        busy = self.busy_ns / 1e9
+        return {
+            "clients": sum(1 for s in self.sessions.values() if s.writer is not None),
+            "sessions": len(self.sessions),
+            "subscriptions": self.tree.count,
+            "retained": len(self.retained),
+            **self.counters,
+            "packets": dict(self.counters["packets"]),
+            "elapsed_s": elapsed,
+            "busy_s": busy,
+            "busy_ratio": busy / elapsed if elapsed > 0 else 0,
+            "route_us": self.route_hist.summary((50, 99, 99.9)),
+        }
+
+    # ---- 接続ごとの処理 ----
+
+    async def _read_packet(self, reader):
+        first = (await reader.readexactly(1))[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+            if shift > 21:
+                raise ProtocolError("残りの長さが不正です")
+        body = await reader.readexactly(length) if length else b""
+        self.counters["bytes_in"] += length + 2
+        return first >> 4, first & 0x0F, body
+
+    async def _handle(self, reader, writer):
+        session = None
+        will = None
+        try:
+            ptype, _, body = await asyncio.wait_for(self._read_packet(reader), timeout=10)
+            if ptype != CONNECT:
+                return
+            session, will, keepalive = self._on_connect(body, writer)
+            if session is None:
+                return
+            timeout = keepalive * 1.5 if keepalive else None
+
+            while True:
+                ptype, flags, body = await asyncio.wait_for(self._read_packet(reader), timeout)
+                start = time.perf_counter_ns()
+                if ptype == DISCONNECT:
+                    self.counters["packets"]["DISCONNECT"] += 1
+                    will = None
+                    break
+                self._dispatch(session, ptype, flags, body)
+                self.busy_ns += time.perf_counter_ns() - start
+
+                # 自分宛ての送信が溜まっていたら読み込みを止めて待つ
+                if writer.transport.get_write_buffer_size() > self.max_buffer:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError,
+                ProtocolError, struct.error, UnicodeDecodeError, IndexError):
+            pass
+        finally:
+            if session is not None:
+                self._on_close(session, writer, will)
+            writer.close()
+
+    def _on_connect(self, body, writer):
+        self.counters["packets"]["CONNECT"] += 1
+        name, pos = read_str(body, 0)
+        flags = body[pos + 1]
+        (keepalive,) = UINT16.unpack_from(body, pos + 2)
+        client_id, pos = read_str(body, pos + 4)
+        client_id = client_id.decode('utf-8')
+        clean = bool(flags & 0x02)
+
+        will = None
+        if flags & 0x04:
+            will_topic, pos = read_str(body, pos)
+            will_payload, pos = read_str(body, pos)
+            will = (will_topic.decode('utf-8'), will_payload, (flags >> 3) & 0x03, bool(flags & 0x20))
+
+        if name not in (b"MQTT", b"MQIsdp"):
+            writer.write(b"\x20\x02\x00\x01")   # プロトコルバージョン不一致
+            return None, None, 0
+        if not client_id:
+            if not clean:
+                writer.write(b"\x20\x02\x00\x02")   # クライアントID拒否
+                return None, None, 0
+            client_id = f"auto-{id(writer):x}"
+
+        # 同じクライアントIDの古い接続を切断
+        old = self.sessions.get(client_id)
+        if old is not None and old.writer is not None:
+            old.writer.close()
+            old.writer = None
+
+        if old is None or clean or old.clean:
+            if old is not None:
+                self._drop_session(old)
+            session = Session(client_id, clean)
+            present = False
+        else:
+            session = old
+            present = True
+
+        session.writer = writer
+        self.sessions[client_id] = session
+        self.counters["connects"] += 1
+        self._write(session, bytes((0x20, 2, 1 if present else 0, 0)))
+
+        if present:
+            # 確認応答待ちを再送し、切断中に届いたメッセージを配信
+            for packet in session.inflight.values():
+                if packet[0] >> 4 == PUBLISH:
+                    packet = bytes((packet[0] | 0x08,)) + packet[1:]
+                self._write(session, packet)
+            while session.pending:
+                self._deliver(session, *session.pending.popleft())
+        return session, will, keepalive
+
+    def _on_close(self, session, writer, will):
+        self.counters["disconnects"] += 1
+        if will is not None:
+            self.counters["wills"] += 1
+            topic, payload, qos, retain = will
+            self._route(topic, payload, qos, retain)
+        if session.writer is not writer:
+            return  # 新しい接続に引き継がれた
+        session.writer = None
+        if session.clean:
+            self._drop_session(session)
+
+    def _drop_session(self, session):
+        for topic_filter in session.subscriptions:
+            self.tree.remove(topic_filter, session)
+        session.subscriptions.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    def _write(self, session, packet):
+        self.counters["bytes_out"] += len(packet)
+        session.writer.write(packet)
+
+    def _dispatch(self, session, ptype, flags, body):
+        name = PACKET_NAMES.get(ptype)
+        if name is None:
+            raise ProtocolError(f"不明なパケット種別: {ptype}")
+        self.counters["packets"][name] += 1
+
+        if ptype == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic, pos = read_str(body, 0)
+            topic = topic.decode('utf-8')
+            if qos == 3 or not topic or '+' in topic or '#' in topic:
+                raise ProtocolError("PUBLISH が不正です")
+            packet_id = None
+            if qos:
+                (packet_id,) = UINT16.unpack_from(body, pos)
+                pos += 2
+            payload = body[pos:]
+            self.counters["publish_in"] += 1
+
+            if qos == 2:
+                # PUBREL までの重複は配信しない
+                if packet_id not in session.incoming:
+                    session.incoming.add(packet_id)
+                    self._route(topic, payload, qos, bool(flags & 0x01))
+                self._write(session, ack_packet(PUBREC, packet_id))
+            else:
+                self._route(topic, payload, qos, bool(flags & 0x01))
+                if qos == 1:
+                    self._write(session, ack_packet(PUBACK, packet_id))
+
+        elif ptype == PUBACK or ptype == PUBCOMP:
+            (packet_id,) = UINT16.unpack_from(body, 0)
+            session.inflight.pop(packet_id, None)
+
+        elif ptype == PUBREC:
+            (packet_id,) = UINT16.unpack_from(body, 0)
+            pubrel = ack_packet(PUBREL, packet_id, flags=0x02)
+            session.inflight[packet_id] = pubrel
+            self._write(session, pubrel)
+
+        elif ptype == PUBREL:
+            (packet_id,) = UINT16.unpack_from(body, 0)
+            session.incoming.discard(packet_id)
+            self._write(session, ack_packet(PUBCOMP, packet_id))
+
+        elif ptype == SUBSCRIBE:
+            (packet_id,) = UINT16.unpack_from(body, 0)
+            pos = 2
+            granted = []
+            new_filters = []
+            while pos < len(body):
+                topic_filter, pos = read_str(body, pos)
+                topic_filter = topic_filter.decode('utf-8')
+                qos = body[pos] & 0x03
+                pos += 1
+                if not valid_filter(topic_filter) or qos == 3:
+                    granted.append(0x80)
+                    continue
+                session.subscriptions[topic_filter] = qos
+                self.tree.add(topic_filter, session, qos)
+                granted.append(qos)
+                new_filters.append((topic_filter, qos))
+            self._write(session, bytes(((SUBACK << 4), 2 + len(granted))) + UINT16.pack(packet_id) + bytes(granted))
+
+            # 購読したフィルターに一致する Retain メッセージを送る（複数のフィルターに一致しても1回）
+            matched = {}
+            for topic_filter, qos in new_filters:
+                for topic in self.retained:
+                    if topic_matches(topic_filter, topic):
+                        matched[topic] = max(qos, matched.get(topic, 0))
+            for topic, qos in matched.items():
+                payload, retained_qos = self.retained[topic]
+                self._deliver(session, topic, payload, min(qos, retained_qos), True)
+
+        elif ptype == UNSUBSCRIBE:
+            (packet_id,) = UINT16.unpack_from(body, 0)
+            pos = 2
+            while pos < len(body):
+                topic_filter, pos = read_str(body, pos)
+                topic_filter = topic_filter.decode('utf-8')
+                if session.subscriptions.pop(topic_filter, None) is not None:
+                    self.tree.remove(topic_filter, session)
+            self._write(session, ack_packet(UNSUBACK, packet_id))
+
+        elif ptype == PINGREQ:
+            self._write(session, PINGRESP_PACKET)
+
+        else:
+            raise ProtocolError(f"想定外のパケット: {name}")
+
+    # ---- 振り分け ----
+
+    def _route(self, topic, payload, qos, retain):
+        """PUBLISH を購読者に振り分け"""
+        start = time.perf_counter_ns()
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+
+        topic_bytes = topic.encode('utf-8')
+        qos0_packet = None
+        for session, sub_qos in self.tree.match(topic).items():
+            out_qos = min(qos, sub_qos)
+            if out_qos == 0 and session.writer is not None:
+                # QoS 0 のパケットは全購読者で共通なので一度だけ組み立てる
+                if qos0_packet is None:
+                    qos0_packet = publish_packet(topic_bytes, payload, 0)
+                self._send_qos0(session, qos0_packet)
+            else:
+                self._deliver(session, topic, payload, out_qos, False, topic_bytes)
+        self.route_hist.record((time.perf_counter_ns() - start) // 1000)
+
+    def _send_qos0(self, session, packet):
+        if session.writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.counters["dropped"] += 1
+            return
+        self.counters["publish_out"] += 1
+        self._write(session, packet)
+
+    def _deliver(self, session, topic, payload, qos, retain, topic_bytes=None):
+        """1つのセッションへ配信"""
+        if session.writer is None:
+            # 切断中のセッションには QoS 1/2 だけを貯める
+            if qos and len(session.pending) < self.max_pending:
+                session.pending.append((topic, payload, qos, retain))
+            elif qos:
+                self.counters["dropped"] += 1
+            return
+
+        if topic_bytes is None:
+            topic_bytes = topic.encode('utf-8')
+        if qos == 0:
+            packet = publish_packet(topic_bytes, payload, 0, retain)
+            self._send_qos0(session, packet)
+            return
+
+        packet_id = session.next_packet_id()
+        packet = publish_packet(topic_bytes, payload, qos, retain, packet_id)
+        session.inflight[packet_id] = packet
+        self.counters["publish_out"] += 1
+        self._write(session, packet)
+
+class BrokerThread:
+    """MiniBroker を別スレッドのイベントループで動かす"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def host(self):
+        return self.broker.host
+
+    @property
+    def port(self):
+        return self.broker.port
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.broker.start())
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+        return self
+
+    def stats(self):
+        """カウンターのスナップショット（ブローカーのスレッドで取得）"""
+        return asyncio.run_coroutine_threadsafe(self._call(self.broker.stats), self.loop).result(5)
+
+    def reset_stats(self):
+        asyncio.run_coroutine_threadsafe(self._call(self.broker.reset_stats), self.loop).result(5)
+
+    def wait_for_clients(self, count=0, timeout=5.0):
+        """接続中のクライアントが count 以下になるまで待つ（切断までのパケットを処理し終えるのを待つ）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.stats()["clients"] <= count:
+                return True
+            time.sleep(0.02)
+        return False
+
+    async def _call(self, func):
+        return func()
+
+    def stop(self):
+        if not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.broker.stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+def start_broker_thread(host="127.0.0.1", port=0, **kwargs):
+    """ブローカーを別スレッドで起動して返す（port=0 なら空きポート）"""
+    return BrokerThread(MiniBroker(host, port, **kwargs)).start()
+
+def format_stats(stats):
+    """カウンターを1行の文字列に"""
+    route = stats["route_us"]
+    line = (f"接続 {stats['clients']} | 購読 {stats['subscriptions']} | Retain {stats['retained']} | "
+            f"受信 {stats['publish_in']} | 配信 {stats['publish_out']} | 破棄 {stats['dropped']} | "
+            f"処理時間 {stats['busy_s']:.2f}秒 ({stats['busy_ratio']:.1%})")
+    if route["count"]:
+        line += f" | 振り分け p50 {route['p50']}µs p99 {route['p99']}µs"
+    return line
+
+async def _serve(args):
+    broker = MiniBroker(args.host, args.port)
+    await broker.start()
+    print(f"🚀 MQTTブローカー起動: {broker.host}:{broker.port}")
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(f"📊 {format_stats(broker.stats())}")
+    finally:
+        await broker.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="軽量MQTTブローカー（MQTT 3.1.1）")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=1883, help="待ち受けるポート")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="カウンターの表示間隔（秒）")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        print("\n🛑 ブローカーを停止しました")
+    except OSError as e:
+        print(f"❌ 起動できません: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
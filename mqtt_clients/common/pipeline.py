@@ -0,0 +1,323 @@
+"""
+段階（ステージ）に分けた受信処理のパイプライン
+
+機能:
+- 受信 → デコード → 振り分け → 分析 → 出力 のような段を、上限付きのキューでつなぐ
+- 段ごとにワーカー数を指定し、スレッドかプロセスプールで実行
+- key を指定した段はワーカーごとのキューに振り分け、同じキー（センサーなど）の順序を保つ
+- キューがいっぱいになると前の段が待つ（背圧）ので、メモリは受信量に比例しない
+- 段ごとにキューの深さ・処理件数/秒・1件の処理時間 p50 / p99・稼働率・前の段が待った時間を集計
+- 稼働率が半分以上の段のうち、いちばん高い段をボトルネックとして表示
+
+paho のコールバックでは submit() でキューに入れるだけにし、デコードや書き出しは
+段のワーカーで行います。最初の段のキューがいっぱいのときは受信スレッドが待つので、
+ブローカーとの間の TCP にも背圧がかかります。
+
+    pipeline = Pipeline()
+    pipeline.add("decode", decode_message, to="route", workers=4, pool="process", batch=32)
+    pipeline.add("route", route, to=("analyze", "sink"))
+    pipeline.add("analyze", analyze, to="sink", workers=4, key=lambda r: r[0])
+    pipeline.add("sink", write)
+    pipeline.start()
+"""
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from common.histogram import LatencyHistogram
+
+POOLS = ("thread", "process")
+BUSY = 0.5      # この稼働率以上の段をボトルネックとして表示
+
+_STOP = object()
+
+def _apply(handler, items):
+    """items を1件ずつ handler に渡し、(出力のリスト, エラー件数, 最後のエラー) を返す
+
+    プロセスプールでも使うのでモジュールの関数にしています。
+    """
+    outputs = []
+    errors = 0
+    last_error = None
+    for item in items:
+        try:
+            result = handler(item)
+        except Exception as e:
+            errors += 1
+            last_error = f"{type(e).__name__}: {e}"
+            continue
+        if result is not None:
+            outputs.extend(result)
+    return outputs, errors, last_error
+
+def _ignore_sigint():
+    """子プロセスでは Ctrl+C を無視（停止は親プロセスが close() で行う）"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class Stage:
+    """パイプラインの1段（上限付きのキューとワーカー）
+
+    handler(item) は次の段に渡すもののリスト（なければ None）を返します。
+    to が段の名前なら出力はすべてその段へ、名前のタプルなら出力は (段の名前, item) の組です。
+    pool="process" の handler と item はプロセス間で受け渡すので、モジュールの関数と
+    pickle できる値にしてください。batch 件までまとめて1回で渡し、受け渡しの回数を減らします。
+    """
+
+    def __init__(self, name, handler, to=None, workers=1, pool="thread", key=None,
+                 max_queue=1000, batch=1):
+        if pool not in POOLS:
+            raise ValueError(f"不明なプール: {pool}")
+        self.name = name
+        self.handler = handler
+        self.to = to
+        self.workers = workers
+        self.pool = pool
+        self.key = key
+        self.max_queue = max_queue
+        self.batch = max(1, batch)
+        # key があればワーカーごと、なければ全ワーカーで1つのキュー
+        count = workers if key is not None else 1
+        self.queues = [queue.Queue(maxsize=max_queue) for _ in range(count)]
+        self.targets = {}       # 段の名前 -> Stage（Pipeline.start() で設定）
+        self.executor = None
+        self.threads = []
+        self.lock = threading.Lock()
+
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        self.last_error = None
+        self.max_depth = 0
+        self.blocked = 0        # キューがいっぱいで前の段が待った回数
+        self.blocked_ns = 0
+        self.busy_ns = 0        # ワーカーが処理していた時間の合計
+        self.service = LatencyHistogram()   # 1件の処理時間（µs、起動から）
+        self.window = LatencyHistogram()    # 1件の処理時間（µs、前回の stats() から）
+
+    @property
+    def capacity(self):
+        return self.max_queue * len(self.queues)
+
+    def depth(self):
+        """キューに溜まっている件数"""
+        return sum(q.qsize() for q in self.queues)
+
+    def put(self, item):
+        """item をキューに入れる（いっぱいなら空くまで待つ）"""
+        if len(self.queues) == 1:
+            q = self.queues[0]
+        else:
+            q = self.queues[hash(self.key(item)) % len(self.queues)]
+        blocked_ns = 0
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            t0 = time.perf_counter_ns()
+            q.put(item)
+            blocked_ns = time.perf_counter_ns() - t0
+        depth = q.qsize()
+        with self.lock:
+            self.received += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if blocked_ns:
+                self.blocked += 1
+                self.blocked_ns += blocked_ns
+
+    def start(self):
+        if self.pool == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_ignore_sigint)
+            # 子プロセスの起動を先に済ませ、最初のメッセージの処理時間に含めない
+            for future in [self.executor.submit(int) for _ in range(self.workers)]:
+                future.result()
+        for i in range(self.workers):
+            q = self.queues[i % len(self.queues)]
+            thread = threading.Thread(target=self._work, args=(q,), name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self, q):
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            items = [item]
+            stopping = False
+            while len(items) < self.batch:
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                items.append(item)
+
+            t0 = time.perf_counter_ns()
+            if self.executor is not None:
+                outputs, errors, last_error = self.executor.submit(_apply, self.handler, items).result()
+            else:
+                outputs, errors, last_error = _apply(self.handler, items)
+            elapsed = time.perf_counter_ns() - t0
+            per_item = elapsed // len(items) // 1000
+            with self.lock:
+                self.processed += len(items)
+                self.errors += errors
+                if last_error is not None:
+                    self.last_error = last_error
+                self.busy_ns += elapsed
+                for _ in items:
+                    self.service.record(per_item)
+                    self.window.record(per_item)
+
+            self._forward(outputs)
+            if stopping:
+                return
+
+    def _forward(self, outputs):
+        if self.to is None:
+            return
+        if isinstance(self.to, str):
+            target = self.targets[self.to]
+            for item in outputs:
+                target.put(item)
+        else:
+            for name, item in outputs:
+                self.targets[name].put(item)
+
+    def stop(self):
+        """キューの残りを処理してからワーカーを止める"""
+        for i in range(self.workers):
+            self.queues[i % len(self.queues)].put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+class Pipeline:
+    """Stage をつないだ受信処理
+
+    add() で段を前から順に追加し、start() で開始します。submit() は最初の段に入れます。
+    close() は前の段から順にキューを空にして止めるので、受け取ったものはすべて最後の段まで届きます。
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.by_name = {}
+        self.started = None
+        self.previous = None    # 前回の stats() の (時刻, {段の名前: (処理件数, 稼働時間)})
+
+    def add(self, name, handler, to=None, **options):
+        """段を追加（options は Stage の引数）"""
+        stage = Stage(name, handler, to=to, **options)
+        self.stages.append(stage)
+        self.by_name[name] = stage
+        return stage
+
+    def start(self):
+        """出力先を確認して全段のワーカーを開始"""
+        for stage in self.stages:
+            names = [] if stage.to is None else [stage.to] if isinstance(stage.to, str) else list(stage.to)
+            for name in names:
+                if name not in self.by_name:
+                    raise ValueError(f"{stage.name}: 出力先の段がありません: {name}")
+                stage.targets[name] = self.by_name[name]
+        # 後ろの段から開始（前の段の出力先が先に動いているように）
+        for stage in reversed(self.stages):
+            stage.start()
+        self.started = time.monotonic()
+        self.previous = (self.started, {s.name: (0, 0) for s in self.stages})
+        return self
+
+    def submit(self, item):
+        """最初の段に item を入れる（paho のコールバックから呼ぶ）"""
+        self.stages[0].put(item)
+
+    def close(self):
+        """前の段から順に、残りを処理して止める"""
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self, total=False):
+        """段ごとの集計結果の辞書のリスト
+
+        件数/秒・稼働率・処理時間は前回の stats() からの区間（total=True なら起動から）です。
+        """
+        now = time.monotonic()
+        since, previous = self.previous
+        if total:
+            since, previous = self.started, {s.name: (0, 0) for s in self.stages}
+        elapsed = max(now - since, 1e-9)
+        results = []
+        current = {}
+        for stage in self.stages:
+            with stage.lock:
+                hist = stage.service if total else stage.window
+                count = hist.count
+                p50, p99 = hist.percentiles([50, 99]) if count else (0, 0)
+                processed, busy_ns = stage.processed, stage.busy_ns
+                if not total:
+                    stage.window = LatencyHistogram()
+                result = {
+                    "name": stage.name,
+                    "workers": stage.workers,
+                    "pool": stage.pool,
+                    "received": stage.received,
+                    "processed": processed,
+                    "errors": stage.errors,
+                    "last_error": stage.last_error,
+                    "depth": stage.depth(),
+                    "capacity": stage.capacity,
+                    "max_depth": stage.max_depth,
+                    "blocked": stage.blocked,
+                    "blocked_s": stage.blocked_ns / 1e9,
+                }
+            done_before, busy_before = previous[stage.name]
+            current[stage.name] = (processed, busy_ns)
+            result["rate"] = (processed - done_before) / elapsed
+            result["utilization"] = (busy_ns - busy_before) / 1e9 / (elapsed * stage.workers)
+            result["service_p50_ms"] = p50 / 1000
+            result["service_p99_ms"] = p99 / 1000
+            results.append(result)
+        if not total:
+            self.previous = (now, current)
+        return results
+
+def bottleneck(stats):
+    """稼働率が BUSY 以上の段のうち、いちばん高い段の名前（なければ None）"""
+    busy = [s for s in stats if s["utilization"] >= BUSY]
+    if not busy:
+        return None
+    return max(busy, key=lambda s: s["utilization"])["name"]
+
+def _width(text):
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text)
+
+def _ljust(text, width):
+    return text + " " * (width - _width(text))
+
+def _rjust(text, width):
+    return " " * (width - _width(text)) + text
+
+def format_stats(stats):
+    """stats() の表（段ごとに1行）"""
+    slowest = bottleneck(stats)
+    lines = [_ljust("段", 10) + _ljust("並列", 11) + _rjust("キュー", 8) + " " * 6 + _rjust("最大", 7)
+             + _rjust("件/秒", 10) + _rjust("処理 p50", 11) + _rjust("p99", 9) + _rjust("稼働率", 8)
+             + _rjust("待ち", 9) + _rjust("エラー", 7)]
+    for s in stats:
+        lines.append(
+            f"{s['name']:<10}{s['workers']:>3} {s['pool']:<7}{s['depth']:>7}/{s['capacity']:<6}"
+            f"{s['max_depth']:>7}{s['rate']:>10,.0f}{s['service_p50_ms']:>9.3f}ms{s['service_p99_ms']:>7.3f}ms"
+            f"{s['utilization']:>8.0%}{s['blocked_s']:>8.2f}s{s['errors']:>7}"
+            f"{'  ◀ ボトルネック' if s['name'] == slowest else ''}")
+    return "\n".join(lines)
@@ -0,0 +1,41 @@
+"""
+計測用ペイロード（プローブ）
+
+機能:
+- 送信時刻とシーケンス番号を埋め込んだペイロードを作成
+- 受信側でプローブかどうかを判定して取り出す
+
+形式（ビッグエンディアン、24バイト + 任意長のパディング）:
+    magic  4バイト  b"MQPB"
+    stream uint32   送信元（Publisher）の番号
+    seq    uint64   シーケンス番号
+    sent   int64    送信時刻（ナノ秒）
+
+送信時刻は既定で time.time_ns()（別プロセス・別ホストでも比較可能）。
+同一プロセス内の計測では clock=time.monotonic_ns を渡すとより正確です。
+"""
+
+import struct
+import time
+
+MAGIC = b"MQPB"
+HEADER = struct.Struct("!4sIQq")
+HEADER_SIZE = HEADER.size
+
+def encode_probe(stream, seq, size=0, clock=time.time_ns):
+    """プローブペイロードを作成（size がヘッダより大きければパディング）"""
+    header = HEADER.pack(MAGIC, stream, seq, clock())
+    if size > HEADER_SIZE:
+        return header + b"\0" * (size - HEADER_SIZE)
+    return header
+
+def is_probe(payload):
+    """プローブペイロードなら True"""
+    return payload[:4] == MAGIC and len(payload) >= HEADER_SIZE
+
+def decode_probe(payload):
+    """(stream, seq, 送信時刻ns) を返す。プローブでなければ None"""
+    if not is_probe(payload):
+        return None
+    _, stream, seq, sent = HEADER.unpack_from(payload)
+    return stream, seq, sent
@@ -0,0 +1,179 @@
+"""
+種別ごとのトピックを (センサー, 測定時刻) で1行にまとめる結合処理
+
+機能:
+- 温度・湿度・照度を別々のトピックで受けたサンプルを、センサーIDと測定時刻の区間（バケット）で1行に結合
+- 全種別がそろった行はその場で確定し、そろわない行は待ち時間（window 秒）を過ぎたら欠けたまま確定
+- 確定済みの行に遅れて届いたサンプルは重複行を作らずに捨てて件数だけ数える
+- 組み立て中の行数には上限があり、あふれた分は古い順に確定する（メモリは受信時間に比例しない）
+- 確定した行を CSV に少しずつ追記する CsvRowWriter
+
+publisher は1回の測定で同じ測定時刻を全種別に付けて送るので、
+測定時刻をバケットの幅で切り捨てれば同じ行になります。
+"""
+
+import csv
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from common.codec import KINDS
+
+FIELDS = ["timestamp", "sensor_id", *KINDS]
+
+class RowJoiner:
+    """(センサーID, バケット) ごとに種別の値を集めて1行にする
+
+    確定した行は on_row(row) に渡します。row は FIELDS をキーに持つ辞書で、
+    届かなかった種別は None です。待ち時間の確認は poll() を定期的に呼ぶか、
+    start() でバックグラウンドのスレッドに任せます。close() で残りをすべて確定します。
+    """
+
+    def __init__(self, on_row, kinds=KINDS, bucket=1.0, window=2.0, max_pending=10000):
+        self.on_row = on_row
+        self.kinds = tuple(kinds)
+        self.bucket = bucket
+        self.window = window
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()  # (センサーID, バケット) -> [最初に届いた時刻（monotonic）, 行]
+        self.closed = OrderedDict()   # 確定した (センサーID, バケット) -> 確定した時刻（monotonic）
+        self.thread = None
+        self.stopping = threading.Event()
+
+        self.samples = 0
+        self.rows = 0
+        self.reasons = {"complete": 0, "timeout": 0, "overflow": 0, "close": 0}
+        self.late = 0
+        self.duplicates = 0
+
+    def add(self, sensor_id, kind, value, measured_at=None):
+        """サンプルを1件加える（その行の全種別がそろったら確定）"""
+        if measured_at is None:
+            measured_at = time.time()
+        key = (sensor_id, int(measured_at // self.bucket))
+        with self.lock:
+            self.samples += 1
+            entry = self.pending.get(key)
+            if entry is None:
+                if key in self.closed:
+                    self.late += 1
+                    return
+                row = dict.fromkeys(FIELDS)
+                row["timestamp"] = datetime.fromtimestamp(key[1] * self.bucket).strftime("%Y-%m-%d %H:%M:%S")
+                row["sensor_id"] = sensor_id
+                entry = self.pending[key] = [time.monotonic(), row]
+                if len(self.pending) > self.max_pending:
+                    self._close(next(iter(self.pending)), "overflow")
+            row = entry[1]
+            if row[kind] is not None:
+                self.duplicates += 1
+            row[kind] = value
+            if all(row[k] is not None for k in self.kinds):
+                self._close(key, "complete")
+
+    def add_row(self, sensor_id, values, measured_at=None):
+        """batch のように全種別がまとめて届いたサンプルを加える"""
+        for kind, value in values.items():
+            if kind in self.kinds:
+                self.add(sensor_id, kind, value, measured_at)
+
+    def poll(self):
+        """待ち時間を過ぎた行を確定し、古い確定済みの記録を消す"""
+        now = time.monotonic()
+        deadline = now - self.window
+        with self.lock:
+            while self.pending:
+                key, (first_added, _) = next(iter(self.pending.items()))
+                if first_added > deadline:
+                    break
+                self._close(key, "timeout")
+            # 遅れたサンプルを見分けるのは待ち時間の2倍まで
+            while self.closed:
+                key, closed_at = next(iter(self.closed.items()))
+                if closed_at > deadline - self.window:
+                    break
+                del self.closed[key]
+
+    def flush(self, reason="close"):
+        """組み立て中の行をすべて確定"""
+        with self.lock:
+            for key in list(self.pending):
+                self._close(key, reason)
+
+    def _close(self, key, reason):
+        _, row = self.pending.pop(key)
+        self.closed[key] = time.monotonic()
+        self.rows += 1
+        self.reasons[reason] += 1
+        self.on_row(row)
+
+    def start(self, interval=None):
+        """待ち時間を監視するスレッドを開始"""
+        if interval is None:
+            interval = max(self.window / 4, 0.05)
+
+        def run():
+            while not self.stopping.wait(interval):
+                self.poll()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """監視スレッドを止め、残りの行を確定"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush("close")
+
+    def stats(self):
+        """集計結果の辞書"""
+        with self.lock:
+            return {
+                "samples": self.samples,
+                "rows": self.rows,
+                "reasons": dict(self.reasons),
+                "late": self.late,
+                "duplicates": self.duplicates,
+                "pending": len(self.pending),
+            }
+
+def format_stats(stats):
+    """stats() の1行表示"""
+    reasons = stats["reasons"]
+    return (f"サンプル {stats['samples']}件 → {stats['rows']}行 | "
+            f"確定理由 そろった{reasons['complete']} 時間切れ{reasons['timeout']} "
+            f"上限{reasons['overflow']} 終了{reasons['close']} | "
+            f"遅延で破棄 {stats['late']} | 上書き {stats['duplicates']} | 組み立て中 {stats['pending']}")
+
+class CsvRowWriter:
+    """確定した行を CSV に追記（終了時にまとめて書くのではなく、届いた順に書き出す）
+
+    ファイルへの flush は flush_interval 秒に1回なので、1行ごとにディスクへ書き込みはしません。
+    """
+
+    def __init__(self, path, fields=FIELDS, flush_interval=1.0):
+        self.path = path
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=fields)
+        self.writer.writeheader()
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.rows = 0
+
+    def write(self, row):
+        with self.lock:
+            self.writer.writerow(row)
+            self.rows += 1
+            now = time.monotonic()
+            if now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def close(self):
+        with self.lock:
+            self.file.close()
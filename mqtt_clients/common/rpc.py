@@ -0,0 +1,253 @@
+"""
+コマンドのリクエスト / レスポンス（相関ID付きのRPC）
+
+機能:
+- コマンドのペイロードに相関ID（id）と返信先トピック（reply_to）を入れて送信
+- デバイスは実行結果を reply_to に同じ id で返信し、送信側は id で待っているコマンドに結び付ける
+- 応答はタイムアウト付きで待て、複数のコマンドを同時に送って応答を待てる
+- コマンドごとの往復時間（送信から応答まで）をヒストグラムに記録
+
+MQTT 3.1.1 には MQTT 5 の Response Topic / Correlation Data がないため、ペイロードの JSON に入れます。
+JSON でない従来のペイロード（"ON" など）もそのままコマンドとして受け付け、その場合は返信しません。
+
+    リクエスト: {"id": "3fa2c1d0-17", "reply_to": "replies/RemoteController01/3fa2c1d0", "value": "ON"}
+    レスポンス: {"id": "3fa2c1d0-17", "ok": true, "result": {"power": "ON"}}
+               {"id": "3fa2c1d0-18", "ok": false, "error": "温度は16〜30°Cの範囲で設定してください"}
+"""
+
+import itertools
+import json
+import secrets
+import threading
+import time
+
+from common.histogram import LatencyHistogram
+
+class CommandTimeout(TimeoutError):
+    """応答が期限までに届かなかった"""
+
+class CommandFailed(Exception):
+    """デバイスがコマンドを実行できなかった（ok: false）"""
+
+def encode_request(value, correlation_id, reply_to):
+    """コマンドのペイロード"""
+    return json.dumps({"id": correlation_id, "reply_to": reply_to, "value": value},
+                      ensure_ascii=False, separators=(",", ":"))
+
+def parse_command(payload):
+    """コマンドのペイロードから (値, 相関ID, 返信先) を取り出す
+
+    JSON でない従来のペイロードは (文字列, None, None) として返します。
+    """
+    text = payload.decode() if isinstance(payload, (bytes, bytearray)) else payload
+    if text.startswith("{"):
+        try:
+            request = json.loads(text)
+        except ValueError:
+            return text, None, None
+        if isinstance(request, dict) and "id" in request:
+            return request.get("value"), request["id"], request.get("reply_to")
+    return text, None, None
+
+def encode_response(correlation_id, ok=True, result=None, error=None):
+    """レスポンスのペイロード"""
+    response = {"id": correlation_id, "ok": ok}
+    if ok:
+        response["result"] = result
+    else:
+        response["error"] = error
+    return json.dumps(response, ensure_ascii=False, separators=(",", ":"))
+
+def send_response(client, reply_to, correlation_id, ok=True, result=None, error=None, qos=1):
+    """相関ID付きのコマンドに返信（reply_to がなければ何もしない）"""
+    if not reply_to or correlation_id is None:
+        return None
+    return client.publish(reply_to, encode_response(correlation_id, ok, result, error), qos=qos)
+
+class CommandFuture:
+    """送信したコマンドの応答待ち
+
+    result() で応答を待ちます。ok: false なら CommandFailed、期限までに応答がなければ CommandTimeout。
+    add_done_callback() は応答・失敗・タイムアウトのどれかで一度だけ呼ばれます。
+    """
+
+    def __init__(self, rpc, correlation_id, topic, value, timeout):
+        self.rpc = rpc
+        self.id = correlation_id
+        self.topic = topic
+        self.value = value
+        self.sent_at = time.monotonic()
+        self.deadline = self.sent_at + timeout
+        self.latency = None     # 往復時間（秒）
+        self.response = None
+        self.exception = None
+        self.event = threading.Event()
+        self.callbacks = []
+
+    def done(self):
+        return self.event.is_set()
+
+    def result(self, timeout=None):
+        """応答の result を返す（timeout 省略時はコマンドの期限まで待つ）"""
+        if timeout is None:
+            timeout = max(0.0, self.deadline - time.monotonic())
+        if not self.event.wait(timeout) and time.monotonic() >= self.deadline:
+            self.rpc.expire(self)
+            self.event.wait()
+        if not self.event.is_set():
+            raise CommandTimeout(f"{self.topic}: {timeout:g}秒以内に応答がありません")
+        if self.exception is not None:
+            raise self.exception
+        return self.response.get("result")
+
+    def add_done_callback(self, callback):
+        """完了時に callback(future) を呼ぶ（完了済みならすぐに呼ぶ）"""
+        with self.rpc.lock:
+            if not self.done():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, response=None, exception=None):
+        self.response = response
+        self.exception = exception
+        self.latency = time.monotonic() - self.sent_at
+        # add_done_callback() と同じロックで完了にし、登録済みの callback を取り出す
+        with self.rpc.lock:
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+class RpcClient:
+    """mqtt.Client に相関ID付きのコマンド送信を追加する
+
+    on_connect で subscribe() を呼んで返信先を購読してください。返信は
+    message_callback_add で受けるので、元の on_message はそのまま使えます。
+    期限切れの確認は result() が行いますが、add_done_callback() だけで待つ場合は
+    poll() を定期的に呼ぶか start() でバックグラウンドのスレッドに任せます。
+    """
+
+    def __init__(self, client, name, qos=2, timeout=5.0):
+        self.client = client
+        self.qos = qos
+        self.timeout = timeout
+        self.prefix = secrets.token_hex(4)
+        self.reply_topic = f"replies/{name}/{self.prefix}"
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.pending = {}       # 相関ID -> CommandFuture
+        self.thread = None
+        self.stopping = threading.Event()
+        client.message_callback_add(self.reply_topic, self._on_response)
+
+        self.sent = 0
+        self.ok = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.late = 0           # 期限切れの後に届いた応答
+        self.latency = LatencyHistogram()   # 往復時間（µs）
+
+    def subscribe(self):
+        """返信先トピックを購読（on_connect から呼ぶ）"""
+        self.client.subscribe(self.reply_topic, qos=1)
+
+    def call(self, topic, value, timeout=None):
+        """コマンドを送信して CommandFuture を返す（応答は待たない）"""
+        correlation_id = f"{self.prefix}-{next(self.counter)}"
+        future = CommandFuture(self, correlation_id, topic, value,
+                               self.timeout if timeout is None else timeout)
+        with self.lock:
+            self.pending[correlation_id] = future
+            self.sent += 1
+        result = self.client.publish(topic, encode_request(value, correlation_id, self.reply_topic), qos=self.qos)
+        if result.rc != 0:
+            with self.lock:
+                if self.pending.pop(correlation_id, None) is None:
+                    return future
+                self.errors += 1
+            future._finish(exception=CommandFailed(f"送信失敗 rc={result.rc}"))
+        return future
+
+    def _on_response(self, client, userdata, msg):
+        try:
+            response = json.loads(msg.payload)
+            correlation_id = response["id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        with self.lock:
+            future = self.pending.pop(correlation_id, None)
+            if future is None:
+                self.late += 1
+                return
+            if response.get("ok"):
+                self.ok += 1
+            else:
+                self.failed += 1
+            self.latency.record(int((time.monotonic() - future.sent_at) * 1_000_000))
+        if response.get("ok"):
+            future._finish(response)
+        else:
+            future._finish(response, CommandFailed(response.get("error") or "失敗"))
+
+    def expire(self, future):
+        """期限を過ぎたコマンドをタイムアウトにする"""
+        with self.lock:
+            if self.pending.pop(future.id, None) is None:
+                return
+            self.timeouts += 1
+        future._finish(exception=CommandTimeout(f"{future.topic}: 応答がありません"))
+
+    def poll(self):
+        """期限を過ぎたコマンドをすべてタイムアウトにする"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [f for f in self.pending.values() if f.deadline <= now]
+        for future in expired:
+            self.expire(future)
+
+    def start(self, interval=0.05):
+        """期限切れを確認するスレッドを開始"""
+        def run():
+            while not self.stopping.wait(interval):
+                self.poll()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """確認スレッドを止める（応答待ちのコマンドはそのまま）"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def in_flight(self):
+        """応答待ちのコマンド数"""
+        with self.lock:
+            return len(self.pending)
+
+    def stats(self):
+        """集計結果の辞書"""
+        with self.lock:
+            count = self.latency.count
+            p50, p99 = self.latency.percentiles([50, 99]) if count else (0, 0)
+            return {
+                "sent": self.sent,
+                "ok": self.ok,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "late": self.late,
+                "in_flight": len(self.pending),
+                "rtt_p50_ms": p50 / 1000,
+                "rtt_p99_ms": p99 / 1000,
+                "rtt_max_ms": self.latency.max / 1000 if count else 0,
+            }
+
+def format_stats(stats):
+    """stats() の1行表示"""
+    return (f"送信 {stats['sent']} | 成功 {stats['ok']} | 失敗 {stats['failed']} | "
+            f"タイムアウト {stats['timeouts']} | 送信エラー {stats['errors']} | 応答待ち {stats['in_flight']} | "
+            f"往復 p50 {stats['rtt_p50_ms']:.1f}ms p99 {stats['rtt_p99_ms']:.1f}ms 最大 {stats['rtt_max_ms']:.1f}ms")
@@ -0,0 +1,148 @@
+"""
+リアルなセンサーモデル（配列版）
+
+機能:
+- realistic_sensor_publisher.py の温度・湿度・照度モデルを NumPy 配列で実装
+- N台のセンサーを1回の計算でまとめて進める
+- 基準温度・慣性・ノイズ・設置場所による補正などをセンサーごとに指定可能
+- 時刻は引数で渡す（実時間でもシミュレーション時刻でも同じように使える）
+
+パラメータはスカラー（全センサー共通）か長さ N の配列（センサーごと）で指定します。
+既定値は realistic_sensor_publisher.py のクラスと同じです。
+
+    models = RealisticSensorArray(1000, rng=np.random.default_rng(1),
+                                  temp_offset=rng.normal(0, 1.5, 1000))
+    temp, humid, light = models.step(hour_of_day(datetime.now()))
+"""
+
+import numpy as np
+
+def hour_of_day(when):
+    """datetime（または datetime の配列）から時刻（0〜24 の小数）を求める"""
+    if isinstance(when, np.ndarray):
+        return np.array([hour_of_day(w) for w in when])
+    return when.hour + when.minute / 60 + when.second / 3600
+
+def _param(value, count):
+    """スカラーまたは配列のパラメータを長さ count の配列にする"""
+    array = np.asarray(value, dtype=np.float64)
+    if array.ndim == 0:
+        return np.full(count, float(array))
+    if array.shape != (count,):
+        raise ValueError(f"パラメータの長さが {count} ではありません: {array.shape}")
+    return array.copy()
+
+class _ArrayModel:
+    """配列版モデルの共通部分"""
+
+    def __init__(self, count, initial, rng, continuous, hour_offset):
+        self.count = count
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.continuous = continuous
+        self.hour_offset = _param(hour_offset, count)
+        self.values = _param(initial, count)
+
+    def hours(self, hour):
+        """センサーごとの時刻（元のモデルと同じく既定では整数の「時」で扱う）"""
+        hours = (np.asarray(hour, dtype=np.float64) + self.hour_offset) % 24
+        return hours if self.continuous else np.floor(hours)
+
+    def noise(self, width):
+        return self.rng.uniform(-1.0, 1.0, self.count) * width
+
+class TemperatureArray(_ArrayModel):
+    """温度（時刻依存の正弦波 + 慣性 + ノイズ）"""
+
+    def __init__(self, count, base_temp=25.0, mean=24.0, amplitude=4.0, inertia=0.1,
+                 noise=0.3, offset=0.0, low=15.0, high=35.0, rng=None,
+                 continuous=False, hour_offset=0.0):
+        super().__init__(count, base_temp, rng, continuous, hour_offset)
+        self.mean = _param(mean, count)
+        self.amplitude = _param(amplitude, count)
+        self.inertia = _param(inertia, count)
+        self.width = _param(noise, count)
+        self.offset = _param(offset, count)     # 設置場所による補正（日当たり・室内外など）
+        self.low = low
+        self.high = high
+
+    def base(self, hour):
+        """時刻に応じた基準温度（午前6時: 約20°C、午後2時: 約28°C）"""
+        return self.mean + self.offset + self.amplitude * np.sin(np.pi * (self.hours(hour) - 6) / 12)
+
+    def step(self, hour):
+        values = self.values
+        values += (self.base(hour) - values) * self.inertia
+        values += self.noise(self.width)
+        np.clip(values, self.low, self.high, out=values)
+        return values
+
+class HumidityArray(_ArrayModel):
+    """湿度（温度と逆相関 + 慣性 + ノイズ）"""
+
+    def __init__(self, count, base_humid=50.0, coupling=2.0, pivot=30.0, inertia=0.05,
+                 noise=1.5, offset=0.0, low=20.0, high=80.0, rng=None):
+        super().__init__(count, base_humid, rng, True, 0.0)
+        self.coupling = _param(coupling, count)
+        self.pivot = _param(pivot, count)
+        self.inertia = _param(inertia, count)
+        self.width = _param(noise, count)
+        self.offset = _param(offset, count)
+        self.low = low
+        self.high = high
+
+    def step(self, temperature):
+        values = self.values
+        target = 50.0 + self.offset + (self.pivot - temperature) * self.coupling
+        values += (target - values) * self.inertia
+        values += self.noise(self.width)
+        np.clip(values, self.low, self.high, out=values)
+        return values
+
+class LightArray(_ArrayModel):
+    """照度（日中は正弦波、夜間は一定 + 慣性 + ノイズ）"""
+
+    def __init__(self, count, base_light=500.0, day=500.0, peak=400.0, night=50.0,
+                 inertia=0.1, noise=30.0, low=0.0, high=1000.0, rng=None,
+                 continuous=False, hour_offset=0.0):
+        super().__init__(count, base_light, rng, continuous, hour_offset)
+        self.day = _param(day, count)
+        self.peak = _param(peak, count)
+        self.night = _param(night, count)
+        self.inertia = _param(inertia, count)
+        self.width = _param(noise, count)
+        self.low = low
+        self.high = high
+
+    def base(self, hour):
+        hours = self.hours(hour)
+        daytime = (hours >= 6) & (hours < 18)
+        return np.where(daytime, self.day + self.peak * np.sin(np.pi * (hours - 6) / 12), self.night)
+
+    def step(self, hour):
+        values = self.values
+        values += (self.base(hour) - values) * self.inertia
+        values += self.noise(self.width)
+        np.clip(values, self.low, self.high, out=values)
+        return values
+
+class RealisticSensorArray:
+    """温度・湿度・照度をまとめて進める"""
+
+    def __init__(self, count, rng=None, continuous=False, hour_offset=0.0,
+                 base_temp=25.0, temp_offset=0.0, temp_noise=0.3, temp_inertia=0.1,
+                 base_humid=50.0, humid_offset=0.0, base_light=500.0):
+        self.count = count
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.temperature = TemperatureArray(count, base_temp=base_temp, offset=temp_offset,
+                                            noise=temp_noise, inertia=temp_inertia, rng=self.rng,
+                                            continuous=continuous, hour_offset=hour_offset)
+        self.humidity = HumidityArray(count, base_humid=base_humid, offset=humid_offset, rng=self.rng)
+        self.light = LightArray(count, base_light=base_light, rng=self.rng,
+                                continuous=continuous, hour_offset=hour_offset)
+
+    def step(self, hour):
+        """1サンプル進めて (温度, 湿度, 照度) の配列を返す（配列は内部状態なので必要ならコピー）"""
+        temp = self.temperature.step(hour)
+        humid = self.humidity.step(temp)
+        light = self.light.step(hour)
+        return temp, humid, light
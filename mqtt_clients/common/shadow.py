@@ -0,0 +1,246 @@
+"""
+デバイスシャドウ（desired / reported の状態と差分だけの送信）
+
+機能:
+- デバイスごとに reported（デバイスが報告した状態）と desired（コントローラーが望む状態）を保持
+- report() で値が変わった項目だけを記録し、同じ値の報告は送信しない
+- 短い間（coalesce 秒）に続いた変更は1回の送信にまとめる
+- 送信は devices/<ID>/shadow に全状態のスナップショット（Retain）と、
+  devices/<ID>/shadow/update に変わった項目だけ（Retain なし）の2件
+- コントローラーは devices/<ID>/shadow を1件受け取れば全状態が分かる（項目ごとに4件受けなくてよい）
+- desired は devices/<ID>/shadow/desired（Retain）で受け、reported との差（delta）を計算
+- 1つの ShadowPublisher で多数のデバイスのシャドウを扱える
+- 再接続時は republish() で変化がなくても全状態を送り直す（Retain を保存しないブローカーの再起動に備える）
+
+    devices/living-room/shadow
+      {"device_id": "living-room", "session": "3fa2c1d0", "version": 7, "timestamp": 1735689600.5,
+       "reported": {"power": "ON", "mode": "cool", "target_temp": 24.0, "current_temp": 25.5},
+       "desired": {"target_temp": 24.0}, "delta": {}}
+    devices/living-room/shadow/update
+      {"device_id": "living-room", "version": 7, "timestamp": 1735689600.5, "changed": {"current_temp": 25.5}}
+"""
+
+import json
+import secrets
+import threading
+import time
+
+def shadow_topic(device_id):
+    """全状態のスナップショット（Retain）のトピック"""
+    return f"devices/{device_id}/shadow"
+
+def update_topic(device_id):
+    """変わった項目だけのトピック"""
+    return f"devices/{device_id}/shadow/update"
+
+def desired_topic(device_id):
+    """desired（コントローラーが望む状態）のトピック"""
+    return f"devices/{device_id}/shadow/desired"
+
+SHADOW_WILDCARD = "devices/+/shadow"
+
+def encode_desired(fields):
+    """desired のペイロード"""
+    return json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+
+def decode_shadow(payload):
+    """スナップショット / 変更のペイロードを辞書に戻す"""
+    return json.loads(payload)
+
+def compute_delta(desired, reported):
+    """desired のうち reported と異なる項目"""
+    return {key: value for key, value in desired.items() if reported.get(key) != value}
+
+class ShadowPublisher:
+    """デバイスごとの reported / desired を持ち、変わった分だけを送信する
+
+    report() は受信スレッドやシミュレーションのスレッドから呼べます。送信は coalesce 秒たった
+    変更から poll() で行うので、poll() を定期的に呼ぶか start() でバックグラウンドのスレッドに任せます。
+    close() で残りの変更をすべて送ります。legacy_status=True なら、変わった項目だけを
+    従来の devices/<ID>/status/<項目> にも送ります。
+    """
+
+    def __init__(self, client, coalesce=0.5, qos=1, legacy_status=False):
+        self.client = client
+        self.coalesce = coalesce
+        self.qos = qos
+        self.legacy_status = legacy_status
+        self.session = secrets.token_hex(4)   # 再起動で version が1に戻っても古いものと区別する
+        self.lock = threading.Lock()
+        self.reported = {}      # デバイスID -> {項目: 値}
+        self.desired = {}       # デバイスID -> {項目: 値}
+        self.versions = {}      # デバイスID -> 送信したスナップショットの番号
+        self.changed = {}       # デバイスID -> まだ送信していない変更 {項目: 値}
+        self.first_changed = {}  # デバイスID -> 最初の未送信の変更の時刻（monotonic）
+        self.thread = None
+        self.stopping = threading.Event()
+
+        self.reports = 0        # report() で渡された項目数
+        self.unchanged = 0      # 値が同じで送信しなかった項目数
+        self.coalesced = 0      # 送信前に同じ項目が再び変わって1回にまとめた数
+        self.messages = 0
+        self.bytes = 0
+
+    def report(self, device_id, fields):
+        """デバイスの状態を報告（変わった項目だけを送信待ちにする）"""
+        with self.lock:
+            reported = self.reported.setdefault(device_id, {})
+            changed = self.changed.get(device_id)
+            for key, value in fields.items():
+                self.reports += 1
+                if key in reported and reported[key] == value:
+                    self.unchanged += 1
+                    continue
+                reported[key] = value
+                if changed is None:
+                    changed = self.changed[device_id] = {}
+                    self.first_changed[device_id] = time.monotonic()
+                elif key in changed:
+                    self.coalesced += 1
+                changed[key] = value
+
+    def set_desired(self, device_id, fields):
+        """desired を更新（次の送信でスナップショットに反映）"""
+        with self.lock:
+            self.desired.setdefault(device_id, {}).update(fields)
+            if device_id not in self.changed:
+                self.changed[device_id] = {}
+                self.first_changed[device_id] = time.monotonic()
+
+    def delta(self, device_id):
+        """desired のうちまだ reported に反映されていない項目"""
+        with self.lock:
+            return compute_delta(self.desired.get(device_id, {}), self.reported.get(device_id, {}))
+
+    def snapshot(self, device_id):
+        """現在のスナップショット（送信するものと同じ形）"""
+        with self.lock:
+            return self._snapshot(device_id, time.time())
+
+    def _snapshot(self, device_id, timestamp):
+        reported = self.reported.get(device_id, {})
+        desired = self.desired.get(device_id, {})
+        return {
+            "device_id": device_id,
+            "session": self.session,
+            "version": self.versions.get(device_id, 0),
+            "timestamp": round(timestamp, 3),
+            "reported": dict(reported),
+            "desired": dict(desired),
+            "delta": compute_delta(desired, reported),
+        }
+
+    def republish(self, device_id=None):
+        """変わった項目がなくてもスナップショットを送り直す（device_id を省くと全デバイス）
+
+        接続・再接続のたびに呼びます。ブローカーが再起動して Retain が消えていても、
+        コントローラーに全状態が届きます。未送信の変更があれば一緒に送ります。
+        """
+        with self.lock:
+            device_ids = [device_id] if device_id is not None else list(self.reported.keys() | self.desired.keys())
+            for d in device_ids:
+                if d not in self.changed:
+                    self.changed[d] = {}
+                    self.first_changed[d] = time.monotonic()
+                self._publish(d, full=True)
+
+    def poll(self):
+        """coalesce 秒たった変更を送信"""
+        deadline = time.monotonic() - self.coalesce
+        with self.lock:
+            for device_id in [d for d, t in self.first_changed.items() if t <= deadline]:
+                self._publish(device_id)
+
+    def flush(self):
+        """未送信の変更をすべて送信"""
+        with self.lock:
+            for device_id in list(self.changed):
+                self._publish(device_id)
+
+    def _publish(self, device_id, full=False):
+        changed = self.changed.pop(device_id)
+        del self.first_changed[device_id]
+        self.versions[device_id] = self.versions.get(device_id, 0) + 1
+        now = time.time()
+        snapshot = json.dumps(self._snapshot(device_id, now), ensure_ascii=False, separators=(",", ":"))
+        update = json.dumps({"device_id": device_id, "version": self.versions[device_id],
+                             "timestamp": round(now, 3), "changed": changed},
+                            ensure_ascii=False, separators=(",", ":"))
+        self.client.publish(shadow_topic(device_id), snapshot, qos=self.qos, retain=True)
+        self.messages += 1
+        self.bytes += len(snapshot)
+        if changed:
+            self.client.publish(update_topic(device_id), update, qos=self.qos)
+            self.messages += 1
+            self.bytes += len(update)
+        if self.legacy_status:
+            # 送り直しでは従来のトピックにも全項目を送る
+            for key, value in (self.reported.get(device_id, {}) if full else changed).items():
+                self.client.publish(f"devices/{device_id}/status/{key}", str(value), qos=self.qos)
+                self.messages += 1
+
+    def start(self, interval=None):
+        """coalesce 秒たった変更を送信するスレッドを開始"""
+        if interval is None:
+            interval = max(self.coalesce / 4, 0.01)
+
+        def run():
+            while not self.stopping.wait(interval):
+                self.poll()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """送信スレッドを止め、残りの変更を送信"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def stats(self):
+        """集計結果の辞書"""
+        with self.lock:
+            return {
+                "devices": len(self.reported),
+                "reports": self.reports,
+                "unchanged": self.unchanged,
+                "coalesced": self.coalesced,
+                "messages": self.messages,
+                "bytes": self.bytes,
+                "pending": len(self.changed),
+            }
+
+def format_stats(stats):
+    """stats() の1行表示"""
+    return (f"デバイス {stats['devices']} | 報告 {stats['reports']}項目 | 変化なし {stats['unchanged']} | "
+            f"まとめた {stats['coalesced']} | 送信 {stats['messages']}件 {stats['bytes'] / 1024:,.1f} KB | "
+            f"送信待ち {stats['pending']}")
+
+class ShadowCache:
+    """コントローラー側: devices/+/shadow を受けてデバイスごとの最新スナップショットを保持
+
+    同じ session で古い version のスナップショットが後から届いても、新しいものを上書きしません。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.shadows = {}       # デバイスID -> スナップショット
+
+    def update(self, payload):
+        """スナップショットを反映し、前回から変わった reported の項目を返す（古ければ None）"""
+        shadow = decode_shadow(payload)
+        device_id = shadow["device_id"]
+        with self.lock:
+            previous = self.shadows.get(device_id)
+            if previous is not None and shadow.get("session") == previous.get("session") \
+                    and shadow["version"] <= previous["version"]:
+                return None
+            self.shadows[device_id] = shadow
+        before = previous["reported"] if previous else {}
+        return {k: v for k, v in shadow["reported"].items() if before.get(k) != v}
+
+    def get(self, device_id):
+        with self.lock:
+            return self.shadows.get(device_id)
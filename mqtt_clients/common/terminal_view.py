@@ -0,0 +1,246 @@
+"""
+差分描画ターミナルボード
+
+機能:
+- 行ごと・セルごとに変更を記録（ダーティ管理）
+- 変更されたセルだけをANSIエスケープで上書き
+- 描画はバックグラウンドスレッドで上限フレームレートに制限
+- 並び順はソート済みキーを維持し、メッセージごとの再ソートを行わない
+
+メッセージ受信側は update() で値を渡すだけで、画面出力は行いません。
+メッセージレートがいくら高くても画面更新は fps 回/秒に抑えられます。
+"""
+
+import bisect
+import shutil
+import sys
+import threading
+import time
+import unicodedata
+
+def display_width(text):
+    """端末上の表示幅（全角・絵文字は2桁）"""
+    width = 0
+    for ch in text:
+        if unicodedata.combining(ch) or ch == '\ufe0f':
+            continue
+        width += 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+    return width
+
+def fit(text, width):
+    """表示幅 width に切り詰め・空白埋め"""
+    text = str(text)
+    result = []
+    used = 0
+    for ch in text:
+        w = display_width(ch)
+        if used + w > width:
+            break
+        result.append(ch)
+        used += w
+    return ''.join(result) + ' ' * (width - used)
+
+class SortedKeys:
+    """ソート済みキーの列（二分探索で位置を求める）"""
+
+    def __init__(self):
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def add(self, key):
+        """キーを追加し、挿入位置を返す"""
+        index = bisect.bisect_left(self.keys, key)
+        self.keys.insert(index, key)
+        return index
+
+    def index(self, key):
+        """キーの位置"""
+        return bisect.bisect_left(self.keys, key)
+
+class TerminalBoard:
+    """変更セルだけを描画するステータスボード
+
+    columns は (見出し, 表示幅) のリスト。update() には列数と同じ長さの
+    値のタプルを渡す。
+    """
+
+    def __init__(self, title, columns, fps=5, stream=None, separator=" | "):
+        self.title = title
+        self.columns = columns
+        self.interval = 1.0 / fps
+        self.stream = stream or sys.stdout
+        self.separator = separator
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+
+        # 各列の開始桁（1始まり）
+        self.offsets = []
+        x = 1
+        for _, width in columns:
+            self.offsets.append(x)
+            x += width + display_width(separator)
+        self.width = x - display_width(separator) - 1
+
+        self.order = SortedKeys()
+        self.pending = {}       # key -> 最新のセル値
+        self.dirty = {}         # key -> 変更された列番号の集合
+        self.shift_from = None  # 行の挿入でずれた位置（以降を全描画）
+        self.footer = ""
+        self.footer_dirty = True
+        self.full_redraw = True
+
+        self.lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.frames = 0
+
+    # ---- 更新（メッセージ受信スレッドから呼ぶ） ----
+
+    def update(self, key, cells):
+        """行の値を更新（描画は次のフレームで行う）"""
+        cells = tuple(str(c) for c in cells)
+        with self.lock:
+            previous = self.pending.get(key)
+            if previous is None:
+                index = self.order.add(key)
+                self.pending[key] = cells
+                if self.shift_from is None or index < self.shift_from:
+                    self.shift_from = index
+                return
+
+            if previous == cells:
+                return
+            changed = self.dirty.setdefault(key, set())
+            for col, (old, new) in enumerate(zip(previous, cells)):
+                if old != new:
+                    changed.add(col)
+            self.pending[key] = cells
+
+    def set_footer(self, text):
+        """最下行のテキストを更新"""
+        with self.lock:
+            if text != self.footer:
+                self.footer = text
+                self.footer_dirty = True
+
+    # ---- 描画 ----
+
+    def _visible_rows(self):
+        """画面に収まる行数"""
+        lines = shutil.get_terminal_size((self.width, 40)).lines
+        return max(1, lines - 6)
+
+    def _row_text(self, cells):
+        return self.separator.join(fit(c, w) for c, (_, w) in zip(cells, self.columns))
+
+    def _header_lines(self):
+        header = self.separator.join(fit(name, w) for name, w in self.columns)
+        return [
+            "=" * self.width,
+            self.title,
+            "=" * self.width,
+            header,
+            "-" * self.width,
+        ]
+
+    def render(self):
+        """変更分を1フレームとして描画"""
+        with self.lock:
+            if not (self.full_redraw or self.dirty or self.footer_dirty
+                    or self.shift_from is not None):
+                return
+            if self.tty:
+                out = self._render_tty()
+            else:
+                out = self._render_plain()
+            self.dirty = {}
+            self.shift_from = None
+            self.footer_dirty = False
+            self.full_redraw = False
+
+        self.stream.write(out)
+        self.stream.flush()
+        self.frames += 1
+
+    def _render_tty(self):
+        parts = []
+        top = len(self._header_lines()) + 1
+        visible = self._visible_rows()
+        keys = self.order.keys
+
+        if self.full_redraw:
+            parts.append("\x1b[2J\x1b[H")
+            parts.append("\n".join(self._header_lines()))
+            start = 0
+        else:
+            start = len(keys) if self.shift_from is None else self.shift_from
+
+        # 挿入でずれた行以降は行全体を描き直す
+        for i in range(start, min(len(keys), visible)):
+            cells = self.pending[keys[i]]
+            parts.append(f"\x1b[{top + i};1H{self._row_text(cells)}\x1b[K")
+
+        # それ以外は変更されたセルだけを上書き
+        for key, cols in self.dirty.items():
+            i = self.order.index(key)
+            if i >= start or i >= visible:
+                continue
+            cells = self.pending[key]
+            for col in sorted(cols):
+                width = self.columns[col][1]
+                parts.append(f"\x1b[{top + i};{self.offsets[col]}H{fit(cells[col], width)}")
+
+        if self.footer_dirty or self.full_redraw or start < len(keys):
+            hidden = len(keys) - visible
+            footer = self.footer
+            if hidden > 0:
+                footer = f"...他 {hidden} 行 | {footer}"
+            line = top + min(len(keys), visible)
+            parts.append(f"\x1b[{line};1H{'=' * self.width}\x1b[K")
+            parts.append(f"\x1b[{line + 1};1H{footer}\x1b[K")
+            parts.append("\x1b[J")
+
+        return "".join(parts)
+
+    def _render_plain(self):
+        # 端末以外（リダイレクト先など）はフレームごとに全体を出力
+        lines = [""] + self._header_lines()
+        for key in self.order:
+            lines.append(self._row_text(self.pending[key]))
+        lines.append("=" * self.width)
+        if self.footer:
+            lines.append(self.footer)
+        return "\n".join(lines) + "\n"
+
+    # ---- 描画スレッド ----
+
+    def start(self):
+        """描画スレッドを開始"""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """描画スレッドを停止（最後の変更を描画してから終了）"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        self.render()
+        if self.tty:
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def _run(self):
+        next_frame = time.monotonic()
+        while self._running:
+            self.render()
+            next_frame += self.interval
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.monotonic()
@@ -0,0 +1,81 @@
+"""
+common/codec.py のテスト
+
+    cd mqtt_clients && python -m pytest common
+"""
+
+import json
+
+import pytest
+
+from common.codec import SampleReader, decode_series, encode_batch, encode_series
+
+MALFORMED_BATCHES = [
+    b"{}",
+    b"[1]",
+    b"null",
+    b"{not json",
+    b'{"samples": 1}',
+    b'{"samples": [1]}',
+    b'{"samples": [["temperature", 25.3]]}',
+    b'{"samples": [{"timestamp": "now", "temperature": 25.3}]}',
+    b'{"samples": [{"timestamp": 1700000000.0, "temperature": "25.3"}]}',
+    b'{"samples": [{"timestamp": 1700000000.0, "temperature": true}]}',
+    b'{"samples": [{"timestamp": 1700000000.0, "<img src=x>": 1}]}',
+    b"\xff\xfe",
+]
+
+@pytest.mark.parametrize("payload", MALFORMED_BATCHES)
+def test_malformed_batch_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        SampleReader().readings("sensors/A/batch", payload)
+
+@pytest.mark.parametrize("fmt", ["text", "binary"])
+def test_batch_readings(fmt):
+    payload = encode_batch([{"timestamp": 1700000000.0, "temperature": 25.3, "humidity": 50.1}], fmt)
+    if isinstance(payload, str):
+        payload = payload.encode()
+    assert sorted(SampleReader().readings("sensors/A/batch", payload)) == [
+        ("A", "humidity", 50.1, 1700000000.0),
+        ("A", "temperature", 25.3, 1700000000.0),
+    ]
+
+def test_batch_without_timestamp():
+    payload = json.dumps({"samples": [{"light": 500}]}).encode()
+    assert SampleReader().readings("sensors/A/batch", payload) == [("A", "light", 500, None)]
+
+def test_series_with_clock_step_back():
+    samples = [(1700000000.5, 1.0), (1700000000.0, 2.0), (1700000001.0, 3.0)]
+    assert decode_series(encode_series(samples)) == samples
+
+@pytest.mark.parametrize("samples", [
+    [(1700000000.0, 1e9)],
+    [(1700000000.0, 1.0), (1700000000.0 + 5000, 1.0)],
+    [(1700000000.0, 1.0)] * 65536,
+])
+def test_series_out_of_range_raises_value_error(samples):
+    with pytest.raises(ValueError):
+        encode_series(samples)
+
+MALFORMED_SERIES = [
+    b"{}",
+    b"[1]",
+    b'{"samples": {}}',
+    b'{"samples": [1]}',
+    b'{"samples": [[1700000000.0]]}',
+    b'{"samples": [[1700000000.0, 0.1, 0.2]]}',
+    b'{"samples": [[1700000000.0, "0.1"]]}',
+    b'{"samples": [{"t": 1700000000.0, "v": 0.1}]}',
+]
+
+@pytest.mark.parametrize("payload", MALFORMED_SERIES)
+def test_malformed_series_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        SampleReader().readings("sensors/A/vibration/series", payload)
+
+def test_text_series_readings():
+    payload = encode_series([(1700000000.0, 0.0123), (1700000000.01, 0.0131)], "text", digits=4).encode()
+    assert SampleReader().readings("sensors/A/vibration/series", payload) == [
+        ("A", "vibration", 0.0123, 1700000000.0),
+        ("A", "vibration", 0.0131, 1700000000.01),
+    ]
@@ -0,0 +1,95 @@
+"""
+MQTTトラフィックの記録ファイル（バイナリ形式）
+
+機能:
+- 受信したメッセージ（トピック・ペイロード・QoS・Retain・受信時刻）を順に書き込む
+- トピック文字列は初出時に番号を振り、以降は番号だけを書く（同じトピックが続いても小さい）
+- 読み込み時は記録順に (経過マイクロ秒, トピック, ペイロード, QoS, Retain) を返す
+
+形式（ビッグエンディアン）:
+    ファイルヘッダ 16バイト
+        magic   4バイト  b"MQTL"
+        version uint8    1
+        予約    3バイト
+        start   int64    記録開始時刻（UNIX時間・ナノ秒）
+    レコード 17バイト + データ
+        t       uint64   記録開始からの経過時間（マイクロ秒）
+        topic   uint32   トピック番号
+        flags   uint8    bit0-1: QoS, bit2: Retain, bit7: トピック定義
+        length  uint32   データ長
+        data    length   ペイロード（トピック定義ではトピック文字列）
+"""
+
+import struct
+import time
+
+MAGIC = b"MQTL"
+VERSION = 1
+FILE_HEADER = struct.Struct("!4sB3xq")
+RECORD = struct.Struct("!QIBI")
+
+FLAG_RETAIN = 0x04
+FLAG_TOPIC = 0x80
+
+class TrafficWriter:
+    """記録ファイルへの書き込み"""
+
+    def __init__(self, path, buffer_size=1024 * 1024):
+        self.file = open(path, 'wb', buffering=buffer_size)
+        self.start_ns = time.time_ns()
+        self.start_mono = time.monotonic_ns()
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, self.start_ns))
+        self.topics = {}
+        self.count = 0
+        self.bytes = FILE_HEADER.size
+
+    def write(self, topic, payload, qos=0, retain=False, t_us=None):
+        """メッセージを1件書き込む（t_us を省略すると現在の経過時間）"""
+        if t_us is None:
+            t_us = (time.monotonic_ns() - self.start_mono) // 1000
+
+        topic_id = self.topics.get(topic)
+        if topic_id is None:
+            topic_id = self.topics[topic] = len(self.topics)
+            name = topic.encode('utf-8')
+            self.file.write(RECORD.pack(t_us, topic_id, FLAG_TOPIC, len(name)))
+            self.file.write(name)
+            self.bytes += RECORD.size + len(name)
+
+        flags = (qos & 0x03) | (FLAG_RETAIN if retain else 0)
+        self.file.write(RECORD.pack(t_us, topic_id, flags, len(payload)))
+        self.file.write(payload)
+        self.count += 1
+        self.bytes += RECORD.size + len(payload)
+
+    def close(self):
+        self.file.close()
+
+def read_traffic(path):
+    """記録ファイルを読み込み、(開始時刻ns, [(t_us, topic, payload, qos, retain), ...]) を返す"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version, start_ns = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"記録ファイルではありません: {path}")
+    if version != VERSION:
+        raise ValueError(f"未対応のバージョンです: {version}")
+
+    topics = {}
+    messages = []
+    pos = FILE_HEADER.size
+    size = len(data)
+    unpack = RECORD.unpack_from
+    while pos + RECORD.size <= size:
+        t_us, topic_id, flags, length = unpack(data, pos)
+        pos += RECORD.size
+        body = data[pos:pos + length]
+        pos += length
+        if len(body) < length:
+            break   # 記録中に終了した場合の途切れたレコード
+        if flags & FLAG_TOPIC:
+            topics[topic_id] = body.decode('utf-8')
+        else:
+            messages.append((t_us, topics[topic_id], body, flags & 0x03, bool(flags & FLAG_RETAIN)))
+    return start_ns, messages
@@ -0,0 +1,362 @@
+"""
+ブラウザ向けの HTTP + WebSocket 配信サーバー（標準ライブラリのみ）
+
+機能:
+- asyncio で動く小さな HTTP サーバー（登録したパスに静的な内容・JSON を返す、/stats.json は配信の統計）
+- WebSocket（RFC 6455）でブラウザに差分をプッシュ
+- broadcast() は JSON 化と WebSocket フレーム化を1回だけ行い、同じバイト列を全接続に書き込む
+- 接続直後に snapshot() の内容を送る（途中から開いたブラウザも履歴を表示できる）
+- 送信バッファが上限を超えた遅いブラウザは切断する（ブラウザ側は再接続してスナップショットから再開）
+- 負荷試験用の WebSocket クライアント（connect_websocket / read_message）
+
+使い方:
+    server = start_push_server_thread(port=8080, routes={"/": ("text/html", html)}, snapshot=make_snapshot)
+    server.broadcast({"type": "delta", "samples": [...]})   # どのスレッドからでも呼べる
+    print(server.stats())
+    server.stop()
+
+制限:
+- テキストフレームのみ送信し、ブラウザからのメッセージは読み捨てる（ping / close には応答する）
+- ブラウザからのフレームは max_frame バイトまで（超えたら 1009）、マスクなしは 1002 で切断
+- 断片化されたフレーム・拡張（permessage-deflate など）は扱わない
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+
+try:
+    from .histogram import LatencyHistogram
+except ImportError:
+    from histogram import LatencyHistogram
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# WebSocket のオペコード
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# close のステータスコード
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+def encode_frame(payload, opcode=OP_TEXT, mask=False):
+    """WebSocket のフレームを作る（サーバーからはマスクなし、クライアントからはマスクあり）"""
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, mask_bit | 127, length)
+    if not mask:
+        return header + payload
+    key = os.urandom(4)
+    return header + key + _apply_mask(payload, key)
+
+def _apply_mask(payload, key):
+    # 4バイトのキーを繰り返して XOR（int にまとめて計算すると1バイトずつより速い）
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(payload), "big")
+
+class FrameError(Exception):
+    """受け付けないフレーム（code は close のステータスコード）"""
+
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+def close_payload(code, reason=""):
+    """close フレームのペイロード（ステータスコード + 理由）"""
+    return struct.pack("!H", code) + reason.encode("utf-8")[:120]
+
+async def read_frame(reader, max_length=None, require_mask=False):
+    """フレームを1つ読み、(オペコード, ペイロード) を返す
+
+    max_length を超える長さ・require_mask でマスクのないフレームは、ペイロードを読む前に FrameError。
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    if require_mask and not second & 0x80:
+        raise FrameError(CLOSE_PROTOCOL_ERROR, "client frames must be masked")
+    if max_length is not None and length > max_length:
+        raise FrameError(CLOSE_TOO_BIG, f"frame too large: {length} > {max_length}")
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length) if length else b""
+    if key is not None and payload:
+        payload = _apply_mask(payload, key)
+    return opcode, payload
+
+class PushServer:
+    """HTTP + WebSocket の配信サーバー"""
+
+    def __init__(self, host="0.0.0.0", port=8080, routes=None, ws_path="/ws", snapshot=None,
+                 max_buffer=1024 * 1024, max_frame=64 * 1024):
+        self.host = host
+        self.port = port
+        self.routes = dict(routes or {})
+        self.ws_path = ws_path
+        self.snapshot = snapshot
+        self.max_buffer = max_buffer
+        self.max_frame = max_frame      # ブラウザから受け付けるフレームの最大長（バイト）
+        self.clients = set()
+        self.server = None
+        self.reset_stats()
+        self.routes.setdefault("/stats.json", ("application/json", self.stats))
+
+    def reset_stats(self):
+        self.counters = {
+            "connections": 0,     # これまでの WebSocket 接続数
+            "http_requests": 0,
+            "broadcasts": 0,      # broadcast() の回数（JSON 化の回数）
+            "frames_out": 0,      # 書き込んだフレーム数（broadcast × 接続数 + スナップショット）
+            "bytes_out": 0,
+            "slow_closed": 0,     # 送信が追いつかずに切断した接続数
+            "rejected": 0,        # 大きすぎる・マスクのないフレームで切断した接続数
+        }
+        self.serialize_us = LatencyHistogram()   # JSON 化とフレーム化（1回分）
+        self.fanout_us = LatencyHistogram()      # 全接続への書き込み（1回分）
+        self.started = time.monotonic()
+
+    def stats(self):
+        """カウンターのスナップショット（サーバーのスレッドで呼ぶ）"""
+        stats = dict(self.counters)
+        stats["clients"] = len(self.clients)
+        stats["uptime_s"] = round(time.monotonic() - self.started, 1)
+        stats["serialize_us"] = self.serialize_us.summary()
+        stats["fanout_us"] = self.fanout_us.summary()
+        return stats
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for writer in list(self.clients):
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def encode(self, obj):
+        """JSON 化してフレームにする（全接続で同じバイト列を使う）"""
+        return encode_frame(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def fanout(self, frame):
+        """作ったフレームを全接続に書き込む（サーバーのスレッドで呼ぶ）"""
+        start = time.perf_counter_ns()
+        for writer in list(self.clients):
+            transport = writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                # 差分を飛ばすと表示が壊れるので、切断して再接続（スナップショットから再開）してもらう
+                self.counters["slow_closed"] += 1
+                self.clients.discard(writer)
+                transport.abort()
+                continue
+            writer.write(frame)
+            self.counters["frames_out"] += 1
+            self.counters["bytes_out"] += len(frame)
+        self.counters["broadcasts"] += 1
+        self.fanout_us.record((time.perf_counter_ns() - start) // 1000)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) < 2:
+            await self._respond(writer, 400, "text/plain", b"bad request")
+            return
+        method, path = parts[0], parts[1].split("?", 1)[0]
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        if path == self.ws_path and headers.get("upgrade", "").lower() == "websocket":
+            await self._websocket(reader, writer, headers)
+            return
+
+        self.counters["http_requests"] += 1
+        if method != "GET":
+            await self._respond(writer, 405, "text/plain", b"method not allowed")
+            return
+        route = self.routes.get(path)
+        if route is None:
+            await self._respond(writer, 404, "text/plain", b"not found")
+            return
+        content_type, body = route
+        if callable(body):
+            body = body()
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        await self._respond(writer, 200, content_type, body)
+
+    async def _respond(self, writer, status, content_type, body):
+        header = (f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+                  f"Content-Type: {content_type}\r\n"
+                  f"Content-Length: {len(body)}\r\n"
+                  "Cache-Control: no-cache\r\n"
+                  "Connection: close\r\n\r\n")
+        writer.write(header.encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self._respond(writer, 400, "text/plain", b"missing Sec-WebSocket-Key")
+            return
+        accept = base64.b64encode(hashlib.sha1(key.encode("latin-1") + WS_GUID).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+
+        # スナップショットを送ってから配信対象に加える（同じスレッドなので間に差分は入らない）
+        if self.snapshot is not None:
+            frame = self.encode(self.snapshot())
+            writer.write(frame)
+            self.counters["frames_out"] += 1
+            self.counters["bytes_out"] += len(frame)
+        self.clients.add(writer)
+        self.counters["connections"] += 1
+
+        try:
+            while True:
+                opcode, payload = await read_frame(reader, self.max_frame, require_mask=True)
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(encode_frame(payload, OP_PONG))
+        except FrameError as e:
+            # ペイロードは読まずに close を送って切断する
+            self.counters["rejected"] += 1
+            writer.write(encode_frame(close_payload(e.code, str(e)), OP_CLOSE))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+class PushServerThread:
+    """PushServer を別スレッドのイベントループで動かす"""
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def host(self):
+        return self.server.host
+
+    @property
+    def port(self):
+        return self.server.port
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.server.start())
+        except OSError as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+        return self
+
+    def broadcast(self, obj):
+        """全接続に送る（JSON 化は呼び出したスレッドで1回だけ、書き込みはサーバーのスレッド）"""
+        start = time.perf_counter_ns()
+        frame = self.server.encode(obj)
+        self.server.serialize_us.record((time.perf_counter_ns() - start) // 1000)
+        self.loop.call_soon_threadsafe(self.server.fanout, frame)
+        return len(frame)
+
+    def stats(self):
+        return asyncio.run_coroutine_threadsafe(self._call(self.server.stats), self.loop).result(5)
+
+    async def _call(self, func):
+        return func()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+def start_push_server_thread(host="0.0.0.0", port=8080, **kwargs):
+    """配信サーバーを別スレッドで起動して返す（port=0 なら空きポート）"""
+    return PushServerThread(PushServer(host, port, **kwargs)).start()
+
+def format_stats(stats):
+    """カウンターを1行の文字列に"""
+    line = (f"閲覧 {stats['clients']} | 接続 {stats['connections']} | 配信 {stats['broadcasts']}回 → "
+            f"{stats['frames_out']}フレーム | {stats['bytes_out'] / 1024:,.1f} KB | 切断(遅延) {stats['slow_closed']} | "
+            f"切断(不正) {stats['rejected']}")
+    serialize, fanout = stats["serialize_us"], stats["fanout_us"]
+    if fanout["count"]:
+        line += (f" | JSON化 p50 {serialize['p50']}µs | 書き込み p50 {fanout['p50']}µs "
+                 f"p99 {fanout['p99']}µs")
+    return line
+
+async def connect_websocket(host, port, path="/ws"):
+    """WebSocket で接続して (reader, writer) を返す（負荷試験用のクライアント）"""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET {path} HTTP/1.1\r\n"
+                  f"Host: {host}:{port}\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    response = await reader.readuntil(b"\r\n\r\n")
+    if not response.startswith(b"HTTP/1.1 101"):
+        writer.close()
+        raise ConnectionError(response.split(b"\r\n", 1)[0].decode("latin-1"))
+    return reader, writer
+
+async def read_message(reader, writer):
+    """テキストメッセージを1つ読む（ping には応答、close なら None）"""
+    while True:
+        opcode, payload = await read_frame(reader)
+        if opcode == OP_TEXT:
+            return payload
+        if opcode == OP_PING:
+            writer.write(encode_frame(payload, OP_PONG, mask=True))
+        elif opcode == OP_CLOSE:
+            return None
@@ -1,9 +1,26 @@
 import paho.mqtt.client as mqtt
 from datetime import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.terminal_view import TerminalBoard
+
+# 画面の更新回数の上限（メッセージレートとは無関係に一定）
+FPS = 5
 
 devices = {}
+message_count = 0
+
+board = TerminalBoard(
+    "📊 IoTデバイス監視ダッシュボード",
+    [("", 2), ("デバイス", 15), ("状態", 8), ("データ", 6), ("最終更新", 8)],
+    fps=FPS
+)
 
 def on_message(client, userdata, msg):
+    global message_count
+
     parts = msg.topic.split('/')
     device = parts[1]
     message_type = parts[2]
@@ -12,23 +29,19 @@ def on_message(client, userdata, msg):
     if device not in devices:
         devices[device] = {"status": "?", "data": "?", "last_seen": "?"}
 
-    devices[device][message_type] = value
-    devices[device]["last_seen"] = datetime.now().strftime("%H:%M:%S")
-
-    # ダッシュボード表示
-    print("\n" + "=" * 70)
-    print("📊 IoTデバイス監視ダッシュボード")
-    print("=" * 70)
-    for dev_id, info in sorted(devices.items()):
-        status_emoji = "🟢" if info["status"] == "ONLINE" else "🔴"
-        print(f"{status_emoji} {dev_id:15} | "
-              f"状態: {info['status']:8} | "
-              f"データ: {info['data']:6} | "
-              f"最終更新: {info['last_seen']}")
-    print("=" * 70)
+    info = devices[device]
+    info[message_type] = value
+    info["last_seen"] = datetime.now().strftime("%H:%M:%S")
+    message_count += 1
+
+    # 変更された行だけが次のフレームで描画される
+    status_emoji = "🟢" if info["status"] == "ONLINE" else "🔴"
+    board.update(device, (status_emoji, device, info["status"],
+                          info["data"], info["last_seen"]))
+    board.set_footer(f"デバイス数: {len(devices)} | 受信メッセージ: {message_count}")
 
 def on_connect(client, userdata, flags, rc):
-    print("📡 ダッシュボード起動")
+    board.set_footer("📡 ダッシュボード起動 | デバイスを監視中...")
     client.subscribe("devices/#")
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "Dashboard")
@@ -36,5 +49,10 @@ client.on_connect = on_connect
 client.on_message = on_message
 client.connect("localhost", 1883, 60)
 
-print("⏳ デバイスを監視中...")
-client.loop_forever()
+board.start()
+
+try:
+    client.loop_forever()
+except KeyboardInterrupt:
+    board.stop()
+    print("🛑 ダッシュボードを停止しました")
@@ -1,21 +1,257 @@
 # qos_benchmark.py
+"""
+QoS性能比較ベンチマーク
+
+機能:
+- ネットワークループを動かし、ブローカーからの確認応答（on_publish）まで計測
+- QoSごとのスループットと publish→ACK レイテンシ（p50/p95/p99）
+- メッセージサイズ・同時送信数（in-flight）・メッセージ数をスイープ
+- 結果をJSON/CSVに保存し、前回の結果と比較
+
+on_publish が呼ばれるタイミング:
+- QoS 0: ソケットに書き込んだとき（ブローカーからの応答なし）
+- QoS 1: PUBACK を受信したとき
+- QoS 2: PUBCOMP を受信したとき
+"""
+
 import paho.mqtt.client as mqtt
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import threading
 import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.histogram import LatencyHistogram
+from common.mini_broker import format_stats, start_broker_thread
+
+BROKER = "localhost"
+PORT = 1883
+
+def parse_list(text):
+    """カンマ区切りの整数リスト"""
+    return [int(x) for x in text.split(',') if x]
+
+class AckTracker:
+    """publish から on_publish までの時間を記録
+
+    mid は 65535 の次に 1 へ戻るので、応答待ちの mid だけを保持し、応答で取り除きます。
+    応答数は mid の種類ではなく件数で数えます。
+    """
+
+    def __init__(self, window, expected):
+        self.window = threading.BoundedSemaphore(window)
+        self.sent = {}      # 応答待ちの mid -> publish() を呼ぶ前の時刻
+        self.early = {}     # sent に入れる前に届いた応答の mid -> 応答の時刻
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.expected = expected
+        self.acked = 0
+        self.latency = LatencyHistogram()   # publish → ACK（µs）
+
+    def published(self, mid, t0):
+        """publish() が返した mid と、呼ぶ前に取った時刻を登録"""
+        with self.lock:
+            t1 = self.early.pop(mid, None)
+            if t1 is None:
+                self.sent[mid] = t0
+                return
+        self._complete(t1 - t0)
+
+    def failed(self):
+        """送信できなかった publish を期待する応答数から除く"""
+        with self.lock:
+            self.expected -= 1
+            finished = self.acked >= self.expected
+        self.window.release()
+        if finished:
+            self.done.set()
+
+    def on_publish(self, client, userdata, mid):
+        now = time.perf_counter()
+        with self.lock:
+            t0 = self.sent.pop(mid, None)
+            if t0 is None:
+                # publish() が mid を返す前に応答が届いた
+                self.early[mid] = now
+                return
+        self._complete(now - t0)
+
+    def _complete(self, latency):
+        with self.lock:
+            self.acked += 1
+            self.latency.record(latency * 1_000_000)
+            finished = self.acked >= self.expected
+        self.window.release()
+        if finished:
+            self.done.set()
+
+def run_case(args, qos, size, window, count, broker=None):
+    """1条件のベンチマークを実行"""
+    if broker is not None:
+        broker.reset_stats()
+    tracker = AckTracker(window, count)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"QoSBenchmark-{os.getpid()}")
+    client.max_inflight_messages_set(window)
+    client.on_publish = tracker.on_publish
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    topic = f"benchmark/qos{qos}"
+    payload = b"x" * size
+    errors = 0
+
+    start = time.perf_counter()
+    for _ in range(count):
+        tracker.window.acquire()
+        t0 = time.perf_counter()
+        info = client.publish(topic, payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            errors += 1
+            tracker.failed()
+            continue
+        tracker.published(info.mid, t0)
+
+    completed = tracker.done.wait(timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+
+    client.loop_stop()
+    client.disconnect()
+    broker_stats = None
+    if broker is not None:
+        broker.wait_for_clients()
+        broker_stats = broker.stats()
+
+    with tracker.lock:
+        hist = tracker.latency
+        acked_count = tracker.acked
+
+    p50, p95, p99 = hist.percentiles([50, 95, 99])
+    return {
+        "qos": qos,
+        "size": size,
+        "window": window,
+        "count": count,
+        "acked": acked_count,
+        "errors": errors,
+        "timed_out": not completed,
+        "elapsed_s": elapsed,
+        "throughput_msg_s": acked_count / elapsed if elapsed > 0 else 0,
+        "throughput_mb_s": acked_count * size / elapsed / 1024 / 1024 if elapsed > 0 else 0,
+        "latency_ms": {
+            "p50": p50 / 1000 if p50 is not None else None,
+            "p95": p95 / 1000 if p95 is not None else None,
+            "p99": p99 / 1000 if p99 is not None else None,
+            "max": hist.max / 1000 if hist.max is not None else None,
+        },
+        "broker": broker_stats,
+    }
+
+def print_result(r):
+    lat = r["latency_ms"]
+    status = "⏱️ タイムアウト" if r["timed_out"] else "✅"
+    if lat["p50"] is None:
+        print(f"QoS {r['qos']} | {r['size']:6}B | 窓 {r['window']:4} | {r['count']:6}件 | 応答なし {status}")
+        return
+    print(f"QoS {r['qos']} | {r['size']:6}B | 窓 {r['window']:4} | {r['count']:6}件 | "
+          f"{r['throughput_msg_s']:9.0f} msg/s | {r['throughput_mb_s']:7.2f} MB/s | "
+          f"p50 {lat['p50']:7.3f}ms | p95 {lat['p95']:7.3f}ms | p99 {lat['p99']:7.3f}ms {status}")
+    if r["broker"]:
+        print(f"    🧩 ブローカー: {format_stats(r['broker'])}")
+
+def case_key(r):
+    return (r["qos"], r["size"], r["window"], r["count"])
+
+def compare(results, baseline_path):
+    """前回の結果ファイルと比較"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+
+    print("\n" + "=" * 60)
+    print(f"📈 前回との比較: {baseline_path}")
+    print("=" * 60)
+    for r in results:
+        old = baseline.get(case_key(r))
+        if old is None or not old["throughput_msg_s"]:
+            continue
+        ratio = r["throughput_msg_s"] / old["throughput_msg_s"] - 1
+        line = f"QoS {r['qos']} | {r['size']:6}B | 窓 {r['window']:4} | スループット {ratio:+7.1%}"
+        if r["latency_ms"]["p99"] and old["latency_ms"]["p99"]:
+            line += f" | p99 {r['latency_ms']['p99'] / old['latency_ms']['p99'] - 1:+7.1%}"
+        print(line)
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
-client.connect("localhost", 1883, 60)
+def save_results(results, path, args):
+    """結果を保存（拡張子 .csv ならCSV、それ以外はJSON）"""
+    if path.endswith(".csv"):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["qos", "size", "window", "count", "acked", "errors", "timed_out",
+                             "elapsed_s", "throughput_msg_s", "throughput_mb_s",
+                             "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+            for r in results:
+                lat = r["latency_ms"]
+                writer.writerow([r["qos"], r["size"], r["window"], r["count"], r["acked"],
+                                 r["errors"], r["timed_out"], f"{r['elapsed_s']:.6f}",
+                                 f"{r['throughput_msg_s']:.1f}", f"{r['throughput_mb_s']:.4f}",
+                                 lat["p50"], lat["p95"], lat["p99"], lat["max"]])
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now().isoformat(),
+                    "broker": f"{args.host}:{args.port}",
+                    "embedded_broker": args.embedded_broker,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            }, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 結果を保存しました: {path}")
 
-num_messages = 100
+def main():
+    parser = argparse.ArgumentParser(description="QoS性能比較ベンチマーク")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--qos", type=parse_list, default=[0, 1, 2], help="QoSレベル (例: 0,1,2)")
+    parser.add_argument("--sizes", type=parse_list, default=[64], help="ペイロードサイズ (例: 16,256,4096)")
+    parser.add_argument("--windows", type=parse_list, default=[20], help="同時送信数 (例: 1,10,100)")
+    parser.add_argument("--counts", type=parse_list, default=[1000], help="メッセージ数 (例: 100,1000)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1条件あたりの最大待ち時間（秒）")
+    parser.add_argument("--output", help="結果の保存先 (.json / .csv)")
+    parser.add_argument("--compare", help="比較する前回の結果 (.json)")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を起動して使う")
+    args = parser.parse_args()
 
-for qos in [0, 1, 2]:
-    start = time.time()
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread()
+        args.host, args.port = broker.host, broker.port
 
-    for i in range(num_messages):
-        client.publish(f"benchmark/qos{qos}", f"msg{i}", qos=qos)
+    print("🔬 QoS性能比較ベンチマーク（確認応答まで計測）")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print("=" * 60)
 
-    elapsed = time.time() - start
-    avg = elapsed / num_messages * 1000  # ミリ秒
+    results = []
+    for count in args.counts:
+        for size in args.sizes:
+            for window in args.windows:
+                for qos in args.qos:
+                    result = run_case(args, qos, size, window, count, broker)
+                    results.append(result)
+                    print_result(result)
 
-    print(f"QoS {qos}: {elapsed:.4f}秒 | 平均 {avg:.2f}ms/msg")
+    if args.output:
+        save_results(results, args.output, args)
+    if args.compare:
+        compare(results, args.compare)
+    if broker is not None:
+        broker.stop()
 
-client.disconnect()
+if __name__ == "__main__":
+    main()
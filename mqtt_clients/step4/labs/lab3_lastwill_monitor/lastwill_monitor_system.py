@@ -1,11 +1,50 @@
 # lastwill_monitor_system.py
 import paho.mqtt.client as mqtt
 from datetime import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.liveness import LivenessTracker
+
+# デバイスのデータ送信間隔（秒）
+DATA_INTERVAL = 2.0
 
 devices_status = {}
 
+def on_silence(device, silence):
+    # 接続は切れていないがデータが届かない（ハング）
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    devices_status[device] = {
+        "status": "SILENT",
+        "time": timestamp
+    }
+    print(f"[{timestamp}] 🟡 {device}: SILENT")
+    print(f"  ⚠️  アラート: {device}から{silence:.1f}秒間データがありません！")
+
+def on_recover(device):
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    devices_status[device] = {
+        "status": "ONLINE",
+        "time": timestamp
+    }
+    print(f"[{timestamp}] 🟢 {device}: データ受信が再開しました")
+
+liveness = LivenessTracker(
+    default_interval=DATA_INTERVAL,
+    on_timeout=on_silence,
+    on_recover=on_recover
+)
+
 def on_message(client, userdata, msg):
-    device = msg.topic.split('/')[1]
+    parts = msg.topic.split('/')
+    device = parts[1]
+
+    # ステータス以外のデータは最終受信時刻の記録のみ
+    if parts[-1] != "status":
+        liveness.touch(device)
+        return
+
     status = msg.payload.decode()
     timestamp = datetime.now().strftime("%H:%M:%S")
 
@@ -20,11 +59,16 @@ def on_message(client, userdata, msg):
     # アラート
     if status == "OFFLINE":
         print(f"  ⚠️  アラート: {device}が応答しません！")
+        liveness.forget(device)
+    elif status == "ONLINE":
+        liveness.touch(device)
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "MonitoringSystem")
 client.on_message = on_message
 client.connect("localhost", 1883, 60)
-client.subscribe("devices/+/status")
+client.subscribe("devices/#")
+
+liveness.start()
 
 print("📡 デバイス監視システム起動")
 print("=" * 60)
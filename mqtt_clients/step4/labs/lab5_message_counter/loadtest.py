@@ -1,10 +1,411 @@
-# load_test.py
+# loadtest.py
+"""
+負荷生成ツール（message_counter.py と組み合わせて使う）
+
+機能:
+- 複数のクライアント接続を開き、ワーカースレッドで分担して送信
+- トークンバケットで全体の送信レート（msg/s）を制御
+- シナリオファイル（JSON / YAML）でトピック・ペイロードの構成比やフェーズを定義
+- シードを固定すれば同じ順序・同じ内容のメッセージを再現
+- 目標レートと実際のレート、送信エラー、ブローカー側の詰まり（未完了の送信数）を表示
+- センサーの測定値は受信側と同じ形式（common/codec.py のテキスト / バイナリ）で送信
+
+ブローカー側の詰まりの見方:
+- 未完了: publish() したが on_publish がまだ呼ばれていない件数
+  （QoS 0 はソケットに書けていない件数、QoS 1/2 は確認応答待ちの件数）
+- キュー溢れ: クライアントの送信キューが上限に達して publish() が拒否された件数
+- 生成遅れ: 送信側が間に合わずトークンバケットから溢れた件数
+"""
+
 import paho.mqtt.client as mqtt
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import FORMATS, KIND_CODES, encode_reading
+from common.mini_broker import format_stats, start_broker_thread
+from common.probe import encode_probe
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+BROKER = "localhost"
+PORT = 1883
+
+# シナリオファイルを指定しないときの既定値
+DEFAULT_SCENARIO = {
+    "seed": 1,
+    "connections": 10,
+    "workers": 2,
+    "rate": 1000,
+    "duration": 10,
+    "burst": 50,
+    "devices": 100,
+    "format": "text",
+    "mix": [
+        {"topic": "sensors/{device}/temperature", "weight": 6, "qos": 0, "payload": "sensor"},
+        {"topic": "sensors/{device}/humidity", "weight": 3, "qos": 0, "payload": "sensor"},
+        {"topic": "sensors/{device}/status", "weight": 1, "qos": 1, "payload": "status"},
+    ],
+}
+
+class TokenBucket:
+    """トークンバケット（rate 個/秒で補充、最大 burst 個まで貯まる）"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.overflow = 0.0     # 上限を超えて捨てたトークン（送信が追いつかなかった分）
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens += (now - self.last) * self.rate
+        self.last = now
+        if self.tokens > self.capacity:
+            self.overflow += self.tokens - self.capacity
+            self.tokens = self.capacity
+
+    def take(self):
+        """トークンを1つ取る。足りなければ待つべき秒数を返す"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return 0.1
+        return (1 - self.tokens) / self.rate
+
+class Connection:
+    """1本のクライアント接続と送信状況"""
+
+    def __init__(self, index, args, seed):
+        self.index = index
+        self.name = f"loadgen-{seed}-{index}"
+        self.connected = threading.Event()
+        self.published = 0      # publish() が成功した件数
+        self.completed = 0      # on_publish が呼ばれた件数
+        self.queue_full = 0
+        self.errors = 0
+        self.disconnects = 0
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"{self.name}-{os.getpid()}")
+        self.client.max_inflight_messages_set(args.max_inflight)
+        self.client.max_queued_messages_set(args.max_queued)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            self.connected.set()
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            self.disconnects += 1
+
+    def on_publish(self, client, userdata, mid):
+        self.completed += 1
+
+    def publish(self, topic, payload, qos):
+        info = self.client.publish(topic, payload, qos=qos)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.published += 1
+        elif info.rc == mqtt.MQTT_ERR_QUEUE_SIZE:
+            self.queue_full += 1
+        else:
+            self.errors += 1
+
+    def pending(self):
+        return self.published - self.completed
+
+class MessageMix:
+    """シナリオの mix からトピックとペイロードを生成"""
+
+    def __init__(self, scenario, stream):
+        self.entries = scenario["mix"]
+        self.devices = scenario.get("devices", 100)
+        self.fmt = scenario.get("format", "text")
+        self.stream = stream
+        self.seq = 0
+
+        # 重みの累積和（bisect で選択）
+        self.cumulative = []
+        total = 0
+        for entry in self.entries:
+            total += entry.get("weight", 1)
+            self.cumulative.append(total)
+        self.total_weight = total
+
+    def next(self, rng, connection):
+        """(トピック, ペイロード, QoS) を1件生成"""
+        entry = self.entries[bisect.bisect_right(self.cumulative, rng.random() * self.total_weight)]
+        device = f"device{rng.randrange(self.devices):04d}"
+        topic = entry["topic"].format(device=device, client=connection.name, seq=self.seq)
+        payload = self.payload(entry, rng, device, topic)
+        self.seq += 1
+        return topic, payload, entry.get("qos", 0)
+
+    def payload(self, entry, rng, device, topic):
+        kind = entry.get("payload", "sensor")
+        if kind == "sensor":
+            value = round(rng.gauss(entry.get("mean", 25.0), entry.get("stddev", 2.0)), 2)
+            # アラートだけは従来どおり JSON
+            if topic.startswith("alerts/"):
+                return json.dumps({
+                    "sensor_id": device,
+                    "value": value,
+                    "timestamp": datetime.now().isoformat(),
+                })
+            # sensors/<ID>/<種別> は受信側（codec.decode_reading）と同じ形式
+            sensor_kind = topic.rsplit('/', 1)[-1]
+            if sensor_kind in KIND_CODES:
+                return encode_reading(sensor_kind, value, self.fmt)
+            return str(value)
+        if kind == "status":
+            return rng.choice(("ONLINE", "ONLINE", "ONLINE", "BUSY", "ERROR"))
+        if kind == "probe":
+            return encode_probe(self.stream, self.seq, entry.get("size", 0))
+        if kind == "random":
+            size = entry.get("size", 64)
+            if isinstance(size, list):
+                size = rng.randint(size[0], size[1])
+            return rng.randbytes(size)
+        raise ValueError(f"不明なペイロード種別: {kind}")
+
+def load_scenario(path):
+    """シナリオファイル（.json / .yaml / .yml）を読み込む"""
+    scenario = dict(DEFAULT_SCENARIO)
+    if path is None:
+        return scenario
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise SystemExit("❌ YAMLのシナリオには PyYAML が必要です（pip install pyyaml）")
+            loaded = yaml.safe_load(f)
+        else:
+            loaded = json.load(f)
+    scenario.update(loaded or {})
+    return scenario
+
+def build_phases(scenario):
+    """フェーズ一覧 [(開始秒, 終了秒, レート)]"""
+    phases = scenario.get("phases") or [{"duration": scenario["duration"], "rate": scenario["rate"]}]
+    result = []
+    start = 0.0
+    for phase in phases:
+        end = start + phase["duration"]
+        result.append((start, end, phase.get("rate", scenario["rate"])))
+        start = end
+    return result
+
+def worker(index, connections, scenario, buckets, stop):
+    """担当する接続を順番に使って送信"""
+    rng = random.Random(f"{scenario['seed']}-{index}")
+    mix = MessageMix(scenario, index)
+    bucket = buckets[index]
+    turn = 0
+
+    while not stop.is_set():
+        wait = bucket.take()
+        if wait:
+            time.sleep(min(wait, 0.05))
+            continue
+        connection = connections[turn % len(connections)]
+        turn += 1
+        if not connection.connected.is_set():
+            connection.errors += 1
+            continue
+        topic, payload, qos = mix.next(rng, connection)
+        connection.publish(topic, payload, qos)
+
+def totals(connections, buckets):
+    return {
+        "published": sum(c.published for c in connections),
+        "completed": sum(c.completed for c in connections),
+        "pending": sum(c.pending() for c in connections),
+        "queue_full": sum(c.queue_full for c in connections),
+        "errors": sum(c.errors for c in connections),
+        "disconnects": sum(c.disconnects for c in connections),
+        "behind": int(sum(b.overflow for b in buckets)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT負荷生成ツール")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--scenario", help="シナリオファイル (.json / .yaml)")
+    parser.add_argument("--seed", type=int, help="乱数シード（シナリオの値を上書き）")
+    parser.add_argument("--connections", type=int, help="接続数（シナリオの値を上書き）")
+    parser.add_argument("--workers", type=int, help="送信スレッド数（シナリオの値を上書き）")
+    parser.add_argument("--rate", type=float, help="全体の目標レート msg/s（シナリオの値を上書き）")
+    parser.add_argument("--duration", type=float, help="実行秒数（シナリオの値を上書き）")
+    parser.add_argument("--payload", choices=FORMATS,
+                        help="測定値のペイロード形式（text: 数値の文字列、binary: 固定長のバイナリ。シナリオの format を上書き）")
+    parser.add_argument("--max-inflight", type=int, default=100, help="接続ごとの確認応答待ち上限")
+    parser.add_argument("--max-queued", type=int, default=1000, help="接続ごとの送信キュー上限")
+    parser.add_argument("--report-interval", type=float, default=1.0, help="表示間隔（秒）")
+    parser.add_argument("--output", help="結果の保存先 (.json)")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を起動して使う")
+    args = parser.parse_args()
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread()
+        args.host, args.port = broker.host, broker.port
+
+    scenario = load_scenario(args.scenario)
+    for key in ("seed", "connections", "workers", "rate", "duration"):
+        value = getattr(args, key)
+        if value is not None:
+            scenario[key] = value
+    if args.payload is not None:
+        scenario["format"] = args.payload
+    if scenario["format"] not in FORMATS:
+        parser.error(f"不明なペイロード形式: {scenario['format']}")
+    if args.rate is not None or args.duration is not None:
+        scenario.pop("phases", None)
+    scenario["workers"] = max(1, min(scenario["workers"], scenario["connections"]))
+
+    phases = build_phases(scenario)
+    total_duration = phases[-1][1]
+
+    print("🚀 MQTT負荷生成ツール")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print(f"🔗 接続 {scenario['connections']} 本 / 送信スレッド {scenario['workers']} | シード {scenario['seed']}")
+    for start, end, rate in phases:
+        print(f"   {start:6.1f}〜{end:6.1f}秒: {rate:g} msg/s")
+    print("=" * 80)
+
+    # 接続を開く
+    connections = [Connection(i, args, scenario["seed"]) for i in range(scenario["connections"])]
+    for connection in connections:
+        connection.client.connect(args.host, args.port, 60)
+        connection.client.loop_start()
+    for connection in connections:
+        if not connection.connected.wait(timeout=10):
+            print(f"⚠️  {connection.name} が接続できません")
+
+    # 接続をワーカーに振り分け、レートを等分
+    workers = scenario["workers"]
+    groups = [connections[i::workers] for i in range(workers)]
+    buckets = [TokenBucket(phases[0][2] / workers, scenario["burst"] / workers) for _ in range(workers)]
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(i, groups[i], scenario, buckets, stop), daemon=True)
+        for i in range(workers)
+    ]
+
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+
+    intervals = []
+    last_time = start
+    last = totals(connections, buckets)
+    phase_index = 0
+
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            now = time.monotonic()
+            elapsed = now - start
+
+            target = phases[phase_index][2]
+
+            # フェーズの切り替え（表示間隔ごとに判定）
+            while phase_index + 1 < len(phases) and elapsed >= phases[phase_index][1]:
+                phase_index += 1
+                for bucket in buckets:
+                    bucket.set_rate(phases[phase_index][2] / workers)
+
+            current = totals(connections, buckets)
+            span = now - last_time
+            sent_rate = (current["published"] - last["published"]) / span
+            done_rate = (current["completed"] - last["completed"]) / span
+            intervals.append({
+                "elapsed_s": round(elapsed, 3),
+                "target": target,
+                "sent_rate": sent_rate,
+                "completed_rate": done_rate,
+                **current,
+            })
+            print(f"[{elapsed:6.1f}s] 目標 {target:8.0f} | 送信 {sent_rate:8.0f} | 完了 {done_rate:8.0f} msg/s | "
+                  f"未完了 {current['pending']:6} | キュー溢れ {current['queue_full']} | "
+                  f"エラー {current['errors']} | 生成遅れ {current['behind']}")
+            last, last_time = current, now
+
+            if elapsed >= total_duration:
+                break
+    except KeyboardInterrupt:
+        print("\n🛑 中断しました")
+
+    stop.set()
+    for t in threads:
+        t.join(timeout=2)
+    send_elapsed = time.monotonic() - start
+
+    # 未完了の送信が片付くまで少し待つ
+    deadline = time.monotonic() + 5
+    while totals(connections, buckets)["pending"] > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+    for connection in connections:
+        connection.client.loop_stop()
+        connection.client.disconnect()
+    broker_stats = None
+    if broker is not None:
+        broker.wait_for_clients()
+        broker_stats = broker.stats()
+    if broker is not None:
+        broker.stop()
+
+    result = totals(connections, buckets)
+    target_total = sum((end - begin) * rate for begin, end, rate in phases)
+    achieved = result["published"] / send_elapsed if send_elapsed > 0 else 0
+    target_rate = target_total / total_duration if total_duration > 0 else 0
+
+    print("=" * 80)
+    print("📊 結果")
+    print(f"  目標: {target_rate:.0f} msg/s（{target_total:.0f}件） | 実績: {achieved:.0f} msg/s（{result['published']}件）"
+          f" | 達成率 {achieved / target_rate if target_rate else 0:.1%}")
+    print(f"  完了: {result['completed']}件 | 未完了: {result['pending']}件 | キュー溢れ: {result['queue_full']}件")
+    print(f"  送信エラー: {result['errors']}件 | 切断: {result['disconnects']}回 | 生成遅れ: {result['behind']}件")
+    if broker_stats:
+        print(f"  🧩 ブローカー: {format_stats(broker_stats)}")
 
-client = mqtt.Client()
-client.connect("localhost", 1883, 60)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.now().isoformat(),
+                    "broker": f"{args.host}:{args.port}",
+                    "scenario": scenario,
+                },
+                "target_rate": target_rate,
+                "achieved_rate": achieved,
+                "result": result,
+                "broker": broker_stats,
+                "intervals": intervals,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 結果を保存しました: {args.output}")
 
-for i in range(10000):
-    client.publish("test/load", f"msg{i}", qos=0)
-    if i % 1000 == 0:
-        print(f"{i} messages sent")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
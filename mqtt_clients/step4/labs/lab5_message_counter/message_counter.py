@@ -1,22 +1,199 @@
 # message_counter.py
+"""
+メッセージカウンター（ブローカースループット計測用）
+
+機能:
+- 受信時はカウンターを加算するだけ（メッセージごとの画面出力なし）
+- 一定間隔で QoS別・トピック別・クライアント別の msg/s, bytes/s を表示
+- プローブペイロード（common/probe.py）の送信時刻からレイテンシを計測
+"""
+
 import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.histogram import LatencyHistogram
+from common.probe import MAGIC, decode_probe
+
+BROKER = "localhost"
+PORT = 1883
+
+# カウンター: キー -> [メッセージ数, バイト数]
+qos_counts = {0: [0, 0], 1: [0, 0], 2: [0, 0]}
+prefix_counts = {}
+client_counts = {}
+retained = [0]
+
+# プローブのレイテンシ（マイクロ秒）
+latency = {"interval": LatencyHistogram(), "total": LatencyHistogram()}
+
+options = None
+running = True
 
-stats = {"qos0": 0, "qos1": 0, "qos2": 0, "retained": 0}
+def count(table, key, size):
+    """カウンターを加算"""
+    entry = table.get(key)
+    if entry is None:
+        table[key] = [1, size]
+    else:
+        entry[0] += 1
+        entry[1] += size
+
+def on_connect(client, userdata, flags, rc):
+    if rc == 0:
+        client.subscribe(options.topic, qos=options.qos)
+    else:
+        print(f"❌ 接続失敗: {rc}")
 
 def on_message(client, userdata, msg):
-    stats[f"qos{msg.qos}"] += 1
+    # ここでは加算だけを行い、文字列の組み立てや出力はしない
+    payload = msg.payload
+    size = len(payload)
+    topic = msg.topic
+
+    entry = qos_counts[msg.qos]
+    entry[0] += 1
+    entry[1] += size
     if msg.retain:
-        stats["retained"] += 1
+        retained[0] += 1
+
+    parts = topic.split('/', max(options.prefix_depth, options.client_level + 1))
+    count(prefix_counts, '/'.join(parts[:options.prefix_depth]), size)
+
+    if payload[:4] == MAGIC:
+        probe = decode_probe(payload)
+        if probe is not None:
+            stream, _, sent = probe
+            latency_us = (time.time_ns() - sent) // 1000
+            latency["interval"].record(latency_us)
+            latency["total"].record(latency_us)
+            count(client_counts, f"probe-{stream}", size)
+            return
+
+    sender = parts[options.client_level] if len(parts) > options.client_level else topic
+    count(client_counts, sender, size)
+
+def format_bytes(rate):
+    """バイト/秒を見やすい単位に変換"""
+    if rate >= 1024 * 1024:
+        return f"{rate / 1024 / 1024:7.2f} MB/s"
+    if rate >= 1024:
+        return f"{rate / 1024:7.2f} KB/s"
+    return f"{rate:7.0f}  B/s"
+
+def rate_lines(table, previous, elapsed, top, label="{}", by_key=False):
+    """前回表示からの差分でレートを計算して上位を返す"""
+    snapshot = {key: tuple(value) for key, value in list(table.items())}
+    rows = []
+    for key, (msgs, size) in snapshot.items():
+        prev_msgs, prev_size = previous.get(key, (0, 0))
+        rows.append((
+            (msgs - prev_msgs) / elapsed,
+            (size - prev_size) / elapsed,
+            msgs,
+            key
+        ))
+    if by_key:
+        rows.sort(key=lambda row: row[3])
+    else:
+        rows.sort(reverse=True)
+
+    lines = []
+    for msg_rate, byte_rate, total, key in rows[:top]:
+        name = label.format(key)[:28]
+        lines.append(f"  {name:28} {msg_rate:10.1f} msg/s | {format_bytes(byte_rate)} | 合計 {total}")
+    if len(rows) > top:
+        lines.append(f"  ...他 {len(rows) - top} 件")
+    return snapshot, lines
+
+def format_latency(hist):
+    """レイテンシの要約"""
+    if hist.count == 0:
+        return "データなし（プローブ未受信）"
+    p50, p95, p99, p999 = hist.percentiles([50, 95, 99, 99.9])
+    return (f"{hist.count}件 | p50 {p50 / 1000:.2f}ms | p95 {p95 / 1000:.2f}ms | "
+            f"p99 {p99 / 1000:.2f}ms | p99.9 {p999 / 1000:.2f}ms | 最大 {hist.max / 1000:.2f}ms")
+
+def display_loop():
+    """一定間隔で統計を表示"""
+    tty = sys.stdout.isatty()
+    start = time.monotonic()
+    last = start
+    prev_qos, prev_prefix, prev_client = {}, {}, {}
+
+    while running:
+        time.sleep(options.refresh)
+        now = time.monotonic()
+        elapsed = now - last
+        last = now
+
+        # 直近区間のレイテンシを切り替え
+        interval_hist = latency["interval"]
+        latency["interval"] = LatencyHistogram()
+
+        prev_qos, qos_lines = rate_lines(qos_counts, prev_qos, elapsed, 3,
+                                         label="QoS {}", by_key=True)
+        prev_prefix, prefix_lines = rate_lines(prefix_counts, prev_prefix, elapsed, options.top)
+        prev_client, client_lines = rate_lines(client_counts, prev_client, elapsed, options.top)
+
+        total = sum(v[0] for v in prev_qos.values())
+        lines = [
+            "=" * 80,
+            f"📊 メッセージカウンター | 購読: {options.topic} | 経過 {now - start:.0f}秒 | 合計 {total} | Retain: {retained[0]}",
+            "=" * 80,
+            "【QoS別】",
+            *qos_lines,
+            f"【トピック別（先頭{options.prefix_depth}階層・上位{options.top}）】",
+            *prefix_lines,
+            f"【クライアント別（上位{options.top}）】",
+            *client_lines,
+            "【レイテンシ（プローブ）】",
+            f"  直近: {format_latency(interval_hist)}",
+            f"  累計: {format_latency(latency['total'])}",
+        ]
+
+        if tty:
+            sys.stdout.write("\x1b[H\x1b[J" + "\n".join(lines) + "\n")
+        else:
+            sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def main():
+    global options, running
+
+    parser = argparse.ArgumentParser(description="メッセージカウンター")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--topic", default="#", help="購読するトピック (既定: #)")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2], help="購読のQoS")
+    parser.add_argument("--refresh", type=float, default=1.0, help="表示間隔（秒）")
+    parser.add_argument("--prefix-depth", type=int, default=1, help="集計するトピックの階層数")
+    parser.add_argument("--client-level", type=int, default=1,
+                        help="送信元とみなすトピック階層の位置（0始まり）")
+    parser.add_argument("--top", type=int, default=10, help="表示する上位件数")
+    options = parser.parse_args()
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(options.host, options.port, 60)
 
-    print(f"\rQoS0: {stats['qos0']} | "
-          f"QoS1: {stats['qos1']} | "
-          f"QoS2: {stats['qos2']} | "
-          f"Retain: {stats['retained']}", end="")
+    display = threading.Thread(target=display_loop, daemon=True)
+    display.start()
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
-client.on_message = on_message
-client.connect("localhost", 1883, 60)
-client.subscribe("#")
+    print("📊 メッセージカウンター起動")
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        running = False
+        print("\n🛑 停止しました")
+        print(f"レイテンシ（累計）: {format_latency(latency['total'])}")
+    finally:
+        client.disconnect()
 
-print("📊 メッセージカウンター起動")
-client.loop_forever()
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ import time
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
 client.connect("localhost", 1883, 60)
 
+# ネットワークループを動かさないと PUBACK / PUBCOMP を受信できない
+client.loop_start()
+
 print("🔬 QoS 0/1/2 の比較実験")
 print("=" * 60)
 
@@ -11,12 +14,18 @@ qos_levels = [0, 1, 2]
 for qos in qos_levels:
     start = time.time()
 
+    messages = []
     for i in range(10):
-        client.publish(f"test/qos{qos}", f"メッセージ {i}", qos=qos)
+        messages.append(client.publish(f"test/qos{qos}", f"メッセージ {i}", qos=qos))
+
+    # ブローカーの確認応答まで待つ（QoS 0は送信完了まで）
+    for info in messages:
+        info.wait_for_publish(timeout=5)
 
     elapsed = time.time() - start
-    print(f"QoS {qos}: {elapsed:.4f}秒 で10メッセージ送信")
+    print(f"QoS {qos}: {elapsed:.4f}秒 で10メッセージ送信（確認応答まで）")
 
+client.loop_stop()
 client.disconnect()
 print("=" * 60)
 print("💡 結果: QoS 0が最速、QoS 2が最も確実")
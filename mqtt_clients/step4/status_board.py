@@ -1,7 +1,52 @@
 import paho.mqtt.client as mqtt
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.liveness import LivenessTracker
+from common.terminal_view import TerminalBoard
+
+# デバイスのデータ送信間隔（multi_device_simulator.py は2秒ごと）
+DATA_INTERVAL = 2.0
+
+# 画面の更新回数の上限（メッセージレートとは無関係に一定）
+FPS = 5
 
 device_status = {}
 
+board = TerminalBoard(
+    "📊 デバイスステータスボード",
+    [("", 2), ("デバイス", 20), ("状態", 12), ("温度", 10)],
+    fps=FPS
+)
+
+def update_row(dev):
+    # ボードの1行を更新（実際の描画は描画スレッドが行う）
+    data = device_status[dev]
+    status = data.get('status', '?')
+    temp = data.get('temperature', data.get('data', '?'))
+
+    # ONLINEのままデータが途絶えているデバイスは沈黙扱い
+    if status == "ONLINE" and not liveness.is_alive(dev):
+        status = "SILENT"
+
+    emoji = "🟢" if status == "ONLINE" else "🔴" if status == "OFFLINE" else "🟡"
+    board.update(dev, (emoji, dev, status, f"{temp}°C"))
+
+def on_silence(device, silence):
+    board.set_footer(f"🟡 {device}: {silence:.1f}秒間データがありません（ハングの可能性）")
+    update_row(device)
+
+def on_recover(device):
+    board.set_footer(f"🟢 {device}: データ受信が再開しました")
+    update_row(device)
+
+liveness = LivenessTracker(
+    default_interval=DATA_INTERVAL,
+    on_timeout=on_silence,
+    on_recover=on_recover
+)
+
 def on_message(client, userdata, msg):
     parts = msg.topic.split('/')
     device = parts[1]
@@ -13,20 +58,16 @@ def on_message(client, userdata, msg):
 
     device_status[device][data_type] = value
 
-    # ステータスボードを表示
-    print("\n" + "=" * 60)
-    print("📊 デバイスステータスボード")
-    print("=" * 60)
-    for dev, data in sorted(device_status.items()):
-        status = data.get('status', '?')
-        temp = data.get('temperature', '?')
+    # 死活監視: データ受信で最終受信時刻を更新
+    if data_type != "status" or value == "ONLINE":
+        liveness.touch(device)
+    elif value == "OFFLINE":
+        liveness.forget(device)
 
-        emoji = "🟢" if status == "ONLINE" else "🔴" if status == "OFFLINE" else "🟡"
-        print(f"{emoji} {dev}: {status:12} | 温度: {temp}°C")
-    print("=" * 60)
+    update_row(device)
 
 def on_connect(client, userdata, flags, rc):
-    print("📡 ステータスボード起動")
+    board.set_footer("📡 ステータスボード起動 | デバイス情報を収集中...")
     client.subscribe("devices/#")
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
@@ -34,5 +75,11 @@ client.on_connect = on_connect
 client.on_message = on_message
 client.connect("localhost", 1883, 60)
 
-print("⏳ デバイス情報を収集中...")
-client.loop_forever()
+liveness.start()
+board.start()
+
+try:
+    client.loop_forever()
+except KeyboardInterrupt:
+    board.stop()
+    print("🛑 ステータスボードを停止しました")
@@ -5,23 +5,36 @@
 - 温度、湿度、照度を同時にグラフ表示
 - センサーステータス監視
 - 統計情報表示
+- 長時間の履歴を保持し、グラフの幅に合わせて間引いて描画（LTTB / min-max）
 """
 
 import paho.mqtt.client as mqtt
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
-from datetime import datetime
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import SampleReader, decode_alert, is_reading_topic
+from common.decimation import METHODS, SeriesStore, axes_width
+from common.headless import add_headless_arguments, run_headless, use_agg
 
 BROKER = "localhost"
 PORT = 1883
 
-# データを保存（最大50個）
-temp_data = deque(maxlen=50)
-humid_data = deque(maxlen=50)
-light_data = deque(maxlen=50)
+# データを保存（--history 件まで、描画時に間引く）
+temp_data = None
+humid_data = None
+light_data = None
+decimation = "lttb"
+start_time = time.time()
 sensor_status = "UNKNOWN"
 
+# 種別ごとのトピックと batch の両方から測定値を取り出す
+reader = SampleReader()
+
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
     if rc == 0:
@@ -40,55 +53,51 @@ def on_message(client, userdata, msg):
     global sensor_status
 
     topic = msg.topic
-    payload = msg.payload.decode()
+    payload = msg.payload
 
     try:
-        if "temperature" in topic and "alerts" not in topic:
-            temp = float(payload)
-            temp_data.append(temp)
-            print(f"📥 温度: {temp}°C")
+        if is_reading_topic(topic):
+            for _, sensor_type, value, measured_at in reader.readings(topic, payload):
+                if sensor_type == "temperature":
+                    temp_data.append(value, measured_at)
+                    print(f"📥 温度: {value}°C")
 
-        elif "humidity" in topic and "alerts" not in topic:
-            humid = float(payload)
-            humid_data.append(humid)
-            print(f"📥 湿度: {humid}%")
+                elif sensor_type == "humidity":
+                    humid_data.append(value, measured_at)
+                    print(f"📥 湿度: {value}%")
 
-        elif "light" in topic and "alerts" not in topic:
-            light = float(payload)
-            light_data.append(light)
-            print(f"📥 照度: {light} lux")
+                elif sensor_type == "light":
+                    light_data.append(value, measured_at)
+                    print(f"📥 照度: {value} lux")
 
         elif "status" in topic:
-            sensor_status = payload
-            emoji = "🟢" if payload == "ONLINE" else "🔴"
+            sensor_status = payload.decode()
+            emoji = "🟢" if sensor_status == "ONLINE" else "🔴"
             retain_mark = "(Retain)" if msg.retain else ""
-            print(f"{emoji} ステータス: {payload} {retain_mark}")
+            print(f"{emoji} ステータス: {sensor_status} {retain_mark}")
 
         elif "alerts" in topic:
-            print(f"🚨 アラート: {payload}")
+            alert_data = decode_alert(payload)
+            print(f"🚨 アラート: {alert_data.get('alert', '')} "
+                  f"({alert_data.get('sensor_id', 'Unknown')} {alert_data.get('value', 0)})")
 
     except ValueError:
         print(f"⚠️  不正なデータ: {payload}")
 
-def get_stats(data):
-    """統計情報を計算"""
-    if len(data) == 0:
-        return "N/A", "N/A", "N/A"
-
-    latest = data[-1]
-    avg = sum(data) / len(data)
-    min_val = min(data)
-    max_val = max(data)
-
-    return latest, avg, min_val, max_val
+def plot_series(ax, line, data):
+    """履歴をグラフの幅の点数に間引いて描画（横軸は起動からの経過分）"""
+    x, y = data.decimated(axes_width(ax), decimation)
+    minutes = (x - start_time) / 60
+    line.set_data(minutes, y)
+    ax.set_xlim(min(0, minutes[0]), max(1, minutes[-1]))
 
 def init_plot():
     """グラフの初期化"""
-    ax1.set_xlim(0, 50)
+    ax1.set_xlim(0, 1)
     ax1.set_ylim(15, 35)
-    ax2.set_xlim(0, 50)
+    ax2.set_xlim(0, 1)
     ax2.set_ylim(20, 80)
-    ax3.set_xlim(0, 50)
+    ax3.set_xlim(0, 1)
     ax3.set_ylim(0, 1000)
     return line1, line2, line3
 
@@ -96,33 +105,30 @@ def update_plot(frame):
     """グラフの更新"""
     # 温度グラフ
     if len(temp_data) > 0:
-        line1.set_data(range(len(temp_data)), list(temp_data))
-        latest, avg, min_val, max_val = get_stats(temp_data)
+        plot_series(ax1, line1, temp_data)
+        latest, avg, min_val, max_val = temp_data.stats()
         ax1.set_title(
             f'温度: {latest:.1f}°C (平均: {avg:.1f}°C, 範囲: {min_val:.1f}〜{max_val:.1f}°C)',
             fontsize=10
         )
-        ax1.set_xlim(0, max(50, len(temp_data)))
 
     # 湿度グラフ
     if len(humid_data) > 0:
-        line2.set_data(range(len(humid_data)), list(humid_data))
-        latest, avg, min_val, max_val = get_stats(humid_data)
+        plot_series(ax2, line2, humid_data)
+        latest, avg, min_val, max_val = humid_data.stats()
         ax2.set_title(
             f'湿度: {latest:.1f}% (平均: {avg:.1f}%, 範囲: {min_val:.1f}〜{max_val:.1f}%)',
             fontsize=10
         )
-        ax2.set_xlim(0, max(50, len(humid_data)))
 
     # 照度グラフ
     if len(light_data) > 0:
-        line3.set_data(range(len(light_data)), list(light_data))
-        latest, avg, min_val, max_val = get_stats(light_data)
+        plot_series(ax3, line3, light_data)
+        latest, avg, min_val, max_val = light_data.stats()
         ax3.set_title(
             f'照度: {latest:.0f} lux (平均: {avg:.0f} lux, 範囲: {min_val:.0f}〜{max_val:.0f} lux)',
             fontsize=10
         )
-        ax3.set_xlim(0, max(50, len(light_data)))
 
     # メインタイトルにステータス表示
     status_emoji = "🟢" if sensor_status == "ONLINE" else "🔴"
@@ -133,6 +139,22 @@ def update_plot(frame):
 
 def main():
     global fig, ax1, ax2, ax3, line1, line2, line3
+    global temp_data, humid_data, light_data, decimation
+
+    parser = argparse.ArgumentParser(description="複数グラフ統合ダッシュボード")
+    parser.add_argument("--history", type=int, default=86400,
+                        help="種別ごとに保持する件数（1秒1件なら86400件で1日分）")
+    parser.add_argument("--decimation", choices=METHODS, default="lttb",
+                        help="描画時の間引き方（lttb: 形を保つ、minmax: 山と谷を残す、none: 間引かない）")
+    add_headless_arguments(parser)
+    args = parser.parse_args()
+    if args.headless:
+        use_agg()
+
+    temp_data = SeriesStore(args.history)
+    humid_data = SeriesStore(args.history)
+    light_data = SeriesStore(args.history)
+    decimation = args.decimation
 
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "MultiDashboard01")
@@ -144,7 +166,8 @@ def main():
         client.loop_start()
 
         print("📊 マルチグラフダッシュボード起動")
-        print("グラフウィンドウを閉じて終了")
+        print(f"🗂️  履歴 {args.history}件 | 間引き {args.decimation}")
+        print("Ctrl+C で終了" if args.headless else "グラフウィンドウを閉じて終了")
         print("-" * 50)
 
         # グラフの初期化
@@ -168,19 +191,23 @@ def main():
 
         # 照度グラフ
         line3, = ax3.plot([], [], 'g-', linewidth=2, marker='o', markersize=3)
-        ax3.set_xlabel('データポイント', fontsize=10)
+        ax3.set_xlabel('経過時間 (分)', fontsize=10)
         ax3.set_ylabel('照度 (lux)', fontsize=10)
         ax3.grid(True, alpha=0.3)
 
         plt.tight_layout()
 
-        # アニメーション開始
-        ani = animation.FuncAnimation(
-            fig, update_plot, init_func=init_plot,
-            interval=1000, blit=True, cache_frame_data=False
-        )
-
-        plt.show()
+        if args.headless:
+            # 画面を使わずに一定間隔で描画してファイルに保存（線やタイトルは作り直さない）
+            run_headless(fig, update_plot, init_plot, args)
+        else:
+            # アニメーション開始（横軸の範囲が伸びていくので blit せずに全体を描き直す）
+            ani = animation.FuncAnimation(
+                fig, update_plot, init_func=init_plot,
+                interval=1000, blit=False, cache_frame_data=False
+            )
+
+            plt.show()
 
     except KeyboardInterrupt:
         print("\n🛑 ダッシュボードを停止します...")
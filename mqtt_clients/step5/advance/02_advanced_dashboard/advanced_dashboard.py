@@ -4,30 +4,53 @@
 機能:
 - 温度、湿度、照度を同時にグラフ表示
 - 統計情報の表示（平均、最大、最小、範囲）
-- データの自動保存（CSV形式）
+- データの自動保存（CSV形式、センサーと測定時刻で1行にまとめて受信中に追記）
 - センサーステータス監視
+- sensors/<ID>/batch（全種別をまとめたサンプル）も種別ごとのトピックと同じ行の形で記録
+- 長時間の履歴を保持し、グラフの幅に合わせて間引いて描画（LTTB / min-max）
+- --grid でセンサーごとの小さなグラフをページ単位で並べて表示（表示中のページだけ更新）
 """
 
 import paho.mqtt.client as mqtt
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from collections import deque
 from datetime import datetime
-import csv
+import argparse
+import math
 import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import KINDS, SampleReader, decode_alert
+from common.decimation import METHODS, SeriesStore, axes_width
+from common.headless import add_headless_arguments, run_headless, use_agg
+from common.row_join import CsvRowWriter, RowJoiner, format_stats
 
 BROKER = "localhost"
 PORT = 1883
 
-# データを保存（最大100個）
-temp_data = deque(maxlen=100)
-humid_data = deque(maxlen=100)
-light_data = deque(maxlen=100)
-timestamps = deque(maxlen=100)
+# グラフ用の履歴（--history 件まで、描画時に間引く）
+temp_data = None
+humid_data = None
+light_data = None
+decimation = "lttb"
+start_time = time.time()
 sensor_status = "UNKNOWN"
 
-# データ保存用のリスト
-all_data = []
+# CSV 保存（種別ごとのトピックを (センサー, 測定時刻) で1行にまとめて追記）
+csv_writer = None
+joiner = None
+
+# --grid のときのセンサーごとのグラフ
+grid = None
+
+# 種別ごとの単位と線の色（--grid）
+KIND_STYLES = {"temperature": ("°C", "r"), "humidity": ("%", "b"), "light": (" lux", "g")}
+
+# 種別ごとのトピックと batch の両方から測定値を取り出す
+reader = SampleReader()
 
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
@@ -47,103 +70,111 @@ def on_message(client, userdata, msg):
     global sensor_status
 
     topic = msg.topic
-    payload = msg.payload.decode()
-    timestamp = datetime.now()
+    payload = msg.payload
+    now = time.time()
 
     try:
-        if "temperature" in topic and "alerts" not in topic:
-            temp = float(payload)
-            temp_data.append(temp)
-            timestamps.append(timestamp)
-
-            # データを記録
-            record = {
-                'timestamp': timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                'sensor_id': 'MultiSensor01',
-                'temperature': temp,
-                'humidity': None,
-                'light': None
-            }
-            all_data.append(record)
-
-            print(f"📥 温度: {temp}°C")
+        if topic.endswith("/batch"):
+            # 1サンプルの全種別がまとめて届くので、組み立て直さずにそのまま1行として記録
+            for sensor_id, measured_at, values in reader.samples(topic, payload):
+                temp = values.get('temperature')
+                humid = values.get('humidity')
+                light = values.get('light')
+                if temp is not None:
+                    temp_data.append(temp, measured_at)
+                if humid is not None:
+                    humid_data.append(humid, measured_at)
+                if light is not None:
+                    light_data.append(light, measured_at)
+                if grid is not None:
+                    for sensor_type, value in values.items():
+                        grid.add(sensor_id, sensor_type, value, measured_at)
+
+                joiner.add_row(sensor_id, values, measured_at or now)
+
+                # --grid のときは台数が多いので1件ずつは表示しない
+                if grid is None:
+                    print(f"📥 {sensor_id}: 🌡️ {temp}°C | 💧 {humid}% | 💡 {light} lux")
+
+        elif "temperature" in topic and "alerts" not in topic:
+            # batch も送っているセンサーの場合は reader が空のリストを返す
+            for sensor_id, _, temp, measured_at in reader.readings(topic, payload):
+                temp_data.append(temp, measured_at)
+                if grid is not None:
+                    grid.add(sensor_id, "temperature", temp, measured_at)
+
+                # 同じセンサー・測定時刻の湿度・照度と1行にまとめて記録
+                joiner.add(sensor_id, "temperature", temp, measured_at or now)
+
+                if grid is None:
+                    print(f"📥 温度: {temp}°C")
 
         elif "humidity" in topic and "alerts" not in topic:
-            humid = float(payload)
-            humid_data.append(humid)
+            for sensor_id, _, humid, measured_at in reader.readings(topic, payload):
+                humid_data.append(humid, measured_at)
+                if grid is not None:
+                    grid.add(sensor_id, "humidity", humid, measured_at)
 
-            # 最後のレコードを更新
-            if all_data and all_data[-1]['humidity'] is None:
-                all_data[-1]['humidity'] = humid
+                joiner.add(sensor_id, "humidity", humid, measured_at or now)
 
-            print(f"📥 湿度: {humid}%")
+                if grid is None:
+                    print(f"📥 湿度: {humid}%")
 
         elif "light" in topic and "alerts" not in topic:
-            light = float(payload)
-            light_data.append(light)
+            for sensor_id, _, light, measured_at in reader.readings(topic, payload):
+                light_data.append(light, measured_at)
+                if grid is not None:
+                    grid.add(sensor_id, "light", light, measured_at)
 
-            # 最後のレコードを更新
-            if all_data and all_data[-1]['light'] is None:
-                all_data[-1]['light'] = light
+                joiner.add(sensor_id, "light", light, measured_at or now)
 
-            print(f"📥 照度: {light} lux")
+                if grid is None:
+                    print(f"📥 照度: {light} lux")
 
         elif "status" in topic:
-            sensor_status = payload
-            emoji = "🟢" if payload == "ONLINE" else "🔴"
+            sensor_status = payload.decode()
+            if grid is not None:
+                grid.status[topic.split('/')[1]] = sensor_status
+            emoji = "🟢" if sensor_status == "ONLINE" else "🔴"
             retain_mark = "(Retain)" if msg.retain else ""
-            print(f"{emoji} ステータス: {payload} {retain_mark}")
+            print(f"{emoji} ステータス: {sensor_status} {retain_mark}")
 
         elif "alerts" in topic:
-            print(f"🚨 アラート: {payload}")
+            alert_data = decode_alert(payload)
+            print(f"🚨 アラート: {alert_data.get('alert', '')} "
+                  f"({alert_data.get('sensor_id', 'Unknown')} {alert_data.get('value', 0)})")
 
     except ValueError:
         print(f"⚠️  不正なデータ: {payload}")
 
-def get_stats(data):
-    """統計情報を計算"""
-    if len(data) == 0:
-        return "N/A", "N/A", "N/A", "N/A"
-
-    latest = data[-1]
-    avg = sum(data) / len(data)
-    min_val = min(data)
-    max_val = max(data)
-
-    return latest, avg, min_val, max_val
-
-def save_data_to_csv():
-    """データをCSVファイルに保存"""
-    if len(all_data) == 0:
-        print("💾 保存するデータがありません")
-        return
-
-    # ファイル名を生成
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"sensor_data_{timestamp}.csv"
-
-    try:
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            fieldnames = ['timestamp', 'sensor_id', 'temperature', 'humidity', 'light']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-
-            writer.writeheader()
-            for record in all_data:
-                writer.writerow(record)
-
-        print(f"💾 データを保存しました: {filename}")
-        print(f"📊 保存件数: {len(all_data)}件")
-
-    except Exception as e:
-        print(f"❌ データ保存エラー: {e}")
+def open_csv(path, window):
+    """CSV ファイルを開き、行の組み立てを開始"""
+    global csv_writer, joiner
+    csv_writer = CsvRowWriter(path)
+    joiner = RowJoiner(csv_writer.write, window=window)
+    joiner.start()
+
+def close_csv():
+    """組み立て中の行を書き出して CSV ファイルを閉じる"""
+    joiner.close()
+    csv_writer.close()
+    print(f"💾 データを保存しました: {csv_writer.path}")
+    print(f"📊 保存件数: {csv_writer.rows}行 | {format_stats(joiner.stats())}")
+
+def plot_series(ax, line, data):
+    """履歴をグラフの幅の点数に間引いて描画（横軸は起動からの経過分）"""
+    x, y = data.decimated(axes_width(ax), decimation)
+    minutes = (x - start_time) / 60
+    line.set_data(minutes, y)
+    ax.set_xlim(min(0, minutes[0]), max(1, minutes[-1]))
 
 def init_plot():
     """グラフの初期化"""
-    ax1.set_xlim(0, 100)
+    ax1.set_xlim(0, 1)
     ax1.set_ylim(15, 35)
-    ax2.set_xlim(0, 100)
+    ax2.set_xlim(0, 1)
     ax2.set_ylim(20, 80)
-    ax3.set_xlim(0, 100)
+    ax3.set_xlim(0, 1)
     ax3.set_ylim(0, 1000)
     return line1, line2, line3
 
@@ -151,45 +182,179 @@ def update_plot(frame):
     """グラフの更新"""
     # 温度グラフ
     if len(temp_data) > 0:
-        line1.set_data(range(len(temp_data)), list(temp_data))
-        latest, avg, min_val, max_val = get_stats(temp_data)
+        plot_series(ax1, line1, temp_data)
+        latest, avg, min_val, max_val = temp_data.stats()
         ax1.set_title(
             f'温度: {latest:.1f}°C (平均: {avg:.1f}°C, 最小: {min_val:.1f}°C, 最大: {max_val:.1f}°C)',
             fontsize=10
         )
-        ax1.set_xlim(0, max(100, len(temp_data)))
 
     # 湿度グラフ
     if len(humid_data) > 0:
-        line2.set_data(range(len(humid_data)), list(humid_data))
-        latest, avg, min_val, max_val = get_stats(humid_data)
+        plot_series(ax2, line2, humid_data)
+        latest, avg, min_val, max_val = humid_data.stats()
         ax2.set_title(
             f'湿度: {latest:.1f}% (平均: {avg:.1f}%, 最小: {min_val:.1f}%, 最大: {max_val:.1f}%)',
             fontsize=10
         )
-        ax2.set_xlim(0, max(100, len(humid_data)))
 
     # 照度グラフ
     if len(light_data) > 0:
-        line3.set_data(range(len(light_data)), list(light_data))
-        latest, avg, min_val, max_val = get_stats(light_data)
+        plot_series(ax3, line3, light_data)
+        latest, avg, min_val, max_val = light_data.stats()
         ax3.set_title(
             f'照度: {latest:.0f} lux (平均: {avg:.0f} lux, 最小: {min_val:.0f} lux, 最大: {max_val:.0f} lux)',
             fontsize=10
         )
-        ax3.set_xlim(0, max(100, len(light_data)))
 
     # メインタイトルにステータスとデータ件数を表示
     status_emoji = "🟢" if sensor_status == "ONLINE" else "🔴"
     fig.suptitle(
-        f'高度なダッシュボード {status_emoji} {sensor_status} | データ件数: {len(all_data)}',
+        f'高度なダッシュボード {status_emoji} {sensor_status} | データ件数: {joiner.rows}',
         fontsize=14, fontweight='bold'
     )
 
     return line1, line2, line3
 
+class SensorGrid:
+    """センサーごとの小さなグラフを並べたページ（--grid）
+
+    センサーはトピックから見つけた順に追加し、センサーID順に rows × cols 枚ずつのページに分けます。
+    受信時の処理はセンサー・種別ごとのリングバッファに追加するだけで、間引きと描画は
+    表示中のページのグラフだけが行うので、描画の重さはセンサーの台数ではなく1ページの枚数で決まります。
+    """
+
+    def __init__(self, kind, rows, cols, history, page_interval):
+        self.kind = kind
+        self.rows = rows
+        self.cols = cols
+        self.per_page = rows * cols
+        self.history = history
+        self.page_interval = page_interval
+        self.lock = threading.Lock()
+        self.stores = {}    # センサーID -> {種別: SeriesStore}
+        self.status = {}    # センサーID -> ONLINE / OFFLINE
+        self.page = 0
+        self.last_flip = time.monotonic()
+        self.update_ms = 0.0
+
+    def add(self, sensor_id, sensor_type, value, measured_at=None):
+        """受信スレッドから呼ぶ（初めてのセンサー・種別ならリングバッファを作る）"""
+        stores = self.stores.get(sensor_id)
+        if stores is None or sensor_type not in stores:
+            with self.lock:
+                stores = self.stores.setdefault(sensor_id, {})
+                stores.setdefault(sensor_type, SeriesStore(self.history))
+        stores[sensor_type].append(value, measured_at)
+
+    def sensor_ids(self):
+        with self.lock:
+            return sorted(self.stores)
+
+    def page_count(self, sensors):
+        return max(1, math.ceil(sensors / self.per_page))
+
+    def build(self, fig):
+        """rows × cols のグラフを作る（以降は作り直さずに使い回す）"""
+        self.fig = fig
+        self.axes = list(fig.subplots(self.rows, self.cols, squeeze=False).ravel())
+        color = KIND_STYLES[self.kind][1]
+        self.lines = []
+        for ax in self.axes:
+            line, = ax.plot([], [], color=color, linewidth=1)
+            ax.tick_params(labelsize=6)
+            ax.locator_params(nbins=4)
+            ax.grid(True, alpha=0.3)
+            self.lines.append(line)
+        fig.canvas.mpl_connect('key_press_event', self.on_key)
+
+    def on_key(self, event):
+        """← / → （または p / n）でページを切り替える"""
+        if event.key in ('right', 'n'):
+            self.flip(1)
+        elif event.key in ('left', 'p'):
+            self.flip(-1)
+
+    def flip(self, step):
+        self.page = (self.page + step) % self.page_count(len(self.stores))
+        self.last_flip = time.monotonic()
+
+    def init(self):
+        return self.lines
+
+    def update(self, frame):
+        """表示中のページのグラフだけを更新"""
+        start = time.perf_counter()
+        if self.page_interval and time.monotonic() - self.last_flip >= self.page_interval:
+            self.flip(1)
+        sensor_ids = self.sensor_ids()
+        pages = self.page_count(len(sensor_ids))
+        self.page %= pages
+        visible = sensor_ids[self.page * self.per_page:(self.page + 1) * self.per_page]
+        unit = KIND_STYLES[self.kind][0]
+
+        for i, (ax, line) in enumerate(zip(self.axes, self.lines)):
+            if i >= len(visible):
+                ax.set_visible(False)
+                continue
+            ax.set_visible(True)
+            sensor_id = visible[i]
+            mark = "" if self.status.get(sensor_id, "ONLINE") == "ONLINE" else f" [{self.status[sensor_id]}]"
+            store = self.stores[sensor_id].get(self.kind)
+            if store is None or len(store) == 0:
+                line.set_data([], [])
+                ax.set_title(f'{sensor_id}{mark}（データなし）', fontsize=8)
+                continue
+            x, y = store.decimated(axes_width(ax), decimation)
+            minutes = (x - start_time) / 60
+            line.set_data(minutes, y)
+            ax.set_xlim(min(0, minutes[0]), max(1, minutes[-1]))
+            low, high = float(y.min()), float(y.max())
+            margin = max((high - low) * 0.1, 0.5)
+            ax.set_ylim(low - margin, high + margin)
+            ax.set_title(f'{sensor_id}{mark}: {y[-1]:.1f}{unit}', fontsize=8)
+
+        self.update_ms = (time.perf_counter() - start) * 1000
+        self.fig.suptitle(
+            f'センサー一覧（{self.kind}）| {len(sensor_ids)}台 | ページ {self.page + 1}/{pages} | '
+            f'データ件数: {joiner.rows} | 更新 {self.update_ms:.1f}ms',
+            fontsize=12, fontweight='bold'
+        )
+        return self.lines
+
 def main():
     global fig, ax1, ax2, ax3, line1, line2, line3
+    global temp_data, humid_data, light_data, decimation, grid
+
+    parser = argparse.ArgumentParser(description="高度なダッシュボード")
+    parser.add_argument("--history", type=int, default=86400,
+                        help="グラフ用に種別ごとに保持する件数（1秒1件なら86400件で1日分）")
+    parser.add_argument("--decimation", choices=METHODS, default="lttb",
+                        help="描画時の間引き方（lttb: 形を保つ、minmax: 山と谷を残す、none: 間引かない）")
+    parser.add_argument("--csv", help="データの保存先（既定: sensor_data_YYYYMMDD_HHMMSS.csv）")
+    parser.add_argument("--join-window", type=float, default=2.0,
+                        help="同じ測定時刻の全種別がそろうのを待つ秒数（過ぎたら欠けたまま1行にする）")
+    parser.add_argument("--grid", action="store_true",
+                        help="センサーごとの小さなグラフをページ単位で並べて表示")
+    parser.add_argument("--grid-kind", choices=KINDS, default="temperature", help="--grid で表示する種別")
+    parser.add_argument("--rows", type=int, default=4, help="--grid の1ページの行数")
+    parser.add_argument("--cols", type=int, default=5, help="--grid の1ページの列数")
+    parser.add_argument("--page-interval", type=float, default=10.0,
+                        help="--grid でページを自動で切り替える間隔（秒、0で切り替えない）")
+    parser.add_argument("--grid-history", type=int, default=3600,
+                        help="--grid でセンサー・種別ごとに保持する件数")
+    add_headless_arguments(parser)
+    args = parser.parse_args()
+    if args.headless:
+        use_agg()
+
+    temp_data = SeriesStore(args.history)
+    humid_data = SeriesStore(args.history)
+    light_data = SeriesStore(args.history)
+    decimation = args.decimation
+    open_csv(args.csv or f"sensor_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", args.join_window)
+    if args.grid:
+        grid = SensorGrid(args.grid_kind, args.rows, args.cols, args.grid_history, args.page_interval)
 
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "AdvancedDashboard01")
@@ -201,10 +366,28 @@ def main():
         client.loop_start()
 
         print("📊 高度なダッシュボード起動")
-        print("💾 データは自動的に保存されます")
-        print("グラフウィンドウを閉じて終了")
+        print(f"💾 データは受信しながら保存されます: {csv_writer.path}")
+        print(f"🗂️  履歴 {args.history}件 | 間引き {args.decimation}")
+        if args.grid:
+            print(f"🔲 センサー一覧: {args.grid_kind} | {args.rows}×{args.cols} / ページ | "
+                  f"← → でページ切り替え（自動 {args.page_interval:g}秒）")
+        print("Ctrl+C で終了" if args.headless else "グラフウィンドウを閉じて終了")
         print("-" * 50)
 
+        if args.grid:
+            fig = plt.figure(figsize=(16, 10))
+            grid.build(fig)
+            fig.tight_layout(rect=(0, 0, 1, 0.95))
+            if args.headless:
+                run_headless(fig, grid.update, grid.init, args)
+            else:
+                ani = animation.FuncAnimation(
+                    fig, grid.update, init_func=grid.init,
+                    interval=1000, blit=False, cache_frame_data=False
+                )
+                plt.show()
+            return
+
         # グラフの初期化
         fig, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(14, 10))
 
@@ -226,26 +409,30 @@ def main():
 
         # 照度グラフ
         line3, = ax3.plot([], [], 'g-', linewidth=2, marker='o', markersize=3)
-        ax3.set_xlabel('データポイント', fontsize=10)
+        ax3.set_xlabel('経過時間 (分)', fontsize=10)
         ax3.set_ylabel('照度 (lux)', fontsize=10)
         ax3.grid(True, alpha=0.3)
 
         plt.tight_layout()
 
-        # アニメーション開始
-        ani = animation.FuncAnimation(
-            fig, update_plot, init_func=init_plot,
-            interval=1000, blit=True, cache_frame_data=False
-        )
+        if args.headless:
+            # 画面を使わずに一定間隔で描画してファイルに保存（線やタイトルは作り直さない）
+            run_headless(fig, update_plot, init_plot, args)
+        else:
+            # アニメーション開始（横軸の範囲が伸びていくので blit せずに全体を描き直す）
+            ani = animation.FuncAnimation(
+                fig, update_plot, init_func=init_plot,
+                interval=1000, blit=False, cache_frame_data=False
+            )
 
-        plt.show()
+            plt.show()
 
     except KeyboardInterrupt:
         print("\n🛑 ダッシュボードを停止します...")
 
     finally:
-        # データを保存
-        save_data_to_csv()
+        # 組み立て中の行を書き出してファイルを閉じる
+        close_csv()
 
         # クリーンアップ
         client.loop_stop()
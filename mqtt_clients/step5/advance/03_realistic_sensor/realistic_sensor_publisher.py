@@ -6,14 +6,27 @@
 - 慣性効果による滑らかな変化
 - 湿度と温度の相関
 - 照度の日内変動
+- シミュレーション時刻での生成（実時間・N倍速・最速）
+- 出力先: MQTT / CSV / JSON Lines / SQLite（data_logger.py と同じテーブル）
+- MQTT のペイロード形式: テキスト / バイナリ（common/codec.py、測定時刻付き）
+- MQTT の送信方法: 種別ごとのトピック / sensors/<ID>/batch にまとめる / 両方
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import csv
+import os
 import random
+import re
+import sqlite3
+import sys
 import time
 import math
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import FORMATS, encode_alert, encode_batch, encode_reading
 
 BROKER = "localhost"
 PORT = 1883
@@ -25,17 +38,18 @@ class RealisticTemperatureSensor:
     def __init__(self, base_temp=25.0):
         self.current_temp = base_temp
 
-    def get_base_temperature(self):
+    def get_base_temperature(self, hour=None):
         """時刻に応じた基準温度"""
-        hour = datetime.now().hour
+        if hour is None:
+            hour = datetime.now().hour
         # 正弦波で日内変動（午後2時頃に最高温度）
         # 午前6時: 約20°C、午後2時: 約28°C
         base = 24.0 + 4.0 * math.sin(math.pi * (hour - 6) / 12)
         return base
 
-    def generate_temperature(self):
+    def generate_temperature(self, hour=None):
         """リアルな温度生成"""
-        base = self.get_base_temperature()
+        base = self.get_base_temperature(hour)
 
         # 基準温度に徐々に近づく（慣性効果）
         self.current_temp += (base - self.current_temp) * 0.1
@@ -79,9 +93,10 @@ class RealisticLightSensor:
     def __init__(self, base_light=500):
         self.current_light = base_light
 
-    def generate_light(self):
+    def generate_light(self, hour=None):
         """リアルな照度生成（時刻依存）"""
-        hour = datetime.now().hour
+        if hour is None:
+            hour = datetime.now().hour
 
         # 日中（6時〜18時）は高照度
         if 6 <= hour < 18:
@@ -102,115 +117,374 @@ class RealisticLightSensor:
 
         return int(self.current_light)
 
-def on_connect(client, userdata, flags, rc):
-    """接続時のコールバック"""
-    if rc == 0:
-        # ステータスをRetainで送信
-        client.publish(f"sensors/{SENSOR_ID}/status", "ONLINE", qos=1, retain=True)
-        print("✅ リアルセンサーシステム起動完了")
-        print(f"📡 ブローカー: {BROKER}:{PORT}")
-        print("🌡️  温度モデル: 時刻依存 + 慣性効果 + ノイズ")
-        print("💧 湿度モデル: 温度逆相関 + ノイズ")
-        print("💡 照度モデル: 日内変動 + ノイズ")
-        print("-" * 50)
-    else:
-        print(f"❌ 接続失敗: {rc}")
+class FleetModels:
+    """複数台分（common/sensor_models.py の配列版モデル）"""
 
-def check_alert(client, sensor_type, value):
-    """異常値チェックとアラート送信"""
-    alert = None
+    def __init__(self, count, seed=None):
+        import numpy as np
+        from common.sensor_models import RealisticSensorArray
 
+        rng = np.random.default_rng(seed)
+        self.np = np
+        self.models = RealisticSensorArray(count, rng=rng, temp_offset=rng.normal(0.0, 1.5, count))
+
+    def step(self, hour):
+        temp, humid, light = self.models.step(hour)
+        np = self.np
+        return np.round(temp, 2).tolist(), np.round(humid, 1).tolist(), light.astype(int).tolist()
+
+class SingleModels:
+    """1台分（上のクラスをそのまま使う）"""
+
+    def __init__(self, seed=None):
+        if seed is not None:
+            random.seed(seed)
+        self.temp_sensor = RealisticTemperatureSensor(base_temp=25.0)
+        self.humid_sensor = RealisticHumiditySensor(base_humid=50.0)
+        self.light_sensor = RealisticLightSensor(base_light=500)
+
+    def step(self, hour):
+        temp = self.temp_sensor.generate_temperature(hour)
+        humid = self.humid_sensor.generate_humidity(temp)  # 温度を渡す
+        light = self.light_sensor.generate_light(hour)
+        return [temp], [humid], [light]
+
+def get_alert(sensor_type, value):
+    """異常値チェック（アラート名、なければ None）"""
     if sensor_type == "temperature":
         if value > 30.0:
-            alert = "高温警報"
-        elif value < 18.0:
-            alert = "低温警報"
+            return "高温警報"
+        if value < 18.0:
+            return "低温警報"
 
     elif sensor_type == "humidity":
         if value > 70.0:
-            alert = "高湿度警報"
-        elif value < 30.0:
-            alert = "低湿度警報"
-
-    if alert:
+            return "高湿度警報"
+        if value < 30.0:
+            return "低湿度警報"
+
+    return None
+
+# ---- 出力先 ----
+
+class MqttOutput:
+    """MQTTブローカーへ送信"""
+
+    def __init__(self, sensor_ids, payload_format="text", send_format="split", samples=1):
+        self.sensor_ids = sensor_ids
+        self.payload_format = payload_format
+        self.split = send_format in ("split", "both")
+        self.batch = send_format in ("batch", "both")
+        self.samples = samples
+        self.pending = [[] for _ in sensor_ids]     # センサーごとの送信待ちサンプル
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, sensor_ids[0])
+        if len(sensor_ids) == 1:
+            # Last Will設定
+            self.client.will_set(f"sensors/{sensor_ids[0]}/status", "OFFLINE", qos=1, retain=True)
+        self.client.user_data_set(sensor_ids)
+        self.client.on_connect = on_connect
+        self.client.connect(BROKER, PORT, 60)
+        self.client.loop_start()
+
+    def write(self, timestamp, temps, humids, lights):
+        # データ送信（QoS 0: 高速）。バイナリ形式ではシミュレーション時刻を測定時刻として送る
+        fmt = self.payload_format
+        ts = timestamp.timestamp()
+        for i, (sensor_id, temp, humid, light) in enumerate(zip(self.sensor_ids, temps, humids, lights)):
+            if self.batch:
+                # 全種別を1サンプルにまとめ、samples 件たまったら1メッセージで送信
+                # （both では受信側が batch を先に知るよう、種別ごとのトピックより先に送る）
+                pending = self.pending[i]
+                pending.append({"timestamp": ts, "temperature": temp, "humidity": humid, "light": light})
+                if len(pending) >= self.samples:
+                    self.flush_batch(i)
+            if self.split:
+                self.client.publish(f"sensors/{sensor_id}/temperature",
+                                    encode_reading("temperature", temp, fmt, ts), qos=0)
+                self.client.publish(f"sensors/{sensor_id}/humidity",
+                                    encode_reading("humidity", humid, fmt, ts), qos=0)
+                self.client.publish(f"sensors/{sensor_id}/light",
+                                    encode_reading("light", light, fmt, ts), qos=0)
+
+    def flush_batch(self, i):
+        """送信待ちのサンプルを batch で送信"""
+        if self.pending[i]:
+            self.client.publish(f"sensors/{self.sensor_ids[i]}/batch",
+                                encode_batch(self.pending[i], self.payload_format), qos=0)
+            self.pending[i] = []
+
+    def alert(self, sensor_id, sensor_type, value, alert, timestamp):
         alert_data = {
-            "sensor_id": SENSOR_ID,
+            "sensor_id": sensor_id,
             "type": sensor_type,
             "value": value,
             "alert": alert,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp.isoformat()
         }
 
         # アラートはQoS 2で確実に送信
-        client.publish(
+        self.client.publish(
             f"alerts/{sensor_type}",
-            json.dumps(alert_data, ensure_ascii=False),
+            encode_alert(alert_data, self.payload_format),
             qos=2
         )
-        print(f"🚨 {alert}: {value}")
 
-def main():
-    # センサーインスタンス作成
-    temp_sensor = RealisticTemperatureSensor(base_temp=25.0)
-    humid_sensor = RealisticHumiditySensor(base_humid=50.0)
-    light_sensor = RealisticLightSensor(base_light=500)
+    def close(self):
+        for i in range(len(self.sensor_ids)):
+            self.flush_batch(i)
+        # 正常停止時もステータスを更新
+        for sensor_id in self.sensor_ids:
+            self.client.publish(f"sensors/{sensor_id}/status", "OFFLINE", qos=1, retain=True)
+        time.sleep(0.5)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+class CsvOutput:
+    """CSV（data_exporter.py と同じ列）"""
+
+    def __init__(self, path, sensor_ids):
+        self.sensor_ids = sensor_ids
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["timestamp", "sensor_id", "temperature", "humidity", "light"])
+
+    def write(self, timestamp, temps, humids, lights):
+        ts = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        self.writer.writerows(
+            (ts, sensor_id, temp, humid, light)
+            for sensor_id, temp, humid, light in zip(self.sensor_ids, temps, humids, lights)
+        )
 
-    # クライアント作成
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, SENSOR_ID)
+    def alert(self, sensor_id, sensor_type, value, alert, timestamp):
+        pass
 
-    # Last Will設定
-    client.will_set(f"sensors/{SENSOR_ID}/status", "OFFLINE", qos=1, retain=True)
+    def close(self):
+        self.file.close()
 
-    client.on_connect = on_connect
+class JsonLinesOutput:
+    """1行1サンプルのJSON"""
 
-    try:
-        client.connect(BROKER, PORT, 60)
-        client.loop_start()
+    def __init__(self, path, sensor_ids):
+        self.sensor_ids = sensor_ids
+        self.file = open(path, 'w', encoding='utf-8')
 
-        print("🌡️  リアルセンサー稼働中...")
-        print("センサー: 温度、湿度、照度（リアルモデル）")
-        print("Ctrl+C で停止")
-        print("-" * 50)
+    def write(self, timestamp, temps, humids, lights):
+        ts = timestamp.isoformat()
+        self.file.writelines(
+            f'{{"timestamp": "{ts}", "sensor_id": "{sensor_id}", "temperature": {temp}, '
+            f'"humidity": {humid}, "light": {light}}}\n'
+            for sensor_id, temp, humid, light in zip(self.sensor_ids, temps, humids, lights)
+        )
 
-        while True:
-            # 現在時刻を取得
-            now = datetime.now()
-            hour = now.hour
-            minute = now.minute
+    def alert(self, sensor_id, sensor_type, value, alert, timestamp):
+        record = {"timestamp": timestamp.isoformat(), "sensor_id": sensor_id,
+                  "type": sensor_type, "value": value, "alert": alert}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class SqliteOutput:
+    """SQLite（data_logger.py の sensor_data / alerts テーブル）にまとめて書き込む"""
+
+    BATCH = 10000
+
+    def __init__(self, path, sensor_ids):
+        self.sensor_ids = sensor_ids
+        self.conn = sqlite3.connect(path)
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sensor_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sensor_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                data_type TEXT NOT NULL,
+                value REAL NOT NULL,
+                unit TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sensor_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                alert_type TEXT NOT NULL,
+                value REAL NOT NULL,
+                message TEXT
+            )
+        ''')
+        self.conn.commit()
+        self.rows = []
+        self.alerts = []
+
+    def write(self, timestamp, temps, humids, lights):
+        ts = timestamp.isoformat()
+        rows = self.rows
+        for sensor_id, temp, humid, light in zip(self.sensor_ids, temps, humids, lights):
+            rows.append((sensor_id, ts, "temperature", temp, "°C"))
+            rows.append((sensor_id, ts, "humidity", humid, "%"))
+            rows.append((sensor_id, ts, "light", light, "lux"))
+        if len(rows) >= self.BATCH:
+            self.flush()
+
+    def alert(self, sensor_id, sensor_type, value, alert, timestamp):
+        self.alerts.append((sensor_id, timestamp.isoformat(), sensor_type, value, alert))
+
+    def flush(self):
+        # 1件ずつ commit せず、まとめて1トランザクションで書き込む
+        with self.conn:
+            self.conn.executemany('''
+                INSERT INTO sensor_data (sensor_id, timestamp, data_type, value, unit)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self.rows)
+            self.conn.executemany('''
+                INSERT INTO alerts (sensor_id, timestamp, alert_type, value, message)
+                VALUES (?, ?, ?, ?, ?)
+            ''', self.alerts)
+        self.rows = []
+        self.alerts = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+def open_output(output, sensor_ids, args):
+    """出力先を開く（mqtt / *.csv / *.jsonl / *.db, *.sqlite）"""
+    if output == "mqtt":
+        return MqttOutput(sensor_ids, args.payload, args.format, args.samples)
+    if output.endswith(".csv"):
+        return CsvOutput(output, sensor_ids)
+    if output.endswith((".jsonl", ".json")):
+        return JsonLinesOutput(output, sensor_ids)
+    if output.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteOutput(output, sensor_ids)
+    raise SystemExit(f"❌ 出力先の形式が不明です: {output}")
+
+def parse_duration(text):
+    """期間（例: 90, 30m, 12h, 7d）を秒に変換"""
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([smhdw]?)\s*", text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"期間の形式が不正です: {text}")
+    units = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    return float(match.group(1)) * units[match.group(2)]
 
-            # 各センサーの値を生成
-            temp = temp_sensor.generate_temperature()
-            humid = humid_sensor.generate_humidity(temp)  # 温度を渡す
-            light = light_sensor.generate_light()
+def on_connect(client, userdata, flags, rc):
+    """接続時のコールバック"""
+    if rc == 0:
+        # ステータスをRetainで送信
+        for sensor_id in userdata:
+            client.publish(f"sensors/{sensor_id}/status", "ONLINE", qos=1, retain=True)
+        print("✅ リアルセンサーシステム起動完了")
+        print(f"📡 ブローカー: {BROKER}:{PORT}")
+        print("🌡️  温度モデル: 時刻依存 + 慣性効果 + ノイズ")
+        print("💧 湿度モデル: 温度逆相関 + ノイズ")
+        print("💡 照度モデル: 日内変動 + ノイズ")
+        print("-" * 50)
+    else:
+        print(f"❌ 接続失敗: {rc}")
 
-            # データ送信（QoS 0: 高速）
-            client.publish(f"sensors/{SENSOR_ID}/temperature", str(temp), qos=0)
-            client.publish(f"sensors/{SENSOR_ID}/humidity", str(humid), qos=0)
-            client.publish(f"sensors/{SENSOR_ID}/light", str(light), qos=0)
+def main():
+    global BROKER, PORT
+
+    parser = argparse.ArgumentParser(description="リアルなセンサーシミュレーター")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="時間の進み方（1: 実時間、60: 60倍速、0: 最速）")
+    parser.add_argument("--start", help="シミュレーション開始日時（例: 2025-01-01T00:00）")
+    parser.add_argument("--duration", type=parse_duration,
+                        help="シミュレーションする期間（例: 3600, 30m, 12h, 7d）")
+    parser.add_argument("--interval", type=float, default=1.0, help="サンプル間隔（シミュレーション上の秒）")
+    parser.add_argument("--sensors", type=int, default=1, help="センサー台数（2台以上は numpy の配列版モデル）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    parser.add_argument("--output", default="mqtt",
+                        help="出力先: mqtt / ファイル名（.csv, .jsonl, .db）")
+    parser.add_argument("--payload", choices=FORMATS, default="text",
+                        help="MQTTのペイロード形式（text: 数値の文字列とJSON、binary: 固定長のバイナリ）")
+    parser.add_argument("--format", choices=["split", "batch", "both"], default="split",
+                        help="MQTTの送信方法（split: 種別ごとのトピック、batch: sensors/<ID>/batch にまとめる、both: 両方）")
+    parser.add_argument("--samples", type=int, default=1, help="batch で1メッセージにまとめるサンプル数")
+    args = parser.parse_args()
+    BROKER, PORT = args.host, args.port
 
-            # 異常値チェック
-            check_alert(client, "temperature", temp)
-            check_alert(client, "humidity", humid)
+    # センサーインスタンス作成
+    if args.sensors == 1:
+        sensor_ids = [SENSOR_ID]
+        models = SingleModels(args.seed)
+    else:
+        sensor_ids = [f"{SENSOR_ID}-{i:04d}" for i in range(args.sensors)]
+        models = FleetModels(args.sensors, args.seed)
+
+    sim_start = datetime.fromisoformat(args.start) if args.start else datetime.now()
+    steps = int(args.duration / args.interval) if args.duration else None
+    live = args.speed == 1.0 and args.sensors == 1 and args.output == "mqtt"
+
+    output = open_output(args.output, sensor_ids, args)
+
+    print("🌡️  リアルセンサー稼働中...")
+    print("センサー: 温度、湿度、照度（リアルモデル）")
+    if not live:
+        speed = "最速" if args.speed == 0 else f"{args.speed:g}倍速"
+        period = f"{args.duration / 86400:g}日分" if args.duration else "停止まで"
+        print(f"⏩ シミュレーション: {sim_start.isoformat()} から {period} | {args.interval:g}秒間隔 | "
+              f"{speed} | {args.sensors}台 → {args.output}")
+    print("Ctrl+C で停止")
+    print("-" * 50)
+
+    wall_start = time.monotonic()
+    next_progress = wall_start + 1.0
+    step = 0
+    alerts = 0
+
+    try:
+        while steps is None or step < steps:
+            # シミュレーション時刻（実時間モードでは現在時刻と同じ進み方）
+            now = sim_start + timedelta(seconds=step * args.interval)
+            if args.speed > 0:
+                delay = wall_start + step * args.interval / args.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
 
-            # コンソール出力（時刻付き）
-            timestamp = now.strftime("%H:%M:%S")
-            print(f"[{timestamp}] 🌡️ {temp}°C | 💧 {humid}% | 💡 {light} lux | ⏰ {hour:02d}:{minute:02d}")
+            hour = now.hour
+            temps, humids, lights = models.step(hour)
+            output.write(now, temps, humids, lights)
 
-            time.sleep(1)
+            # 異常値チェック
+            for sensor_id, temp, humid in zip(sensor_ids, temps, humids):
+                for sensor_type, value in (("temperature", temp), ("humidity", humid)):
+                    alert = get_alert(sensor_type, value)
+                    if alert:
+                        output.alert(sensor_id, sensor_type, value, alert, now)
+                        alerts += 1
+                        if live:
+                            print(f"🚨 {alert}: {value}")
+            step += 1
+
+            if live:
+                # コンソール出力（時刻付き）
+                timestamp = now.strftime("%H:%M:%S")
+                print(f"[{timestamp}] 🌡️ {temps[0]}°C | 💧 {humids[0]}% | 💡 {lights[0]} lux | "
+                      f"⏰ {hour:02d}:{now.minute:02d}")
+            elif time.monotonic() >= next_progress:
+                elapsed = time.monotonic() - wall_start
+                simulated = step * args.interval
+                print(f"⏩ {now.strftime('%Y-%m-%d %H:%M')} | {step * len(sensor_ids)}サンプル | "
+                      f"{simulated / elapsed:,.0f}倍速 | アラート {alerts}件")
+                next_progress += 1.0
 
     except KeyboardInterrupt:
         print("\n🛑 センサーシステムを停止します...")
-        # 正常停止時もステータスを更新
-        client.publish(f"sensors/{SENSOR_ID}/status", "OFFLINE", qos=1, retain=True)
-        time.sleep(0.5)
-        client.loop_stop()
-        client.disconnect()
-        print("✅ 停止完了")
 
     except Exception as e:
         print(f"❌ エラー: {e}")
-        client.loop_stop()
-        client.disconnect()
+
+    output.close()
+    elapsed = time.monotonic() - wall_start
+    if not live:
+        simulated = step * args.interval
+        print(f"📊 {simulated / 86400:.2f}日分 / {step * len(sensor_ids)}サンプル / アラート {alerts}件を "
+              f"{elapsed:.1f}秒で生成（{simulated / elapsed if elapsed > 0 else 0:,.0f}倍速）")
+    print("✅ 停止完了")
 
 if __name__ == "__main__":
     main()
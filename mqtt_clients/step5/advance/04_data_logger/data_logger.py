@@ -10,8 +10,13 @@ MQTTデータロガー
 import paho.mqtt.client as mqtt
 import sqlite3
 from datetime import datetime
-import json
+import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import SampleReader, decode_alert, is_reading_topic
+from common.console_log import add_log_arguments, from_args
 
 BROKER = "localhost"
 PORT = 1883
@@ -124,6 +129,8 @@ class DataLogger:
 
 # グローバル変数
 logger = None
+console = None
+reader = SampleReader()     # split / batch の両方から測定値を取り出す
 
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
@@ -146,7 +153,7 @@ def on_message(client, userdata, msg):
     global logger
 
     topic = msg.topic
-    payload = msg.payload.decode()
+    payload = msg.payload
 
     try:
         # トピックからセンサーIDを抽出
@@ -156,48 +163,52 @@ def on_message(client, userdata, msg):
 
         sensor_id = parts[1]
 
-        # 温度データ
-        if "temperature" in topic and "alerts" not in topic:
-            temp = float(payload)
-            logger.log_sensor_data(sensor_id, "temperature", temp, "°C")
-            print(f"📝 記録: {sensor_id} - 温度 {temp}°C")
-
-        # 湿度データ
-        elif "humidity" in topic and "alerts" not in topic:
-            humid = float(payload)
-            logger.log_sensor_data(sensor_id, "humidity", humid, "%")
-            print(f"📝 記録: {sensor_id} - 湿度 {humid}%")
-
-        # 照度データ
-        elif "light" in topic and "alerts" not in topic:
-            light = float(payload)
-            logger.log_sensor_data(sensor_id, "light", light, "lux")
-            print(f"📝 記録: {sensor_id} - 照度 {light} lux")
+        # センサーデータ（種別ごとのトピック・batch のどちらも1件ずつ取り出す）
+        if is_reading_topic(topic):
+            for sensor_id, sensor_type, value, _ in reader.readings(topic, payload):
+                # 温度データ
+                if sensor_type == "temperature":
+                    logger.log_sensor_data(sensor_id, "temperature", value, "°C")
+                    console.info(f"{sensor_id}/temperature", "📝 記録: {} - 温度 {}°C",
+                                 sensor_id, value, value=value, unit="°C")
+
+                # 湿度データ
+                elif sensor_type == "humidity":
+                    logger.log_sensor_data(sensor_id, "humidity", value, "%")
+                    console.info(f"{sensor_id}/humidity", "📝 記録: {} - 湿度 {}%",
+                                 sensor_id, value, value=value, unit="%")
+
+                # 照度データ
+                elif sensor_type == "light":
+                    logger.log_sensor_data(sensor_id, "light", value, "lux")
+                    console.info(f"{sensor_id}/light", "📝 記録: {} - 照度 {} lux",
+                                 sensor_id, value, value=value, unit=" lux")
 
         # ステータス
         elif "status" in topic:
-            logger.log_status(sensor_id, payload)
-            emoji = "🟢" if payload == "ONLINE" else "🔴"
-            print(f"📝 記録: {sensor_id} - ステータス {emoji} {payload}")
+            status = payload.decode()
+            logger.log_status(sensor_id, status)
+            emoji = "🟢" if status == "ONLINE" else "🔴"
+            console.important("📝 記録: {} - ステータス {} {}", sensor_id, emoji, status)
 
         # アラート
         elif "alerts" in topic:
             try:
-                alert_data = json.loads(payload)
+                alert_data = decode_alert(payload)
                 logger.log_alert(
                     alert_data.get("sensor_id", sensor_id),
                     alert_data.get("type", "unknown"),
                     alert_data.get("value", 0),
                     alert_data.get("alert", "")
                 )
-                print(f"🚨 記録: アラート - {alert_data.get('alert', '')}")
-            except json.JSONDecodeError:
-                print(f"⚠️  アラートのパースに失敗: {payload}")
+                console.important("🚨 記録: アラート - {}", alert_data.get('alert', ''))
+            except ValueError:
+                console.important("⚠️  アラートのパースに失敗: {}", payload)
 
     except ValueError as e:
-        print(f"⚠️  データのパースに失敗: {e}")
+        console.important("⚠️  データのパースに失敗: {}", e)
     except Exception as e:
-        print(f"❌ エラー: {e}")
+        console.important("❌ エラー: {}", e)
 
 def print_statistics():
     """統計情報を表示"""
@@ -224,7 +235,14 @@ def print_statistics():
     print("=" * 50)
 
 def main():
-    global logger
+    global logger, console
+
+    parser = argparse.ArgumentParser(description="MQTTデータロガー")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+
+    # コンソール出力（バックグラウンドで書き出し）
+    console = from_args(args)
 
     # データロガー初期化
     logger = DataLogger(DB_PATH)
@@ -239,6 +257,7 @@ def main():
         client.loop_forever()
 
     except KeyboardInterrupt:
+        console.close()
         print("\n\n🛑 データロガーを停止します...")
         print_statistics()
 
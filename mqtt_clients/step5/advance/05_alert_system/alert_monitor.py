@@ -5,21 +5,37 @@
 - センサーデータの異常値を監視
 - アラートの受信と表示
 - センサーのダウン検知
+- データ途絶（ハング）の検知
 """
 
 import paho.mqtt.client as mqtt
 from datetime import datetime
-import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import decode_alert
+from common.liveness import LivenessTracker, load_intervals
 
 BROKER = "localhost"
 PORT = 1883
 
+# センサーごとの送信間隔（interval）を読む設定ファイル
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '09_config_based_system', 'config.json')
+
+# 設定にないセンサーの想定送信間隔（秒）
+DEFAULT_INTERVAL = 1.0
+
 # アラート履歴
 alert_history = []
 
 # センサーステータス
 sensor_status = {}
 
+# データ受信による死活監視
+liveness = None
+
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
     if rc == 0:
@@ -27,8 +43,9 @@ def on_connect(client, userdata, flags, rc):
         print(f"📡 {BROKER}:{PORT}")
         # アラートとステータスを購読
         client.subscribe("alerts/#", qos=2)
-        client.subscribe("sensors/+/status", qos=1)
-        print("📥 トピック購読: alerts/#, sensors/+/status")
+        # ステータスに加えてデータも購読し、最終受信時刻を記録する
+        client.subscribe("sensors/#", qos=1)
+        print("📥 トピック購読: alerts/#, sensors/#")
         print("-" * 50)
         print("🚨 アラート監視システム起動")
         print("Ctrl+C で停止")
@@ -39,13 +56,12 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """メッセージ受信時のコールバック"""
     topic = msg.topic
-    payload = msg.payload.decode()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # アラート受信
     if "alerts" in topic:
         try:
-            alert_data = json.loads(payload)
+            alert_data = decode_alert(msg.payload)
             sensor_id = alert_data.get("sensor_id", "Unknown")
             alert_type = alert_data.get("type", "unknown")
             value = alert_data.get("value", 0)
@@ -83,11 +99,12 @@ def on_message(client, userdata, msg):
                 elif "低湿度" in alert_msg:
                     print("💡 対処: 加湿器を使用してください")
 
-        except json.JSONDecodeError:
-            print(f"⚠️  アラートのパースに失敗: {payload}")
+        except ValueError:
+            print(f"⚠️  アラートのパースに失敗: {msg.payload}")
 
     # ステータス変更
     elif "status" in topic:
+        payload = msg.payload.decode()
         # トピックからセンサーIDを抽出
         parts = topic.split('/')
         sensor_id = parts[1] if len(parts) >= 2 else "Unknown"
@@ -107,6 +124,37 @@ def on_message(client, userdata, msg):
                 print(f"⚠️  {sensor_id} のダウンを検知しました！")
                 print(f"💡 対処: センサーの状態を確認してください\n")
 
+        if payload == "ONLINE":
+            liveness.touch(sensor_id)
+        elif payload == "OFFLINE":
+            # Last Will / 正常停止で既に検知済みなので沈黙監視は不要
+            liveness.forget(sensor_id)
+
+    # センサーデータ（最終受信時刻のみ記録）
+    elif topic.startswith("sensors/"):
+        parts = topic.split('/')
+        if len(parts) >= 3:
+            liveness.touch(parts[1])
+
+def on_silence(sensor_id, silence):
+    """データ途絶を検知したときのコールバック"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    alert_history.append({
+        "timestamp": timestamp,
+        "sensor_id": sensor_id,
+        "type": "silence",
+        "value": round(silence, 1),
+        "message": f"{silence:.1f}秒間データなし"
+    })
+    print(f"\n🟡 [{timestamp}] {sensor_id} から {silence:.1f}秒間データが届いていません")
+    print(f"⚠️  接続は維持されたままハングしている可能性があります")
+    print(f"💡 対処: センサーの状態を確認してください\n")
+
+def on_recover(sensor_id):
+    """データ途絶から復帰したときのコールバック"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"\n🟢 [{timestamp}] {sensor_id} のデータ受信が再開しました")
+
 def print_summary():
     """サマリーを表示"""
     print("\n" + "=" * 50)
@@ -138,9 +186,37 @@ def print_summary():
         emoji = "🟢" if status == "ONLINE" else "🔴"
         print(f"  {emoji} {sensor_id}: {status}")
 
+    # データ受信状況
+    print("\n【データ受信状況】")
+    for sensor_id in sorted(liveness.last_seen):
+        silence = liveness.silence(sensor_id)
+        emoji = "🟢" if liveness.is_alive(sensor_id) else "🟡"
+        print(f"  {emoji} {sensor_id}: 最終受信 {silence:.1f}秒前")
+
     print("=" * 50)
 
+def create_liveness_tracker():
+    """設定ファイルの送信間隔を読み込んだ死活監視を作成"""
+    tracker = LivenessTracker(
+        default_interval=DEFAULT_INTERVAL,
+        on_timeout=on_silence,
+        on_recover=on_recover
+    )
+
+    if os.path.exists(CONFIG_PATH):
+        for sensor_id, interval in load_intervals(CONFIG_PATH).items():
+            tracker.set_interval(sensor_id, interval)
+        print(f"⏱️  送信間隔を読み込みました: {CONFIG_PATH}")
+
+    return tracker
+
 def main():
+    global liveness
+
+    # 死活監視を開始
+    liveness = create_liveness_tracker()
+    liveness.start()
+
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "AlertMonitor01")
     client.on_connect = on_connect
@@ -156,6 +232,7 @@ def main():
 
     finally:
         # クリーンアップ
+        liveness.stop()
         client.disconnect()
         print("\n✅ 停止完了")
 
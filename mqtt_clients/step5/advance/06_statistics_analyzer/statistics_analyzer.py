@@ -11,9 +11,14 @@
 import paho.mqtt.client as mqtt
 from collections import deque
 from datetime import datetime
+import os
+import sys
 import time
 import threading
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import SampleReader
+
 try:
     import numpy as np
     HAS_NUMPY = True
@@ -30,6 +35,9 @@ temp_data = deque(maxlen=3600)
 humid_data = deque(maxlen=3600)
 light_data = deque(maxlen=3600)
 
+# 種別ごとのトピックと batch の両方から測定値を取り出す
+reader = SampleReader()
+
 # 分析開始時刻
 start_time = None
 running = True
@@ -55,20 +63,18 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """メッセージ受信時のコールバック"""
     topic = msg.topic
-    payload = msg.payload.decode()
+    payload = msg.payload
 
     try:
-        if "temperature" in topic and "alerts" not in topic:
-            temp = float(payload)
-            temp_data.append(temp)
+        for _, sensor_type, value, _ in reader.readings(topic, payload):
+            if sensor_type == "temperature":
+                temp_data.append(value)
 
-        elif "humidity" in topic and "alerts" not in topic:
-            humid = float(payload)
-            humid_data.append(humid)
+            elif sensor_type == "humidity":
+                humid_data.append(value)
 
-        elif "light" in topic and "alerts" not in topic:
-            light = float(payload)
-            light_data.append(light)
+            elif sensor_type == "light":
+                light_data.append(value)
 
     except ValueError:
         pass
@@ -0,0 +1,229 @@
+"""
+デバイスグループへの一斉コマンド送信
+
+機能:
+- 送信先をデバイスIDの一覧・一覧ファイル・タグ・IDのパターン（ワイルドカード）で指定
+- タグとパターンは devices/+/info（Retain）からデバイスを見つけて絞り込む
+- 相関ID付きのコマンド（common/rpc.py）を応答待ちの上限（--window）まで続けて送信
+- 全デバイスの応答を待って、成功・タイムアウト・失敗の件数と往復時間 p50 / p99 を集計
+- 1台ずつ送って待つのではなく、送信と応答待ちを重ねるので数千台でも数秒で終わる
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.rpc import CommandTimeout, RpcClient, format_stats
+
+BROKER = "localhost"
+PORT = 1883
+
+COMMANDS = ["power", "set-temp", "mode", "status"]
+
+def load_device_file(path):
+    """1行1デバイスIDの一覧ファイル（空行と # 以降は無視）"""
+    devices = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            device_id = line.split('#', 1)[0].strip()
+            if device_id:
+                devices.append(device_id)
+    return devices
+
+def discover_devices(client, seconds):
+    """devices/+/info（Retain）を受けて {デバイスID: タグの集合} を返す"""
+    found = {}
+    lock = threading.Lock()
+
+    def on_info(client, userdata, msg):
+        try:
+            info = json.loads(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(info, dict):
+            return
+        device_id = info.get("device_id") or msg.topic.split('/')[1]
+        with lock:
+            found[device_id] = set(info.get("tags") or [])
+
+    client.message_callback_add("devices/+/info", on_info)
+    client.subscribe("devices/+/info", qos=1)
+    # Retain のメッセージは購読直後にまとめて届くので、届かなくなるまで待つ
+    deadline = time.monotonic() + seconds
+    last_count = -1
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        with lock:
+            count = len(found)
+        if count == last_count and count > 0:
+            break
+        last_count = count
+    client.unsubscribe("devices/+/info")
+    client.message_callback_remove("devices/+/info")
+    with lock:
+        return dict(found)
+
+def select_targets(args, client):
+    """オプションから送信先のデバイスIDの一覧を作る"""
+    targets = []
+    if args.devices:
+        targets += [d for d in args.devices.split(",") if d]
+    if args.devices_file:
+        targets += load_device_file(args.devices_file)
+    if args.tag or args.match:
+        found = discover_devices(client, args.discover)
+        print(f"🔍 devices/+/info から {len(found)}台を発見")
+        tags = set(args.tag or [])
+        for device_id, device_tags in sorted(found.items()):
+            if tags and not tags <= device_tags:
+                continue
+            if args.match and not fnmatch.fnmatchcase(device_id, args.match):
+                continue
+            targets.append(device_id)
+    # 重複を除く（指定順は保つ）
+    return list(dict.fromkeys(targets))
+
+def fan_out(rpc, targets, command, value, window, timeout, margin=2.0):
+    """応答待ちが window 件を超えないように送り続け、全件の結果を返す
+
+    完了の通知が届かない場合でも、最後の送信から timeout + margin 秒で待つのをやめ、
+    結果のないデバイスはタイムアウトとして返します。
+    """
+    slots = threading.Semaphore(window)
+    results = {}
+    lock = threading.Lock()
+    done = threading.Event()
+    remaining = [len(targets)]
+
+    def on_done(future, device_id):
+        if future.exception is None:
+            outcome = "ok"
+        elif isinstance(future.exception, CommandTimeout):
+            outcome = "timeout"
+        else:
+            outcome = "failed"
+        with lock:
+            results[device_id] = (outcome, future.latency, future.exception)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                done.set()
+        slots.release()
+
+    if not targets:
+        return results
+    for device_id in targets:
+        # 枠はコマンドの期限で必ず返るはずなので、それより長く空かなければ送信をやめる
+        if not slots.acquire(timeout=timeout + margin):
+            break
+        future = rpc.call(f"devices/{device_id}/commands/{command}", value, timeout)
+        future.add_done_callback(lambda f, d=device_id: on_done(f, d))
+    done.wait(timeout + margin)
+    with lock:
+        for device_id in targets:
+            if device_id not in results:
+                results[device_id] = ("timeout", None, CommandTimeout(f"{device_id}: 結果が届きません"))
+        return dict(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="デバイスグループへの一斉コマンド送信")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--command", choices=COMMANDS, required=True, help="コマンドの種類")
+    parser.add_argument("--value", default="request", help="コマンドの値（例: ON, 24.0, cool）")
+    parser.add_argument("--devices", help="送信先のデバイスID（カンマ区切り）")
+    parser.add_argument("--devices-file", help="送信先のデバイスID一覧ファイル（1行1台）")
+    parser.add_argument("--tag", action="append",
+                        help="このタグを持つデバイスに送る（複数指定ですべてのタグを持つデバイス）")
+    parser.add_argument("--match", help="デバイスIDのパターン（例: floor3-*）")
+    parser.add_argument("--discover", type=float, default=3.0,
+                        help="--tag / --match のとき devices/+/info を待つ最大秒数")
+    parser.add_argument("--window", type=int, default=500, help="同時に応答を待つコマンド数の上限")
+    parser.add_argument("--timeout", type=float, default=10.0, help="1コマンドの応答を待つ秒数")
+    parser.add_argument("--qos", type=int, default=2, choices=[0, 1, 2], help="コマンドのQoS")
+    parser.add_argument("--output", help="デバイスごとの結果の保存先（JSON）")
+    args = parser.parse_args()
+    if not (args.devices or args.devices_file or args.tag or args.match):
+        parser.error("--devices / --devices-file / --tag / --match のいずれかを指定してください")
+
+    client_id = f"BulkCommand-{os.getpid()}"
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id)
+    # 応答待ちの上限まで PUBLISH を続けて送れるように、QoS 1 / 2 の送信中の上限を揃える
+    client.max_inflight_messages_set(args.window)
+    rpc = RpcClient(client, client_id, qos=args.qos, timeout=args.timeout)
+    connected = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            rpc.subscribe()
+            connected.set()
+        else:
+            print(f"❌ 接続失敗: {rc}")
+
+    client.on_connect = on_connect
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    if not connected.wait(10):
+        print("❌ ブローカーに接続できません")
+        client.loop_stop()
+        return
+    print(f"✅ ブローカーに接続: {args.host}:{args.port}")
+
+    targets = select_targets(args, client)
+    if not targets:
+        print("⚠️  送信先のデバイスがありません")
+        client.loop_stop()
+        client.disconnect()
+        return
+
+    print(f"📤 {len(targets)}台に {args.command} = {args.value} を送信 "
+          f"(同時 {args.window}件まで, QoS {args.qos}, タイムアウト {args.timeout:g}秒)")
+    print("-" * 80)
+
+    # 期限切れの確認はバックグラウンドで行う（応答がないデバイスも枠を返す）
+    rpc.start()
+    start = time.monotonic()
+    try:
+        results = fan_out(rpc, targets, args.command, args.value, args.window, args.timeout)
+    except KeyboardInterrupt:
+        print("\n🛑 中断しました")
+        results = {}
+    elapsed = time.monotonic() - start
+    rpc.close()
+
+    counts = {"ok": 0, "timeout": 0, "failed": 0}
+    for outcome, _, _ in results.values():
+        counts[outcome] += 1
+    stats = rpc.stats()
+    print(f"✅ 成功 {counts['ok']} | ⏱️  タイムアウト {counts['timeout']} | ❌ 失敗 {counts['failed']} "
+          f"/ {len(targets)}台 | {elapsed:.2f}秒（{len(results) / elapsed:.0f}台/秒）")
+    print(f"📊 {format_stats(stats)}")
+    failures = [(d, r) for d, r in results.items() if r[0] != "ok"]
+    for device_id, (outcome, _, exception) in failures[:10]:
+        print(f"   {'⏱️ ' if outcome == 'timeout' else '❌'} {device_id}: {exception}")
+    if len(failures) > 10:
+        print(f"   ... ほか {len(failures) - 10}台")
+
+    if args.output:
+        report = {
+            "command": args.command, "value": args.value, "targets": len(targets),
+            "elapsed_s": round(elapsed, 3), "counts": counts, "rpc": stats,
+            "devices": {d: {"outcome": outcome,
+                            "latency_ms": round(latency * 1000, 2) if latency is not None else None,
+                            "error": str(exception) if exception else None}
+                        for d, (outcome, latency, exception) in results.items()},
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 保存しました: {args.output}")
+
+    client.loop_stop()
+    client.disconnect()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+デバイスホスト（1プロセスで数千台のエアコンをシミュレート）
+
+機能:
+- device_simulator.py と同じ状態（電源・モード・目標温度・現在温度）を全デバイス分の NumPy 配列で保持
+- コマンドは devices/+/commands/# のワイルドカード購読1つで受け、デバイスIDから配列の番号に振り分け
+- 少数の接続（コネクションプール）でデバイスを分担して応答・シャドウを送信
+- 相関ID付きのコマンドには device_simulator.py と同じ形で応答（common/rpc.py）
+- 温度のシミュレーションは全デバイスを1回の配列演算で進め、値が変わったデバイスだけシャドウを送信
+- devices/<ID>/info（タグ）を Retain で送信し、bulk_command.py のグループ指定に使える
+- 接続・再接続のたびに、その接続が受け持つデバイスの情報と全状態を送り直す
+- コマンドの処理時間・ティックの処理時間・シャドウの送信数を定期的に表示
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.histogram import LatencyHistogram
+from common.mini_broker import start_broker_thread
+from common.rpc import parse_command, send_response
+from common.shadow import ShadowPublisher, format_stats
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ numpy がインストールされていません。pip install numpy を実行してください。")
+    sys.exit(1)
+
+BROKER = "localhost"
+PORT = 1883
+
+MODES = ["cool", "heat", "fan"]
+POWER = ["OFF", "ON"]
+
+# desired の項目と、それを反映するコマンド（device_simulator.py と同じ）
+DESIRED_COMMANDS = {"power": "power", "mode": "mode", "target_temp": "set-temp"}
+
+class HvacArray:
+    """全デバイスの状態を配列で持つ（device_simulator.py の device_state を配列にしたもの）"""
+
+    def __init__(self, device_ids, rng):
+        count = len(device_ids)
+        self.device_ids = device_ids
+        self.index = {device_id: i for i, device_id in enumerate(device_ids)}
+        self.power = np.zeros(count, dtype=bool)
+        self.mode = np.zeros(count, dtype=np.int8)
+        self.target_temp = np.full(count, 25.0)
+        # 部屋ごとに少しずつ違う温度から始める
+        self.current_temp = np.round(rng.uniform(22.0, 28.0, count) * 2) / 2
+        self.lock = threading.Lock()
+
+    def state(self, i):
+        """1台分の状態（device_state と同じ辞書）"""
+        return {
+            "power": POWER[int(self.power[i])],
+            "mode": MODES[int(self.mode[i])],
+            "target_temp": float(self.target_temp[i]),
+            "current_temp": float(self.current_temp[i]),
+        }
+
+    def execute(self, i, command, value):
+        """コマンドを実行して (成功したか, 結果の辞書またはエラーメッセージ) を返す"""
+        with self.lock:
+            if command == "power":
+                if value not in POWER:
+                    return False, "電源は ON / OFF で指定してください"
+                self.power[i] = value == "ON"
+                return True, {"power": value}
+            elif command == "set-temp":
+                try:
+                    temp = float(value)
+                except (TypeError, ValueError):
+                    return False, "無効な温度値です"
+                if not 16 <= temp <= 30:
+                    return False, "温度は16〜30°Cの範囲で設定してください"
+                self.target_temp[i] = temp
+                return True, {"target_temp": temp}
+            elif command == "mode":
+                if value not in MODES:
+                    return False, "無効なモードです"
+                self.mode[i] = MODES.index(value)
+                return True, {"mode": value}
+            elif command == "status":
+                return True, self.state(i)
+        return False, f"不明なコマンドです: {command}"
+
+    def step(self):
+        """電源ONの全デバイスの現在温度を目標温度に0.5°Cずつ近づけ、値が変わったデバイスの番号を返す"""
+        with self.lock:
+            delta = np.clip(self.target_temp - self.current_temp, -0.5, 0.5)
+            delta[~self.power] = 0.0
+            changed = np.nonzero(delta)[0]
+            self.current_temp += delta
+            np.round(self.current_temp, 1, out=self.current_temp)
+            return changed, self.current_temp[changed].tolist()
+
+class DeviceHost:
+    """接続プールとコマンドの振り分け"""
+
+    def __init__(self, args, device_ids, tags):
+        self.args = args
+        self.devices = HvacArray(device_ids, np.random.default_rng(args.seed))
+        self.tags = tags
+        self.clients = []
+        self.shadows = []
+        for k in range(args.connections):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"{args.prefix}-host{k}-{os.getpid()}")
+            client.max_inflight_messages_set(1000)
+            client.user_data_set(k)
+            client.on_connect = self.on_connect
+            self.clients.append(client)
+            # シャドウは接続ごとに持つ（デバイス i は接続 i % 接続数 で送る）
+            self.shadows.append(ShadowPublisher(client, coalesce=args.coalesce, qos=1))
+        # コマンドは最初の接続のワイルドカード購読1つで受ける
+        self.clients[0].on_message = self.on_message
+        # 初期状態（送信は接続時の publish_info()）
+        for i, device_id in enumerate(device_ids):
+            self.shadows[i % len(self.clients)].report(device_id, self.devices.state(i))
+
+        self.commands = 0
+        self.replies = 0
+        self.unknown = 0
+        self.stats_lock = threading.Lock()
+        self.handle_hist = LatencyHistogram()   # 1コマンドの処理時間（µs）
+        self.tick_hist = LatencyHistogram()     # 1ティックの処理時間（µs）
+
+    def connect(self):
+        for client in self.clients:
+            client.connect(self.args.host, self.args.port, 60)
+            client.loop_start()
+        for shadow in self.shadows:
+            shadow.start()
+
+    def on_connect(self, client, userdata, flags, rc):
+        k = userdata
+        if rc != 0:
+            print(f"❌ 接続{k} 接続失敗: {rc}")
+            return
+        if k == 0:
+            client.subscribe("devices/+/commands/#", qos=2)
+            client.subscribe("devices/+/shadow/desired", qos=1)
+            print("📥 トピック購読: devices/+/commands/#, devices/+/shadow/desired")
+        # 再接続時も送り直す（ブローカーが再起動していると Retain は残っていない）
+        self.publish_info(k)
+
+    def publish_info(self, k):
+        """接続 k が受け持つデバイスの情報と全状態を送信"""
+        client = self.clients[k]
+        for i in range(k, len(self.devices.device_ids), len(self.clients)):
+            device_id = self.devices.device_ids[i]
+            info = {"device_id": device_id, "tags": self.tags(i)}
+            client.publish(f"devices/{device_id}/info", json.dumps(info, ensure_ascii=False), qos=1, retain=True)
+        self.shadows[k].republish()
+
+    def on_message(self, client, userdata, msg):
+        start = time.perf_counter_ns()
+        parts = msg.topic.split('/')
+        i = self.devices.index.get(parts[1])
+        if i is None:
+            # このホストのデバイスではない（device_simulator.py など）
+            with self.stats_lock:
+                self.unknown += 1
+            return
+        k = i % len(self.clients)
+        device_id = parts[1]
+
+        if parts[2] == "shadow":
+            self.apply_desired(i, k, device_id, msg.payload)
+            return
+
+        value, correlation_id, reply_to = parse_command(msg.payload)
+        ok, result = self.devices.execute(i, parts[-1], value)
+        if ok and parts[-1] != "status":
+            self.shadows[k].report(device_id, result)
+        if ok:
+            sent = send_response(self.clients[k], reply_to, correlation_id, result=result)
+        else:
+            sent = send_response(self.clients[k], reply_to, correlation_id, ok=False, error=result)
+        with self.stats_lock:
+            self.commands += 1
+            self.replies += sent is not None
+            self.handle_hist.record((time.perf_counter_ns() - start) // 1000)
+
+    def apply_desired(self, i, k, device_id, payload):
+        """desired と異なる項目を実行（device_simulator.py の apply_desired と同じ）"""
+        if not payload:
+            return
+        try:
+            desired = json.loads(payload)
+        except ValueError:
+            return
+        if not isinstance(desired, dict):
+            return
+        shadow = self.shadows[k]
+        shadow.set_desired(device_id, {key: v for key, v in desired.items() if key in DESIRED_COMMANDS})
+        for key, value in shadow.delta(device_id).items():
+            ok, result = self.devices.execute(i, DESIRED_COMMANDS[key], value)
+            if ok:
+                shadow.report(device_id, result)
+
+    def tick(self):
+        """全デバイスの温度を1ティック進め、変わったデバイスだけシャドウに報告"""
+        start = time.perf_counter_ns()
+        changed, temps = self.devices.step()
+        device_ids = self.devices.device_ids
+        connections = len(self.clients)
+        for i, temp in zip(changed.tolist(), temps):
+            self.shadows[i % connections].report(device_ids[i], {"current_temp": temp})
+        self.tick_hist.record((time.perf_counter_ns() - start) // 1000)
+        return len(changed)
+
+    def shadow_stats(self):
+        """全接続のシャドウの集計を合計"""
+        total = {}
+        for shadow in self.shadows:
+            for key, value in shadow.stats().items():
+                total[key] = total.get(key, 0) + value
+        return total
+
+    def close(self):
+        for shadow in self.shadows:
+            shadow.close()
+        time.sleep(0.5)
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+def format_us(hist):
+    if hist.count == 0:
+        return "-"
+    p50, p99 = hist.percentiles([50, 99])
+    return f"p50 {p50 / 1000:.2f}ms p99 {p99 / 1000:.2f}ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="デバイスホスト（多数のエアコンを1プロセスでシミュレート）")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--devices", type=int, default=1000, help="デバイス数")
+    parser.add_argument("--connections", type=int, default=4, help="接続数（コネクションプール）")
+    parser.add_argument("--prefix", default="hvac-", help="デバイスIDの接頭辞")
+    parser.add_argument("--groups", type=int, default=0,
+                        help="デバイスを group1〜groupN のタグに順番に振り分ける（0で振り分けない）")
+    parser.add_argument("--tags", default="", help="全デバイスに付けるタグ（カンマ区切り）")
+    parser.add_argument("--interval", type=float, default=5.0, help="温度シミュレーションの間隔（秒）")
+    parser.add_argument("--coalesce", type=float, default=0.5, help="状態の変更をまとめて送る間隔（秒）")
+    parser.add_argument("--duration", type=float, help="実行秒数（省略時は Ctrl+C まで）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="統計の表示間隔（秒）")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を --port で起動して使う")
+    args = parser.parse_args()
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread(port=args.port)
+        args.host, args.port = broker.host, broker.port
+
+    device_ids = [f"{args.prefix}{i:05d}" for i in range(args.devices)]
+    common_tags = [tag for tag in args.tags.split(",") if tag]
+
+    def tags(i):
+        if args.groups:
+            return common_tags + [f"group{i % args.groups + 1}"]
+        return common_tags
+
+    host = DeviceHost(args, device_ids, tags)
+    host.connect()
+
+    print("🏢 デバイスホスト起動")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print(f"🔢 デバイス {args.devices}台（{device_ids[0]}〜{device_ids[-1]}） | 接続 {args.connections}本 | "
+          f"温度の更新 {args.interval:g}秒ごと")
+    print("Ctrl+C で停止")
+    print("-" * 80)
+
+    start = time.monotonic()
+    next_tick = start + args.interval
+    next_report = start + args.report_interval
+    report_commands = 0
+    report_time = start
+    ticks = 0
+    changed_total = 0
+
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(max(0.0, min(next_tick, next_report) - time.monotonic()))
+            now = time.monotonic()
+            if now >= next_tick:
+                changed_total += host.tick()
+                ticks += 1
+                next_tick += args.interval
+            if now >= next_report:
+                with host.stats_lock:
+                    rate = (host.commands - report_commands) / (now - report_time)
+                    print(f"[{now - start:7.1f}s] コマンド {rate:7.0f}件/秒（累計 {host.commands}、"
+                          f"応答 {host.replies}） | 処理 {format_us(host.handle_hist)} | "
+                          f"ティック {format_us(host.tick_hist)} | 温度変化 {changed_total}台分")
+                    host.handle_hist.reset()
+                    host.tick_hist.reset()
+                print(f"            🪞 {format_stats(host.shadow_stats())}")
+                report_commands, report_time = host.commands, now
+                next_report += args.report_interval
+    except KeyboardInterrupt:
+        print("\n🛑 デバイスホストを停止します...")
+
+    host.close()
+    print("-" * 80)
+    print(f"📊 コマンド {host.commands}件 | 応答 {host.replies}件 | 対象外 {host.unknown}件 | ティック {ticks}回")
+    print(f"🪞 {format_stats(host.shadow_stats())}")
+    if broker is not None:
+        broker.stop()
+    print("✅ 停止完了")
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,30 @@
 機能:
 - コマンド受信と実行
 - デバイス状態の管理
-- ステータスの定期送信
+- 状態はデバイスシャドウ（common/shadow.py）で管理し、変わった項目だけを送信
+- devices/<ID>/shadow に全状態を1件の Retain で送る（コントローラーは1件で全状態が分かる）
+- devices/<ID>/shadow/desired（Retain）で望む状態を受け取り、反映して報告
+- 相関ID付きのコマンドには実行結果を返信先トピックに返す（common/rpc.py）
+- デバイス情報（タグ）を devices/<ID>/info に Retain で送信（bulk_command.py のグループ指定に使う）
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import json
+import os
+import sys
 import time
 import threading
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.rpc import parse_command, send_response
+from common.shadow import ShadowPublisher, desired_topic, format_stats
+
 BROKER = "localhost"
 PORT = 1883
 DEVICE_ID = "living-room"
+DEVICE_TAGS = []
 
 # デバイスの状態
 device_state = {
@@ -26,6 +39,9 @@ device_state = {
 
 running = True
 
+# 状態の報告（変わった項目だけを coalesce 秒ごとにまとめて送る）
+shadow = None
+
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
     if rc == 0:
@@ -33,76 +49,120 @@ def on_connect(client, userdata, flags, rc):
         print(f"📡 {BROKER}:{PORT}")
         # コマンドトピックを購読
         client.subscribe(f"devices/{DEVICE_ID}/commands/#", qos=2)
-        print(f"📥 トピック購読: devices/{DEVICE_ID}/commands/#")
+        client.subscribe(desired_topic(DEVICE_ID), qos=1)
+        print(f"📥 トピック購読: devices/{DEVICE_ID}/commands/#, {desired_topic(DEVICE_ID)}")
         print("-" * 50)
         print(f"🏠 デバイス '{DEVICE_ID}' が起動しました")
         print("コマンド待機中...")
         print("Ctrl+C で停止")
         print("-" * 50)
 
-        # 初期ステータスを送信
-        send_all_status(client)
+        # デバイス情報（Retain なので後から接続したコントローラーにも届く）
+        client.publish(f"devices/{DEVICE_ID}/info",
+                       json.dumps({"device_id": DEVICE_ID, "tags": DEVICE_TAGS}, ensure_ascii=False),
+                       qos=1, retain=True)
+
+        # 全状態を送信（再接続時も送り直す。ブローカーが再起動していると Retain のシャドウは残っていない）
+        shadow.report(DEVICE_ID, device_state)
+        shadow.republish(DEVICE_ID)
     else:
         print(f"❌ 接続失敗: {rc}")
 
 def on_message(client, userdata, msg):
     """コマンド受信"""
     topic = msg.topic
-    payload = msg.payload.decode()
+    if topic == desired_topic(DEVICE_ID):
+        apply_desired(client, msg.payload)
+        return
+
+    # 相関ID付き（JSON）でも従来の文字列でも受け付ける
+    payload, correlation_id, reply_to = parse_command(msg.payload)
     timestamp = datetime.now().strftime("%H:%M:%S")
 
     print(f"\n📥 [{timestamp}] コマンド受信: {topic.split('/')[-1]} = {payload}")
 
+    ok, result = execute_command(client, topic.split('/')[-1], payload)
+    if not ok:
+        print(f"⚠️  {result}")
+
+    # 返信先があれば実行結果を返す（コントローラーは相関IDで自分のコマンドの応答だと分かる）
+    if ok:
+        send_response(client, reply_to, correlation_id, result=result)
+    else:
+        send_response(client, reply_to, correlation_id, ok=False, error=result)
+
+def execute_command(client, command, payload):
+    """コマンドを実行して (成功したか, 結果の辞書またはエラーメッセージ) を返す"""
     # 電源制御
-    if topic.endswith("/commands/power"):
+    if command == "power":
         if payload == "ON":
             device_state["power"] = "ON"
             print("🔌 電源をONにしました")
         elif payload == "OFF":
             device_state["power"] = "OFF"
             print("🔌 電源をOFFにしました")
+        else:
+            return False, "電源は ON / OFF で指定してください"
 
-        send_status(client, "power", device_state["power"])
+        report_status("power", device_state["power"])
+        return True, {"power": device_state["power"]}
 
     # 温度設定
-    elif topic.endswith("/commands/set-temp"):
+    elif command == "set-temp":
         try:
             temp = float(payload)
-            if 16 <= temp <= 30:
-                device_state["target_temp"] = temp
-                print(f"🎯 目標温度を {temp}°C に設定しました")
-                send_status(client, "target_temp", str(temp))
-            else:
-                print("⚠️  温度は16〜30°Cの範囲で設定してください")
-        except ValueError:
-            print("⚠️  無効な温度値です")
+        except (TypeError, ValueError):
+            return False, "無効な温度値です"
+        if not 16 <= temp <= 30:
+            return False, "温度は16〜30°Cの範囲で設定してください"
+        device_state["target_temp"] = temp
+        print(f"🎯 目標温度を {temp}°C に設定しました")
+        report_status("target_temp", temp)
+        return True, {"target_temp": temp}
 
     # モード変更
-    elif topic.endswith("/commands/mode"):
-        if payload in ["cool", "heat", "fan"]:
-            device_state["mode"] = payload
-            mode_name = {"cool": "冷房", "heat": "暖房", "fan": "送風"}[payload]
-            print(f"🌡️  モードを {mode_name} に変更しました")
-            send_status(client, "mode", payload)
-        else:
-            print("⚠️  無効なモードです")
-
-    # ステータス要求
-    elif topic.endswith("/commands/status"):
-        print("📊 ステータスを送信します")
-        send_all_status(client)
-
-def send_status(client, status_type, value):
-    """ステータスを送信"""
-    topic = f"devices/{DEVICE_ID}/status/{status_type}"
-    client.publish(topic, value, qos=1)
-
-def send_all_status(client):
-    """全ステータスを送信"""
-    send_status(client, "power", device_state["power"])
-    send_status(client, "mode", device_state["mode"])
-    send_status(client, "target_temp", str(device_state["target_temp"]))
-    send_status(client, "current_temp", str(device_state["current_temp"]))
+    elif command == "mode":
+        if payload not in ["cool", "heat", "fan"]:
+            return False, "無効なモードです"
+        device_state["mode"] = payload
+        mode_name = {"cool": "冷房", "heat": "暖房", "fan": "送風"}[payload]
+        print(f"🌡️  モードを {mode_name} に変更しました")
+        report_status("mode", payload)
+        return True, {"mode": payload}
+
+    # ステータス要求（応答に全ステータスを入れる。シャドウは変わっていないので送り直さない）
+    elif command == "status":
+        print("📊 ステータスを返信します")
+        return True, dict(device_state)
+
+    return False, f"不明なコマンドです: {command}"
+
+# desired の項目と、それを反映するコマンド
+DESIRED_COMMANDS = {"power": "power", "mode": "mode", "target_temp": "set-temp"}
+
+def apply_desired(client, payload):
+    """desired（望む状態）を受け取り、reported と異なる項目をコマンドとして実行"""
+    if not payload:
+        # Retain を消すための空メッセージ
+        return
+    try:
+        desired = json.loads(payload)
+    except ValueError:
+        print(f"⚠️  不正な desired: {payload[:40]}")
+        return
+    if not isinstance(desired, dict):
+        return
+    desired = {k: v for k, v in desired.items() if k in DESIRED_COMMANDS}
+    shadow.set_desired(DEVICE_ID, desired)
+    for key, value in shadow.delta(DEVICE_ID).items():
+        print(f"🎯 desired を反映: {key} = {value}")
+        ok, result = execute_command(client, DESIRED_COMMANDS[key], value)
+        if not ok:
+            print(f"⚠️  {result}")
+
+def report_status(status_type, value):
+    """状態をシャドウに報告（値が変わっていなければ送信しない）"""
+    shadow.report(DEVICE_ID, {status_type: value})
 
 def simulate_temperature(client):
     """温度をシミュレート"""
@@ -117,20 +177,33 @@ def simulate_temperature(client):
             current = device_state["current_temp"]
 
             if current < target:
-                device_state["current_temp"] += 0.5
+                device_state["current_temp"] = round(current + 0.5, 1)
             elif current > target:
-                device_state["current_temp"] -= 0.5
+                device_state["current_temp"] = round(current - 0.5, 1)
 
-            # ステータス送信
-            send_status(client, "current_temp", f"{device_state['current_temp']:.1f}")
+            # 目標温度に達した後は値が変わらないので、シャドウは何も送らない
+            report_status("current_temp", device_state["current_temp"])
 
 def main():
-    global running
+    global running, DEVICE_ID, DEVICE_TAGS, shadow
+
+    parser = argparse.ArgumentParser(description="デバイスシミュレーター")
+    parser.add_argument("--device", default=DEVICE_ID, help="デバイスID")
+    parser.add_argument("--tags", default="", help="デバイスのタグ（カンマ区切り、例: floor3,cooling）")
+    parser.add_argument("--coalesce", type=float, default=0.5,
+                        help="状態の変更をまとめて送る間隔（秒）")
+    parser.add_argument("--legacy-status", action="store_true",
+                        help="変わった項目を従来の devices/<ID>/status/<項目> にも送る")
+    args = parser.parse_args()
+    DEVICE_ID = args.device
+    DEVICE_TAGS = [tag for tag in args.tags.split(",") if tag]
 
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"Device_{DEVICE_ID}")
     client.on_connect = on_connect
     client.on_message = on_message
+    shadow = ShadowPublisher(client, coalesce=args.coalesce, qos=1, legacy_status=args.legacy_status)
+    shadow.start()
 
     # 温度シミュレーションスレッド
     temp_thread = threading.Thread(target=simulate_temperature, args=(client,), daemon=True)
@@ -145,7 +218,9 @@ def main():
         running = False
 
     finally:
-        # クリーンアップ
+        # クリーンアップ（まとめ待ちの変更を送ってから切断）
+        shadow.close()
+        print(f"📊 {format_stats(shadow.stats())}")
         client.disconnect()
         print("✅ 停止完了")
 
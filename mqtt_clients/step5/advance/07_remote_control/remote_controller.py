@@ -4,27 +4,42 @@ MQTTリモートコントローラー
 機能:
 - デバイスへのコマンド送信
 - 電源制御、温度設定、モード変更
-- ステータス確認
+- ステータス確認（devices/<ID>/shadow の Retain 1件で全状態を受け取る）
+- コマンドごとに相関IDを付けて送り、デバイスの応答を待つ（往復時間を表示）
+- --bench で多数のコマンドを同時に送り、往復時間を集計
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
 import time
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.rpc import CommandFailed, CommandTimeout, RpcClient, format_stats
+from common.shadow import ShadowCache, shadow_topic
+
 BROKER = "localhost"
 PORT = 1883
 DEVICE_ID = "living-room"
 
 client = None
+rpc = None
+
+# デバイスシャドウの最新スナップショット
+shadows = ShadowCache()
 
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
     if rc == 0:
         print("✅ ブローカーに接続")
         print(f"📡 {BROKER}:{PORT}")
-        # デバイスのステータスを購読
-        client.subscribe(f"devices/{DEVICE_ID}/status/#", qos=1)
-        print(f"📥 トピック購読: devices/{DEVICE_ID}/status/#")
+        # デバイスのシャドウ（全状態、Retain）を購読
+        client.subscribe(shadow_topic(DEVICE_ID), qos=1)
+        # コマンドの応答を受けるトピック
+        rpc.subscribe()
+        print(f"📥 トピック購読: {shadow_topic(DEVICE_ID)}, {rpc.reply_topic}")
         print("-" * 50)
     else:
         print(f"❌ 接続失敗: {rc}")
@@ -32,27 +47,54 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """ステータス受信"""
     topic = msg.topic
-    payload = msg.payload.decode()
     timestamp = datetime.now().strftime("%H:%M:%S")
 
-    if "/status/" in topic:
-        status_type = topic.split('/')[-1]
-        print(f"📥 [{timestamp}] ステータス更新: {status_type} = {payload}")
+    if topic == shadow_topic(DEVICE_ID):
+        try:
+            changed = shadows.update(msg.payload)
+        except (ValueError, KeyError):
+            print(f"⚠️  不正なシャドウ: {msg.payload[:40]}")
+            return
+        # スナップショットは全状態を持つが、表示は前回から変わった項目だけ
+        for status_type, value in (changed or {}).items():
+            print(f"📥 [{timestamp}] ステータス更新: {status_type} = {value}")
 
 def send_command(command_type, value):
-    """コマンドを送信"""
-    global client
+    """コマンドを送信し、デバイスの応答を待つ（応答の result を返す）"""
     topic = f"devices/{DEVICE_ID}/commands/{command_type}"
 
-    # QoS 2で確実に送信
-    result = client.publish(topic, value, qos=2)
+    # QoS 2で確実に送信（相関IDと返信先はペイロードに入る）
+    future = rpc.call(topic, value)
+    print(f"📤 コマンド送信: {command_type} = {value} (id: {future.id})")
 
-    if result.rc == mqtt.MQTT_ERR_SUCCESS:
-        print(f"📤 コマンド送信: {command_type} = {value}")
-    else:
-        print(f"❌ 送信失敗: {command_type}")
-
-    time.sleep(0.1)  # 少し待機
+    try:
+        result = future.result()
+    except CommandTimeout:
+        print(f"⏱️  応答がありません: {command_type}（{rpc.timeout:g}秒）")
+        return None
+    except CommandFailed as e:
+        print(f"❌ 実行失敗: {command_type} - {e}")
+        return None
+
+    print(f"✅ 応答 ({future.latency * 1000:.1f}ms): {result}")
+    return result
+
+def run_bench(count, command_type, value):
+    """count 件のコマンドをまとめて送り、すべての応答を待って往復時間を集計"""
+    topic = f"devices/{DEVICE_ID}/commands/{command_type}"
+    # 応答だけを集計するので、ステータス更新の表示は止める
+    client.unsubscribe(shadow_topic(DEVICE_ID))
+    print(f"🧪 {count}件の {command_type} を同時に送信します")
+    start = time.monotonic()
+    futures = [rpc.call(topic, value) for _ in range(count)]
+    for future in futures:
+        try:
+            future.result()
+        except (CommandTimeout, CommandFailed):
+            pass
+    elapsed = time.monotonic() - start
+    print(f"📊 {format_stats(rpc.stats())}")
+    print(f"⏱️  全応答まで {elapsed * 1000:.0f}ms（{count / elapsed:.0f}件/秒）")
 
 def show_menu():
     """メニューを表示"""
@@ -71,12 +113,21 @@ def show_menu():
     print("=" * 50)
 
 def main():
-    global client
+    global client, rpc, DEVICE_ID
+
+    parser = argparse.ArgumentParser(description="MQTTリモートコントローラー")
+    parser.add_argument("--device", default=DEVICE_ID, help="デバイスID")
+    parser.add_argument("--timeout", type=float, default=5.0, help="応答を待つ秒数")
+    parser.add_argument("--bench", type=int, metavar="N",
+                        help="メニューを出さずに status コマンドを N 件同時に送り、往復時間を集計して終了")
+    args = parser.parse_args()
+    DEVICE_ID = args.device
 
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "RemoteController01")
     client.on_connect = on_connect
     client.on_message = on_message
+    rpc = RpcClient(client, "RemoteController01", qos=2, timeout=args.timeout)
 
     try:
         client.connect(BROKER, PORT, 60)
@@ -84,6 +135,10 @@ def main():
 
         time.sleep(1)  # 接続を待つ
 
+        if args.bench:
+            run_bench(args.bench, "status", "request")
+            return
+
         while True:
             show_menu()
             choice = input("\n選択 (1-6): ").strip()
@@ -126,10 +181,18 @@ def main():
                     print("⚠️  無効な選択です")
 
             elif choice == "5":
-                # ステータス確認
-                send_command("status", "request")
-                print("⏳ ステータス取得中...")
-                time.sleep(1)
+                # ステータス確認（シャドウがあればコマンドを送らずに表示）
+                shadow = shadows.get(DEVICE_ID)
+                if shadow is not None:
+                    status = shadow["reported"]
+                    print(f"📋 シャドウ v{shadow['version']}"
+                          + (f" | 未反映の desired: {shadow['delta']}" if shadow["delta"] else ""))
+                else:
+                    # 応答に全ステータスが入っている
+                    status = send_command("status", "request")
+                if status:
+                    print(f"📊 電源: {status['power']} | モード: {status['mode']} | "
+                          f"目標: {status['target_temp']}°C | 現在: {status['current_temp']}°C")
 
             elif choice == "6":
                 # 終了
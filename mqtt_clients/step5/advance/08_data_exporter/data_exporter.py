@@ -9,8 +9,15 @@
 
 import paho.mqtt.client as mqtt
 from datetime import datetime
+import argparse
 import csv
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import SampleReader
+from common.console_log import add_log_arguments, from_args
 
 BROKER = "localhost"
 PORT = 1883
@@ -18,6 +25,12 @@ PORT = 1883
 # データを保存するリスト
 all_data = []
 
+# 種別ごとのトピックと batch の両方から測定値を取り出す
+reader = SampleReader()
+
+# コンソール出力
+console = None
+
 def on_connect(client, userdata, flags, rc):
     """接続時のコールバック"""
     if rc == 0:
@@ -36,55 +49,52 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """メッセージ受信時のコールバック"""
     topic = msg.topic
-    payload = msg.payload.decode()
+    payload = msg.payload
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     try:
-        # トピックからセンサーIDを抽出
-        parts = topic.split('/')
-        if len(parts) < 3:
-            return
-
-        sensor_id = parts[1]
-
-        # センサーデータ
-        if "temperature" in topic and "alerts" not in topic:
-            record = {
-                "timestamp": timestamp,
-                "sensor_id": sensor_id,
-                "type": "temperature",
-                "value": float(payload),
-                "unit": "°C"
-            }
-            all_data.append(record)
-            print(f"📝 収集: {sensor_id} - 温度 {payload}°C (合計: {len(all_data)}件)")
-
-        elif "humidity" in topic and "alerts" not in topic:
-            record = {
-                "timestamp": timestamp,
-                "sensor_id": sensor_id,
-                "type": "humidity",
-                "value": float(payload),
-                "unit": "%"
-            }
-            all_data.append(record)
-            print(f"📝 収集: {sensor_id} - 湿度 {payload}% (合計: {len(all_data)}件)")
-
-        elif "light" in topic and "alerts" not in topic:
-            record = {
-                "timestamp": timestamp,
-                "sensor_id": sensor_id,
-                "type": "light",
-                "value": float(payload),
-                "unit": "lux"
-            }
-            all_data.append(record)
-            print(f"📝 収集: {sensor_id} - 照度 {payload} lux (合計: {len(all_data)}件)")
+        # センサーデータ（種別ごとのトピック・batch のどちらも1件ずつ取り出す）
+        for sensor_id, sensor_type, value, _ in reader.readings(topic, payload):
+            if sensor_type == "temperature":
+                record = {
+                    "timestamp": timestamp,
+                    "sensor_id": sensor_id,
+                    "type": "temperature",
+                    "value": value,
+                    "unit": "°C"
+                }
+                all_data.append(record)
+                console.info(f"{sensor_id}/temperature", "📝 収集: {} - 温度 {}°C (合計: {}件)",
+                             sensor_id, value, len(all_data), value=value, unit="°C")
+
+            elif sensor_type == "humidity":
+                record = {
+                    "timestamp": timestamp,
+                    "sensor_id": sensor_id,
+                    "type": "humidity",
+                    "value": value,
+                    "unit": "%"
+                }
+                all_data.append(record)
+                console.info(f"{sensor_id}/humidity", "📝 収集: {} - 湿度 {}% (合計: {}件)",
+                             sensor_id, value, len(all_data), value=value, unit="%")
+
+            elif sensor_type == "light":
+                record = {
+                    "timestamp": timestamp,
+                    "sensor_id": sensor_id,
+                    "type": "light",
+                    "value": value,
+                    "unit": "lux"
+                }
+                all_data.append(record)
+                console.info(f"{sensor_id}/light", "📝 収集: {} - 照度 {} lux (合計: {}件)",
+                             sensor_id, value, len(all_data), value=value, unit=" lux")
 
     except ValueError as e:
-        print(f"⚠️  データのパースに失敗: {e}")
+        console.important("⚠️  データのパースに失敗: {}", e)
     except Exception as e:
-        print(f"❌ エラー: {e}")
+        console.important("❌ エラー: {}", e)
 
 def export_to_csv():
     """CSV形式でエクスポート"""
@@ -177,6 +187,15 @@ def print_summary():
     print("=" * 50)
 
 def main():
+    global console
+
+    parser = argparse.ArgumentParser(description="データエクスポートツール")
+    add_log_arguments(parser)
+    args = parser.parse_args()
+
+    # コンソール出力（バックグラウンドで書き出し）
+    console = from_args(args)
+
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "DataExporter01")
     client.on_connect = on_connect
@@ -187,6 +206,7 @@ def main():
         client.loop_forever()
 
     except KeyboardInterrupt:
+        console.close()
         print("\n\n🛑 データ収集を停止します...")
         print_summary()
 
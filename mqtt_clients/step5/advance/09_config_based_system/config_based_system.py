@@ -10,9 +10,14 @@
 
 import paho.mqtt.client as mqtt
 import json
+import os
+import sys
 import time
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import decode_value
+
 # グローバル変数
 config = None
 sensor_data = {}
@@ -109,7 +114,7 @@ def on_connect(client, userdata, flags, rc):
 def on_message(client, userdata, msg):
     """メッセージ受信時のコールバック"""
     topic = msg.topic
-    payload = msg.payload.decode()
+    payload = msg.payload
 
     # トピックに対応するセンサー設定を検索
     sensor_config = None
@@ -122,7 +127,7 @@ def on_message(client, userdata, msg):
         return
 
     try:
-        value = float(payload)
+        value = decode_value(payload)
 
         # データを記録
         sensor_id = sensor_config['id']
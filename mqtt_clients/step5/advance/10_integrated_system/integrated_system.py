@@ -8,17 +8,26 @@
 - 統計分析
 - データエクスポート
 - 設定管理
+- 受信処理を段（受信 → decode → route → analyze → sink）に分けたパイプライン
 
 すべての応用例を統合した総合システムです。
+paho のコールバックではメッセージをキューに入れるだけで、デコード・振り分け・保存・表示は
+上限付きのキューでつないだ段のワーカーが行います（common/pipeline.py）。
 """
 
 import paho.mqtt.client as mqtt
+import argparse
 import time
-import json
+import os
 import sys
 from datetime import datetime
 from collections import deque
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import SampleReader, decode_alert, is_reading_topic, iter_samples
+from common.console_log import add_log_arguments, from_args
+from common.pipeline import POOLS, Pipeline, format_stats
+
 BROKER = "localhost"
 PORT = 1883
 VERSION = "1.0.0"
@@ -28,8 +37,22 @@ temp_data = deque(maxlen=3600)
 humid_data = deque(maxlen=3600)
 light_data = deque(maxlen=3600)
 alert_count = 0
+KIND_SERIES = {"temperature": temp_data, "humidity": humid_data, "light": light_data}
+
+# センサー・種別ごとの直近の値（トレンド用）
+WINDOW = 60
+sensor_windows = {}
+
+# 種別ごとのトピックと batch の両方から測定値を取り出す
+reader = SampleReader()
+
+# コンソール出力
+console = None
+
+# 受信処理のパイプライン
+pipeline = None
 
-def print_header():
+def print_header(args):
     """ヘッダーを表示"""
     print("\n" + "=" * 60)
     print("🚀 完全統合IoTシステム")
@@ -45,8 +68,15 @@ def print_header():
     print("  ✅ データエクスポート")
     print()
     print("【ブローカー接続】")
-    print(f"  ホスト: {BROKER}")
-    print(f"  ポート: {PORT}")
+    print(f"  ホスト: {args.host}")
+    print(f"  ポート: {args.port}")
+    print()
+    print("【受信パイプライン】")
+    print(f"  decode : {args.decode_workers} {args.decode_pool}（{args.decode_batch}件ずつ）")
+    print(f"  route  : 1 thread")
+    print(f"  analyze: {args.analyze_workers} thread（センサーごとに振り分け）")
+    print(f"  sink   : 1 thread")
+    print(f"  キュー : 各 {args.queue_size}件まで")
     print("=" * 60)
 
 def on_connect(client, userdata, flags, rc):
@@ -65,46 +95,95 @@ def on_connect(client, userdata, flags, rc):
         print(f"❌ 接続失敗: {rc}")
 
 def on_message(client, userdata, msg):
-    """メッセージ受信時のコールバック"""
+    """メッセージ受信時のコールバック（受信段: キューに入れるだけ）"""
+    pipeline.submit((msg.topic, msg.payload, time.time()))
+
+def decode_message(message):
+    """decode 段: ペイロードをデコード（状態を持たないのでプロセスプールでも動く）"""
+    topic, payload, received_at = message
+    if is_reading_topic(topic):
+        return [("reading", topic, sensor_id, values, received_at)
+                for sensor_id, _, values in iter_samples(topic, payload)]
+    if "alerts" in topic:
+        return [("alert", decode_alert(payload), received_at)]
+    return None
+
+def route(record):
+    """route 段: 測定値は analyze へ、アラートは sink へ"""
+    if record[0] == "alert":
+        return [("sink", record)]
+    _, topic, sensor_id, values, received_at = record
+    # batch を受けたセンサーの種別ごとのトピックは二重に数えない
+    if not reader.accept(topic, sensor_id):
+        return None
+    return [("analyze", (sensor_id, kind, value, received_at)) for kind, value in values.items()]
+
+def analyze(reading):
+    """analyze 段: 種別ごと・センサーごとの履歴に保存（同じセンサーは同じワーカーが処理）"""
+    sensor_id, kind, value, received_at = reading
+    series = KIND_SERIES.get(kind)
+    if series is None:
+        return None
+    series.append(value)
+    window = sensor_windows.get((sensor_id, kind))
+    if window is None:
+        window = sensor_windows[(sensor_id, kind)] = deque(maxlen=WINDOW)
+    window.append(value)
+    return [("reading", sensor_id, kind, value, received_at)]
+
+def sink(record):
+    """sink 段: 表示とアラートの集計"""
     global alert_count
 
-    topic = msg.topic
-    payload = msg.payload.decode()
-    timestamp = datetime.now().strftime("%H:%M:%S")
+    timestamp = datetime.fromtimestamp(record[-1]).strftime("%H:%M:%S")
+    if record[0] == "reading":
+        _, _, sensor_type, value, _ = record
+        if sensor_type == "temperature":
+            console.info("temperature", "[{}] 🌡️  温度: {}°C", timestamp, value,
+                         value=value, unit="°C")
 
-    try:
-        # センサーデータ
-        if "temperature" in topic and "alerts" not in topic:
-            temp = float(payload)
-            temp_data.append(temp)
-            print(f"[{timestamp}] 🌡️  温度: {temp}°C")
-
-        elif "humidity" in topic and "alerts" not in topic:
-            humid = float(payload)
-            humid_data.append(humid)
-            print(f"[{timestamp}] 💧 湿度: {humid}%")
-
-        elif "light" in topic and "alerts" not in topic:
-            light = float(payload)
-            light_data.append(light)
-            print(f"[{timestamp}] 💡 照度: {light} lux")
-
-        # アラート
-        elif "alerts" in topic:
-            try:
-                alert_data = json.loads(payload)
-                alert_count += 1
-                print(f"\n🚨 アラート #{alert_count}")
-                print(f"  時刻: {timestamp}")
-                print(f"  センサー: {alert_data.get('sensor_id', 'Unknown')}")
-                print(f"  種類: {alert_data.get('type', 'unknown')}")
-                print(f"  値: {alert_data.get('value', 0)}")
-                print(f"  メッセージ: {alert_data.get('alert', '')}\n")
-            except json.JSONDecodeError:
-                pass
-
-    except ValueError:
-        pass
+        elif sensor_type == "humidity":
+            console.info("humidity", "[{}] 💧 湿度: {}%", timestamp, value,
+                         value=value, unit="%")
+
+        elif sensor_type == "light":
+            console.info("light", "[{}] 💡 照度: {} lux", timestamp, value,
+                         value=value, unit=" lux")
+
+    else:
+        alert_data = record[1]
+        alert_count += 1
+        console.important(
+            "\n🚨 アラート #{}\n  時刻: {}\n  センサー: {}\n  種類: {}\n  値: {}\n  メッセージ: {}\n",
+            alert_count, timestamp,
+            alert_data.get('sensor_id', 'Unknown'),
+            alert_data.get('type', 'unknown'),
+            alert_data.get('value', 0),
+            alert_data.get('alert', '')
+        )
+
+def build_pipeline(args):
+    """受信 → decode → route → analyze → sink のパイプライン"""
+    pipeline = Pipeline()
+    pipeline.add("decode", decode_message, to="route", workers=args.decode_workers,
+                 pool=args.decode_pool, batch=args.decode_batch, max_queue=args.queue_size,
+                 key=lambda message: message[0].split('/')[:2][-1])
+    # SampleReader は状態を持つので route は1スレッド
+    pipeline.add("route", route, to=("analyze", "sink"), max_queue=args.queue_size)
+    pipeline.add("analyze", analyze, to="sink", workers=args.analyze_workers,
+                 max_queue=args.queue_size, key=lambda reading: reading[0])
+    # アラートの番号と表示の順序を保つため sink は1スレッド
+    pipeline.add("sink", sink, max_queue=args.queue_size)
+    return pipeline
+
+def sensor_trends(kind):
+    """センサーごとのトレンドの件数"""
+    counts = {}
+    for (sensor_id, sensor_kind), window in list(sensor_windows.items()):
+        if sensor_kind == kind:
+            trend = detect_trend(window)
+            counts[trend] = counts.get(trend, 0) + 1
+    return counts
 
 def calculate_statistics(data, name, unit):
     """統計情報を計算"""
@@ -140,6 +219,13 @@ def detect_trend(data):
     else:
         return "安定 →"
 
+def print_sensor_trends(kind):
+    """センサーごとのトレンドの内訳を表示"""
+    counts = sensor_trends(kind)
+    if counts:
+        breakdown = " / ".join(f"{trend} {n}台" for trend, n in sorted(counts.items()))
+        print(f"    センサー別: {breakdown}")
+
 def print_final_report():
     """最終レポートを表示"""
     print("\n" + "=" * 60)
@@ -166,6 +252,7 @@ def print_final_report():
         print(f"    最大: {stats['max']:.2f} {stats['unit']}")
         print(f"    範囲: {stats['range']:.2f} {stats['unit']}")
         print(f"    トレンド: {detect_trend(temp_data)}")
+        print_sensor_trends("temperature")
 
     # 湿度
     if len(humid_data) > 0:
@@ -177,6 +264,7 @@ def print_final_report():
         print(f"    最大: {stats['max']:.2f} {stats['unit']}")
         print(f"    範囲: {stats['range']:.2f} {stats['unit']}")
         print(f"    トレンド: {detect_trend(humid_data)}")
+        print_sensor_trends("humidity")
 
     # 照度
     if len(light_data) > 0:
@@ -188,6 +276,12 @@ def print_final_report():
         print(f"    最大: {stats['max']:.0f} {stats['unit']}")
         print(f"    範囲: {stats['range']:.0f} {stats['unit']}")
         print(f"    トレンド: {detect_trend(light_data)}")
+        print_sensor_trends("light")
+
+    # パイプライン統計（起動から）
+    print("\n【受信パイプライン】")
+    for line in format_stats(pipeline.stats(total=True)).splitlines():
+        print(f"  {line}")
 
     print("\n" + "=" * 60)
     print("📝 データエクスポート")
@@ -217,10 +311,18 @@ def print_final_report():
 
     print("=" * 60)
 
-def main():
+def main(args):
     """メイン関数"""
+    global console, pipeline
+
+    # コンソール出力（バックグラウンドで書き出し）
+    console = from_args(args)
+
     # ヘッダー表示
-    print_header()
+    print_header(args)
+
+    # 受信パイプライン（子プロセスを使う場合があるので MQTT の接続より先に開始）
+    pipeline = build_pipeline(args).start()
 
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "IntegratedSystem01")
@@ -230,11 +332,20 @@ def main():
     try:
         # ブローカーに接続
         print("\n🔄 ブローカーに接続中...")
-        client.connect(BROKER, PORT, 60)
-        client.loop_forever()
+        client.connect(args.host, args.port, 60)
+        client.loop_start()
+        while True:
+            time.sleep(args.stats_interval or 1.0)
+            if args.stats_interval:
+                console.important("\n📈 受信パイプライン（直近 {}秒）\n{}\n",
+                                  f"{args.stats_interval:g}", format_stats(pipeline.stats()))
 
     except KeyboardInterrupt:
         print("\n\n🛑 システムを停止しています...")
+        client.loop_stop()
+        # キューに残ったメッセージを最後の段まで処理してから集計する
+        pipeline.close()
+        console.close()
         print_final_report()
 
     except Exception as e:
@@ -248,11 +359,18 @@ def main():
 
 if __name__ == "__main__":
     # コマンドライン引数のチェック
-    if "--help" in sys.argv or "-h" in sys.argv:
-        print("\n使用方法:")
-        print("  python integrated_system.py")
-        print("\nオプション:")
-        print("  --help, -h    このヘルプを表示")
-        sys.exit(0)
-
-    main()
+    parser = argparse.ArgumentParser(description="完全統合IoTシステム")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--decode-workers", type=int, default=2, help="decode 段のワーカー数")
+    parser.add_argument("--decode-pool", choices=POOLS, default="thread",
+                        help="decode 段の実行方法（process: プロセスプールで GIL を避ける）")
+    parser.add_argument("--decode-batch", type=int, default=32,
+                        help="decode 段で1回に処理する最大件数（プロセスとの受け渡し回数を減らす）")
+    parser.add_argument("--analyze-workers", type=int, default=2, help="analyze 段のワーカー数")
+    parser.add_argument("--queue-size", type=int, default=1000, help="段ごとのキューの上限（件）")
+    parser.add_argument("--stats-interval", type=float, default=10.0,
+                        help="パイプライン統計の表示間隔（秒、0 で表示しない）")
+    add_log_arguments(parser)
+
+    main(parser.parse_args())
@@ -0,0 +1,301 @@
+"""
+フリートシミュレーター（1プロセスで数千〜数万台の仮想センサー）
+
+機能:
+- 全デバイスの状態を NumPy 配列で保持し、1ティック分の値をまとめて生成
+- multi_sensor_publisher.py と同じランダムウォーク（温度 ±0.5°C、湿度 ±2%、照度 ±50 lux）
+- --model realistic で realistic_sensor_publisher.py の時刻依存モデル（common/sensor_models.py）
+- 少数の接続（コネクションプール）でデバイスを分担して送信
+- ティックごとの処理時間（生成・整形・送信）を計測して表示
+- 閾値の警報はデバイスが警報状態に入ったときだけ送信（--alerts）
+- --payload binary でバイナリ形式のペイロード（common/codec.py）を送信
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import FORMATS, KIND_CODES, READING, TYPE_READING, VERSION, encode_alert
+from common.histogram import LatencyHistogram
+from common.mini_broker import format_stats, start_broker_thread
+from common.sensor_models import RealisticSensorArray, hour_of_day
+
+try:
+    import numpy as np
+except ImportError:
+    print("❌ numpy がインストールされていません。pip install numpy を実行してください。")
+    sys.exit(1)
+
+BROKER = "localhost"
+PORT = 1883
+
+# センサー種別: (初期値の範囲, 1ティックの変化幅, 下限, 上限, 表示形式)
+SENSOR_MODELS = {
+    "temperature": ((20.0, 30.0), 0.5, 15.0, 35.0, b"%.2f"),
+    "humidity": ((40.0, 60.0), 2.0, 20.0, 80.0, b"%.1f"),
+    "light": ((300.0, 700.0), 50.0, 0.0, 1000.0, b"%.0f"),
+}
+
+# バイナリ形式で送る小数点以下の桁数（テキストの表示形式と同じ）
+SENSOR_DIGITS = {"temperature": 2, "humidity": 1, "light": 0}
+
+# 警報の閾値（multi_sensor_publisher.py の check_alert と同じ）: (下限, 上限, 低警報, 高警報)
+ALERT_RULES = {
+    "temperature": (18.0, 30.0, "低温警報", "高温警報"),
+    "humidity": (30.0, 70.0, "低湿度警報", "高湿度警報"),
+}
+
+class Fleet:
+    """全デバイスのセンサー値を配列で持つ"""
+
+    def __init__(self, count, sensors, seed=None, model="random-walk"):
+        self.count = count
+        self.sensors = sensors
+        self.rng = np.random.default_rng(seed)
+        self.values = {}
+        self.alert_state = {}   # センサー種別 -> 警報状態（-1: 低, 0: 正常, 1: 高）
+        self.realistic = None
+
+        if model == "realistic":
+            # 設置場所による温度差をデバイスごとにばらつかせる
+            self.realistic = RealisticSensorArray(count, rng=self.rng,
+                                                  temp_offset=self.rng.normal(0.0, 1.5, count))
+            arrays = {
+                "temperature": self.realistic.temperature.values,
+                "humidity": self.realistic.humidity.values,
+                "light": self.realistic.light.values,
+            }
+
+        for sensor in sensors:
+            if self.realistic is not None:
+                self.values[sensor] = arrays[sensor]
+            else:
+                (low, high), _, _, _, _ = SENSOR_MODELS[sensor]
+                self.values[sensor] = self.rng.uniform(low, high, count)
+            if sensor in ALERT_RULES:
+                self.alert_state[sensor] = np.zeros(count, dtype=np.int8)
+
+    def step(self):
+        """全デバイスを1ティック進める"""
+        if self.realistic is not None:
+            self.realistic.step(hour_of_day(datetime.now()))
+            return
+        for sensor in self.sensors:
+            _, delta, low, high, _ = SENSOR_MODELS[sensor]
+            values = self.values[sensor]
+            values += self.rng.uniform(-delta, delta, self.count)
+            np.clip(values, low, high, out=values)
+
+    def format(self, sensor):
+        """全デバイスの値をペイロード（bytes）のリストに変換"""
+        # np.char より、Python の float に変換してから % で整形する方が速い
+        fmt = SENSOR_MODELS[sensor][4]
+        return [fmt % v for v in self.values[sensor].tolist()]
+
+    def encode(self, sensor, timestamp):
+        """全デバイスの値をバイナリ形式（common/codec.py の測定値）のリストに変換"""
+        # 値×100 の丸めは配列でまとめて行い、struct.pack だけを1件ずつ呼ぶ
+        rounded = np.round(self.values[sensor], SENSOR_DIGITS[sensor])
+        centi = np.rint(rounded * 100).astype(np.int64).tolist()
+        pack = READING.pack
+        header = (VERSION << 4) | TYPE_READING
+        code = KIND_CODES[sensor]
+        ms = int(timestamp * 1000)
+        return [pack(header, code, c, ms) for c in centi]
+
+    def new_alerts(self, sensor):
+        """警報状態に入ったデバイス [(番号, 状態)]"""
+        low, high, _, _ = ALERT_RULES[sensor]
+        values = self.values[sensor]
+        state = np.where(values > high, 1, np.where(values < low, -1, 0)).astype(np.int8)
+        entered = np.nonzero((state != self.alert_state[sensor]) & (state != 0))[0]
+        self.alert_state[sensor] = state
+        return [(int(i), int(state[i])) for i in entered]
+
+class ConnectionPool:
+    """少数の接続でデバイスを分担して送信"""
+
+    def __init__(self, args):
+        self.clients = []
+        for i in range(args.connections):
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"{args.prefix}-pool{i}-{os.getpid()}")
+            client.will_set(f"fleet/{args.prefix}/pool{i}/status", "OFFLINE", qos=1, retain=True)
+            client.connect(args.host, args.port, 60)
+            client.loop_start()
+            client.publish(f"fleet/{args.prefix}/pool{i}/status", "ONLINE", qos=1, retain=True)
+            self.clients.append(client)
+
+    def publishers(self, count):
+        """デバイス番号 -> publish 関数（デバイスは接続に順番に割り当て）"""
+        return [self.clients[i % len(self.clients)].publish for i in range(count)]
+
+    def close(self, args):
+        for i, client in enumerate(self.clients):
+            client.publish(f"fleet/{args.prefix}/pool{i}/status", "OFFLINE", qos=1, retain=True)
+        time.sleep(0.5)
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+
+def publish_status(publishers, device_ids, status):
+    """全デバイスのステータス（Retain）を送信"""
+    payload = status.encode()
+    for publish, device_id in zip(publishers, device_ids):
+        publish(f"sensors/{device_id}/status", payload, qos=1, retain=True)
+
+def format_ms(hist):
+    if hist.count == 0:
+        return "-"
+    p50, p99 = hist.percentiles([50, 99])
+    return f"p50 {p50 / 1000:7.2f}ms p99 {p99 / 1000:7.2f}ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="フリートシミュレーター")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--devices", type=int, default=1000, help="デバイス数")
+    parser.add_argument("--connections", type=int, default=4, help="接続数（コネクションプール）")
+    parser.add_argument("--interval", type=float, default=1.0, help="ティック間隔（秒）")
+    parser.add_argument("--duration", type=float, help="実行秒数（省略時は Ctrl+C まで）")
+    parser.add_argument("--sensors", default="temperature,humidity,light",
+                        help="センサー種別（カンマ区切り）")
+    parser.add_argument("--model", choices=["random-walk", "realistic"], default="random-walk",
+                        help="値の生成モデル（realistic は時刻依存のモデル）")
+    parser.add_argument("--prefix", default="Fleet", help="デバイスIDの接頭辞")
+    parser.add_argument("--qos", type=int, default=0, choices=[0, 1, 2], help="センサーデータのQoS")
+    parser.add_argument("--payload", choices=FORMATS, default="text",
+                        help="ペイロード形式（text: 数値の文字列とJSON、binary: 固定長のバイナリ）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    parser.add_argument("--status", action="store_true", help="デバイスごとのステータス（Retain）を送信")
+    parser.add_argument("--alerts", action="store_true", help="閾値を超えたデバイスの警報を送信")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="統計の表示間隔（秒）")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を起動して使う")
+    args = parser.parse_args()
+
+    sensors = [s for s in args.sensors.split(',') if s]
+    for sensor in sensors:
+        if sensor not in SENSOR_MODELS:
+            parser.error(f"不明なセンサー種別: {sensor}")
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread()
+        args.host, args.port = broker.host, broker.port
+
+    fleet = Fleet(args.devices, sensors, args.seed, args.model)
+    device_ids = [f"{args.prefix}{i:05d}" for i in range(args.devices)]
+    # トピックは起動時に一度だけ作る
+    topics = {sensor: [f"sensors/{d}/{sensor}" for d in device_ids] for sensor in sensors}
+
+    pool = ConnectionPool(args)
+    publishers = pool.publishers(args.devices)
+    if args.status:
+        publish_status(publishers, device_ids, "ONLINE")
+
+    print("🏭 フリートシミュレーター起動")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print(f"🔢 デバイス {args.devices}台 × {len(sensors)}センサー | 接続 {args.connections}本 | "
+          f"ティック {args.interval}秒 | ペイロード {args.payload}")
+    print("Ctrl+C で停止")
+    print("-" * 80)
+
+    step_hist = LatencyHistogram()
+    format_hist = LatencyHistogram()
+    publish_hist = LatencyHistogram()
+    tick_hist = LatencyHistogram()
+    sent = 0
+    alerts = 0
+    overruns = 0
+    ticks = 0
+
+    start = time.monotonic()
+    next_tick = start
+    next_report = start + args.report_interval
+    report_sent = 0
+    report_time = start
+
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick += args.interval
+
+            t0 = time.perf_counter_ns()
+            fleet.step()
+            t1 = time.perf_counter_ns()
+            if args.payload == "binary":
+                now = time.time()
+                payloads = {sensor: fleet.encode(sensor, now) for sensor in sensors}
+            else:
+                payloads = {sensor: fleet.format(sensor) for sensor in sensors}
+            t2 = time.perf_counter_ns()
+
+            for sensor in sensors:
+                for publish, topic, payload in zip(publishers, topics[sensor], payloads[sensor]):
+                    publish(topic, payload, args.qos)
+            sent += args.devices * len(sensors)
+
+            if args.alerts:
+                for sensor in ALERT_RULES:
+                    if sensor not in fleet.values:
+                        continue
+                    _, _, low_name, high_name = ALERT_RULES[sensor]
+                    for i, state in fleet.new_alerts(sensor):
+                        alert_data = {
+                            "sensor_id": device_ids[i],
+                            "type": sensor,
+                            "value": round(float(fleet.values[sensor][i]), 2),
+                            "alert": high_name if state > 0 else low_name,
+                            "timestamp": datetime.now().isoformat()
+                        }
+                        publishers[i](f"alerts/{sensor}", encode_alert(alert_data, args.payload), 2)
+                        alerts += 1
+            t3 = time.perf_counter_ns()
+
+            step_hist.record((t1 - t0) // 1000)
+            format_hist.record((t2 - t1) // 1000)
+            publish_hist.record((t3 - t2) // 1000)
+            tick_hist.record((t3 - t0) // 1000)
+            ticks += 1
+
+            # ティック内に終わらなかった場合は遅れを取り戻さずに次の周期へ
+            now = time.monotonic()
+            if now > next_tick:
+                overruns += 1
+                next_tick = now
+
+            if now >= next_report:
+                rate = (sent - report_sent) / (now - report_time)
+                print(f"[{now - start:7.1f}s] {rate:9.0f} msg/s | ティック {format_ms(tick_hist)} | "
+                      f"生成 {format_ms(step_hist)} | 整形 {format_ms(format_hist)} | "
+                      f"送信 {format_ms(publish_hist)} | 超過 {overruns}/{ticks} | 警報 {alerts}")
+                for hist in (step_hist, format_hist, publish_hist, tick_hist):
+                    hist.reset()
+                report_sent, report_time = sent, now
+                next_report += args.report_interval
+
+    except KeyboardInterrupt:
+        print("\n🛑 フリートシミュレーターを停止します...")
+
+    elapsed = time.monotonic() - start
+    if args.status:
+        publish_status(publishers, device_ids, "OFFLINE")
+    pool.close(args)
+
+    print("-" * 80)
+    print(f"📊 送信 {sent}件 / {elapsed:.1f}秒（平均 {sent / elapsed:.0f} msg/s） | "
+          f"ティック超過 {overruns}/{ticks} | 警報 {alerts}件")
+    if broker is not None:
+        broker.wait_for_clients()
+        print(f"🧩 ブローカー: {format_stats(broker.stats())}")
+        broker.stop()
+    print("✅ 停止完了")
+
+if __name__ == "__main__":
+    main()
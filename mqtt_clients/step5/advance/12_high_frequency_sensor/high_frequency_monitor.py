@@ -0,0 +1,140 @@
+"""
+高頻度センサーのモニター（まとめ送りの受信側）
+
+機能:
+- sensors/+/+/series を購読し、系列を元の測定時刻つきの1サンプルずつに戻す（common/batching.py の unbatch）
+- センサーごとの受信サンプル数・サンプリング周波数を表示
+- 測定時刻から受信までの遅延（まとめ送りの待ち時間 + 通信）を集計
+- 測定時刻の間隔から欠落したサンプルを検出
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.batching import unbatch
+from common.histogram import LatencyHistogram
+
+BROKER = "localhost"
+PORT = 1883
+
+class SensorTrack:
+    """1センサー・1種別の受信状況"""
+
+    def __init__(self):
+        self.samples = 0
+        self.messages = 0
+        self.gaps = 0          # 欠落したサンプル数（推定）
+        self.first = None      # 最初の測定時刻
+        self.last = None       # 最後の測定時刻
+        self.value = None
+
+    def add(self, timestamp, value, interval):
+        if self.last is not None and interval:
+            # 予定間隔の1.5倍以上空いていたら、その間のサンプルが欠落したとみなす
+            missing = round((timestamp - self.last) / interval) - 1
+            if missing > 0 and timestamp - self.last >= interval * 1.5:
+                self.gaps += missing
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.value = value
+        self.samples += 1
+
+    def rate(self):
+        """測定時刻から見たサンプリング周波数（Hz）"""
+        if self.samples < 2 or self.last <= self.first:
+            return 0.0
+        return (self.samples - 1) / (self.last - self.first)
+
+def main():
+    parser = argparse.ArgumentParser(description="高頻度センサーのモニター")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--rate", type=float, default=100.0,
+                        help="想定するサンプリング周波数（Hz、欠落の検出に使用。0で検出しない）")
+    parser.add_argument("--duration", type=float, help="実行秒数（省略時は Ctrl+C まで）")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="統計の表示間隔（秒）")
+    args = parser.parse_args()
+
+    interval = 1.0 / args.rate if args.rate > 0 else 0
+    tracks = {}
+    latency = LatencyHistogram()   # 測定時刻から受信までの遅延（µs）
+    lock = threading.Lock()
+    counts = {"messages": 0, "errors": 0}
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print(f"✅ ブローカーに接続しました: {args.host}:{args.port}")
+            client.subscribe("sensors/+/+/series", 0)
+            print("📡 購読: sensors/+/+/series")
+        else:
+            print(f"❌ 接続失敗: {rc}")
+
+    def on_message(client, userdata, msg):
+        now = time.time()
+        try:
+            samples = list(unbatch(msg.topic, msg.payload))
+        except ValueError as e:
+            with lock:
+                counts["errors"] += 1
+            print(f"⚠️ デコードエラー: {msg.topic} - {e}")
+            return
+        with lock:
+            counts["messages"] += 1
+            for sensor_id, kind, timestamp, value in samples:
+                track = tracks.get((sensor_id, kind))
+                if track is None:
+                    track = tracks[(sensor_id, kind)] = SensorTrack()
+                track.add(timestamp, value, interval)
+                latency.record(max(0, int((now - timestamp) * 1_000_000)))
+            if samples:
+                tracks[(samples[0][0], samples[0][1])].messages += 1
+
+    def report(elapsed):
+        with lock:
+            samples = sum(t.samples for t in tracks.values())
+            factor = samples / counts["messages"] if counts["messages"] else 0
+            print(f"[{elapsed:7.1f}s] メッセージ {counts['messages']}件 → サンプル {samples}件 "
+                  f"(×{factor:.1f}) | デコードエラー {counts['errors']}")
+            if latency.count:
+                p50, p99 = latency.percentiles([50, 99])
+                print(f"  ⏱️ 測定から受信まで p50 {p50 / 1000:.1f}ms p99 {p99 / 1000:.1f}ms "
+                      f"最大 {latency.max / 1000:.1f}ms")
+            for (sensor_id, kind), track in sorted(tracks.items()):
+                print(f"  {sensor_id:<12} {kind:<10} {track.samples:8d}件 | {track.rate():7.1f} Hz | "
+                      f"欠落 {track.gaps}件 | 最新値 {track.value:8.3f}")
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"HighFrequencyMonitor-{os.getpid()}")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    print("🔍 高頻度センサーのモニター起動")
+    print("Ctrl+C で停止")
+    print("-" * 80)
+
+    start = time.monotonic()
+    next_report = start + args.report_interval
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(0.1)
+            if time.monotonic() >= next_report:
+                report(time.monotonic() - start)
+                next_report += args.report_interval
+    except KeyboardInterrupt:
+        print("\n🛑 停止します...")
+
+    client.loop_stop()
+    client.disconnect()
+    print("-" * 80)
+    report(time.monotonic() - start)
+    print("✅ 終了")
+
+if __name__ == "__main__":
+    main()
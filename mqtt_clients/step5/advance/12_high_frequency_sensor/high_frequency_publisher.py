@@ -0,0 +1,141 @@
+"""
+高頻度センサーのまとめ送り publisher
+
+機能:
+- 100Hz などで測定する振動センサーを複数台シミュレート
+- サンプルをセンサーごとに溜め、件数か待ち時間の上限でまとめて送信（common/batching.py）
+- 系列は sensors/<ID>/vibration/series に送信（各サンプルの測定時刻を保持）
+- バッチ化の倍率（サンプル数 / メッセージ数）と、溜めたことによる追加遅延を表示
+- --max-samples 1 で1サンプル1メッセージの送信と比較できる
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.batching import BatchingPublisher, format_stats
+from common.codec import FORMATS, SERIES_MAX_SAMPLES
+from common.mini_broker import format_stats as format_broker_stats
+from common.mini_broker import start_broker_thread
+
+BROKER = "localhost"
+PORT = 1883
+
+class VibrationSensor:
+    """正弦波 + ノイズの振動センサー（単位: g）"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.frequency = rng.uniform(5.0, 15.0)   # 振動の周波数（Hz）
+        self.amplitude = rng.uniform(0.5, 1.5)
+        self.phase = rng.uniform(0, 2 * math.pi)
+
+    def read(self, t):
+        value = self.amplitude * math.sin(2 * math.pi * self.frequency * t + self.phase)
+        return value + self.rng.gauss(0, 0.02)
+
+def main():
+    parser = argparse.ArgumentParser(description="高頻度センサーのまとめ送り publisher")
+    parser.add_argument("--host", default=BROKER, help="ブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="ブローカーのポート")
+    parser.add_argument("--sensors", type=int, default=4, help="センサー数")
+    parser.add_argument("--rate", type=float, default=100.0, help="1台あたりのサンプリング周波数（Hz）")
+    parser.add_argument("--prefix", default="HighFreq", help="センサーIDの接頭辞")
+    parser.add_argument("--kind", default="vibration", help="トピックの種別名")
+    parser.add_argument("--max-samples", type=int, default=100,
+                        help=f"1メッセージにまとめる最大サンプル数（1〜{SERIES_MAX_SAMPLES}）")
+    parser.add_argument("--max-delay", type=float, default=0.1, help="溜めておく最大秒数")
+    parser.add_argument("--digits", type=int, default=3, help="送信する小数点以下の桁数")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=0, help="QoS")
+    parser.add_argument("--payload", choices=FORMATS, default="binary",
+                        help="ペイロード形式（text: JSON、binary: 固定長のバイナリ）")
+    parser.add_argument("--seed", type=int, help="乱数シード")
+    parser.add_argument("--duration", type=float, help="実行秒数（省略時は Ctrl+C まで）")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="統計の表示間隔（秒）")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を --port で起動して使う")
+    args = parser.parse_args()
+    if not 1 <= args.max_samples <= SERIES_MAX_SAMPLES:
+        parser.error(f"--max-samples は 1〜{SERIES_MAX_SAMPLES} にしてください")
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread(port=args.port)
+        args.host, args.port = broker.host, broker.port
+
+    rng = random.Random(args.seed)
+    sensor_ids = [f"{args.prefix}{i:02d}" for i in range(args.sensors)]
+    sensors = [VibrationSensor(rng) for _ in sensor_ids]
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"HighFrequencyPublisher-{os.getpid()}")
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    batcher = BatchingPublisher(client, args.max_samples, args.max_delay, args.qos, args.payload, args.digits)
+    batcher.start()
+
+    print("📈 高頻度センサーのまとめ送り publisher 起動")
+    print(f"📡 ブローカー: {args.host}:{args.port}")
+    print(f"🔢 センサー {args.sensors}台 × {args.rate:g}Hz | まとめ送り 最大{args.max_samples}件 / "
+          f"{args.max_delay * 1000:g}ms | ペイロード {args.payload}")
+    print("Ctrl+C で停止")
+    print("-" * 80)
+
+    interval = 1.0 / args.rate
+    start = time.monotonic()
+    start_wall = time.time()
+    ticks = 0
+    overruns = 0
+    next_report = start + args.report_interval
+    report_messages = 0
+    report_time = start
+
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            due = start + ticks * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -interval:
+                overruns += 1
+
+            # 測定時刻は予定時刻（送信が遅れても元の間隔のまま）
+            t = start_wall + ticks * interval
+            for sensor_id, sensor in zip(sensor_ids, sensors):
+                batcher.add(sensor_id, args.kind, sensor.read(t), t)
+            ticks += 1
+
+            now = time.monotonic()
+            if now >= next_report:
+                stats = batcher.stats()
+                rate = (stats["messages"] - report_messages) / (now - report_time)
+                print(f"[{now - start:7.1f}s] {rate:7.1f} msg/s | {format_stats(stats)}")
+                report_messages = stats["messages"]
+                report_time = now
+                next_report += args.report_interval
+    except KeyboardInterrupt:
+        print("\n🛑 停止します...")
+
+    batcher.close()
+    client.loop_stop()
+    client.disconnect()
+
+    elapsed = time.monotonic() - start
+    stats = batcher.stats()
+    print("-" * 80)
+    print(f"📊 {elapsed:.1f}秒 | {format_stats(stats)}")
+    print(f"📦 {stats['bytes'] / 1024:,.1f} KB（1サンプルあたり {stats['bytes'] / max(stats['samples'], 1):.1f} バイト）"
+          f" | 送信エラー {stats['errors']} | 予定より1周期以上の遅れ {overruns}回")
+    if broker is not None:
+        broker.wait_for_clients()
+        print(f"🧩 ブローカー: {format_broker_stats(broker.stats())}")
+        broker.stop()
+    print("✅ 終了")
+
+if __name__ == "__main__":
+    main()
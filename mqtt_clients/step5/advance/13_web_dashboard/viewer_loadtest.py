@@ -0,0 +1,210 @@
+"""
+Webダッシュボードの閲覧者負荷試験
+
+機能:
+- web_dashboard.py に多数の WebSocket 接続（閲覧者）を張り、差分を受信し続ける
+- 配信サーバーが送った時刻から受信までの遅延、測定時刻から受信までの遅延を集計
+- 試験用のセンサーデータを MQTT に送信（--sensors / --rate、0 なら既存の publisher に任せる）
+- 終了時に /stats.json から配信サーバー側の統計（JSON化・書き込み時間、切断数）を取得して表示
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import FORMATS, encode_reading
+from common.histogram import LatencyHistogram
+from common.web_push import connect_websocket, format_stats, read_message
+
+BROKER = "localhost"
+PORT = 1883
+HTTP_PORT = 8080
+
+class Viewer:
+    """1人の閲覧者（1接続）"""
+
+    def __init__(self, index):
+        self.index = index
+        self.messages = 0
+        self.samples = 0
+        self.bytes = 0
+        self.connected = False
+        self.error = None
+
+async def run_viewer(viewer, args, push_lag, sample_age, stop):
+    try:
+        reader, writer = await connect_websocket(args.http_host, args.http_port)
+    except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+        viewer.error = str(e)
+        return
+    viewer.connected = True
+    try:
+        while not stop.is_set():
+            payload = await read_message(reader, writer)
+            if payload is None:
+                break
+            now = time.time()
+            msg = json.loads(payload)
+            viewer.messages += 1
+            viewer.bytes += len(payload)
+            if msg["type"] != "delta":
+                continue
+            push_lag.record(max(0, int((now - msg["t"]) * 1_000_000)))
+            viewer.samples += len(msg["samples"])
+            # 測定時刻からの遅延は閲覧者ごとに数えると多すぎるので、最初の閲覧者だけで集計
+            if viewer.index == 0:
+                for _, _, measured_at, _ in msg["samples"]:
+                    sample_age.record(max(0, int((now - measured_at) * 1_000_000)))
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        viewer.error = str(e) or "切断"
+    finally:
+        viewer.connected = False
+        writer.close()
+
+def publish_samples(args, stop):
+    """試験用のセンサーデータを送信（別スレッド）"""
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"ViewerLoadtest-{os.getpid()}")
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+    rng = random.Random(1)
+    sensor_ids = [f"WebLoad{i:03d}" for i in range(args.sensors)]
+    values = {sensor_id: rng.uniform(20.0, 30.0) for sensor_id in sensor_ids}
+    interval = 1.0 / args.rate
+    start = time.monotonic()
+    tick = 0
+    while not stop.is_set():
+        delay = start + tick * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        for sensor_id in sensor_ids:
+            values[sensor_id] = min(35.0, max(15.0, values[sensor_id] + rng.uniform(-0.5, 0.5)))
+            value = round(values[sensor_id], 2)
+            client.publish(f"sensors/{sensor_id}/temperature",
+                           encode_reading("temperature", value, args.payload, time.time()))
+        tick += 1
+    client.loop_stop()
+    client.disconnect()
+
+def fetch_stats(args):
+    url = f"http://{args.http_host}:{args.http_port}/stats.json"
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+async def run(args):
+    viewers = [Viewer(i) for i in range(args.viewers)]
+    push_lag = LatencyHistogram()   # 配信サーバーの送信時刻から受信まで（µs）
+    sample_age = LatencyHistogram()  # 測定時刻から受信まで（µs、閲覧者0のみ）
+    stop = asyncio.Event()
+
+    # 一度に接続すると accept の待ち行列があふれるので、少しずつ接続する
+    tasks = []
+    for viewer in viewers:
+        tasks.append(asyncio.create_task(run_viewer(viewer, args, push_lag, sample_age, stop)))
+        if args.ramp > 0 and viewer.index % args.ramp == args.ramp - 1:
+            await asyncio.sleep(0.05)
+    await asyncio.sleep(1.0)
+    print(f"👥 接続中 {sum(v.connected for v in viewers)} / {args.viewers}")
+
+    # 集計は接続がそろってから
+    push_lag.reset()
+    sample_age.reset()
+    base = {v.index: v.messages for v in viewers}
+    start = time.monotonic()
+    next_report = start + args.report_interval
+    while time.monotonic() - start < args.duration:
+        await asyncio.sleep(0.2)
+        now = time.monotonic()
+        if now >= next_report:
+            line = f"[{now - start:6.1f}s] 接続中 {sum(v.connected for v in viewers)}"
+            if push_lag.count:
+                p50, p99 = push_lag.percentiles([50, 99])
+                line += f" | 配信から受信 p50 {p50 / 1000:.1f}ms p99 {p99 / 1000:.1f}ms"
+            print(line)
+            next_report += args.report_interval
+    elapsed = time.monotonic() - start
+
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return viewers, base, push_lag, sample_age, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Webダッシュボードの閲覧者負荷試験")
+    parser.add_argument("--http-host", default="localhost", help="web_dashboard.py のホスト")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="web_dashboard.py のポート")
+    parser.add_argument("--host", default=BROKER, help="MQTTブローカーのホスト（試験データの送信先）")
+    parser.add_argument("--port", type=int, default=PORT, help="MQTTブローカーのポート")
+    parser.add_argument("--viewers", type=int, default=200, help="閲覧者（WebSocket 接続）の数")
+    parser.add_argument("--ramp", type=int, default=50, help="50msごとに接続する数（0で一度に接続）")
+    parser.add_argument("--duration", type=float, default=20.0, help="計測秒数")
+    parser.add_argument("--sensors", type=int, default=20, help="試験データのセンサー数（0で送信しない）")
+    parser.add_argument("--rate", type=float, default=1.0, help="試験データの1台あたりの送信回数（回/秒）")
+    parser.add_argument("--payload", choices=FORMATS, default="binary", help="試験データのペイロード形式")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="途中経過の表示間隔（秒）")
+    parser.add_argument("--output", help="結果の保存先（JSON）")
+    args = parser.parse_args()
+
+    print("🧪 Webダッシュボードの閲覧者負荷試験")
+    print(f"🌐 http://{args.http_host}:{args.http_port}/ | 閲覧者 {args.viewers} | {args.duration:g}秒")
+    if args.sensors:
+        print(f"📡 試験データ: {args.sensors}台 × {args.rate:g}回/秒 → {args.host}:{args.port}")
+    print("-" * 80)
+
+    stop = threading.Event()
+    publisher = None
+    if args.sensors:
+        publisher = threading.Thread(target=publish_samples, args=(args, stop), daemon=True)
+        publisher.start()
+
+    try:
+        viewers, base, push_lag, sample_age, elapsed = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n🛑 中断しました")
+        stop.set()
+        return
+    stop.set()
+    if publisher is not None:
+        publisher.join(5)
+
+    connected = sum(1 for v in viewers if v.messages)
+    failed = [v for v in viewers if v.error and not v.messages]
+    messages = sum(v.messages - base[v.index] for v in viewers)
+    received_bytes = sum(v.bytes for v in viewers)
+    print("-" * 80)
+    print(f"👥 受信できた閲覧者 {connected} / {args.viewers} | 接続失敗 {len(failed)}"
+          + (f"（例: {failed[0].error}）" if failed else ""))
+    print(f"📨 計測中の受信 {messages}件（閲覧者1人あたり {messages / max(connected, 1) / elapsed:.2f}件/秒）"
+          f" | 合計 {received_bytes / 1024:,.1f} KB")
+    result = {"viewers": args.viewers, "connected": connected, "failed": len(failed),
+              "messages": messages, "elapsed_s": round(elapsed, 1)}
+    if push_lag.count:
+        p50, p99 = push_lag.percentiles([50, 99])
+        print(f"⏱️  配信から受信 p50 {p50 / 1000:.1f}ms p99 {p99 / 1000:.1f}ms 最大 {push_lag.max / 1000:.1f}ms")
+        result["push_lag_us"] = push_lag.summary()
+    if sample_age.count:
+        p50, p99 = sample_age.percentiles([50, 99])
+        print(f"⏱️  測定から受信 p50 {p50 / 1000:.1f}ms p99 {p99 / 1000:.1f}ms（配信間隔の待ちを含む）")
+        result["sample_age_us"] = sample_age.summary()
+    try:
+        server_stats = fetch_stats(args)
+        print(f"🧩 配信サーバー: {format_stats(server_stats)}")
+        result["server"] = server_stats
+    except OSError as e:
+        print(f"⚠️  /stats.json を取得できません: {e}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"💾 保存しました: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+ブラウザで見るダッシュボード（HTTP + WebSocket）
+
+機能:
+- sensors/# と alerts/# を購読し、センサーごと・種別ごとの直近の履歴を保持
+- 内蔵の HTTP サーバーで index.html を配信し、WebSocket で新しいサンプル（差分）だけをプッシュ
+- 差分は一定間隔でまとめ、JSON 化は1回だけ行って全ブラウザに同じバイト列を送る（common/web_push.py）
+- 接続直後のブラウザには履歴のスナップショットを送る
+- センサーは受信したトピックから自動で追加（センサーの台数に合わせて画面が増える）
+- 閲覧数・配信回数・JSON化と書き込みの時間を定期的に表示
+"""
+
+import paho.mqtt.client as mqtt
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
+from common.codec import KINDS, SampleReader, decode_alert, is_reading_topic
+from common.mini_broker import start_broker_thread
+from common.web_push import format_stats, start_push_server_thread
+
+BROKER = "localhost"
+PORT = 1883
+HTTP_PORT = 8080
+
+INDEX_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+
+class DashboardState:
+    """ブラウザに送るデータ（MQTT の受信スレッドと配信側で共有）"""
+
+    def __init__(self, history=300, max_alerts=20):
+        self.lock = threading.Lock()
+        self.history = history
+        self.series = {}                       # "センサーID/種別" -> deque([測定時刻, 値])
+        self.status = {}                       # センサーID -> ONLINE / OFFLINE
+        self.alerts = deque(maxlen=max_alerts)
+        self.pending_samples = []              # まだ配信していないサンプル
+        self.pending_status = {}
+        self.pending_alerts = []
+        self.seq = 0                           # 配信した差分の番号
+        self.received = 0
+
+    def add_sample(self, sensor_id, kind, value, measured_at):
+        with self.lock:
+            self.pending_samples.append([sensor_id, kind, round(measured_at, 3), value])
+            self.received += 1
+
+    def set_status(self, sensor_id, status):
+        with self.lock:
+            self.pending_status[sensor_id] = status
+
+    def add_alert(self, alert_data):
+        with self.lock:
+            self.pending_alerts.append(alert_data)
+
+    def take_delta(self):
+        """未配信の分を履歴に移し、差分のメッセージを返す（なければ None）"""
+        with self.lock:
+            if not (self.pending_samples or self.pending_status or self.pending_alerts):
+                return None
+            samples, self.pending_samples = self.pending_samples, []
+            status, self.pending_status = self.pending_status, {}
+            alerts, self.pending_alerts = self.pending_alerts, []
+            for sensor_id, kind, measured_at, value in samples:
+                key = f"{sensor_id}/{kind}"
+                series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = deque(maxlen=self.history)
+                series.append([measured_at, value])
+            self.status.update(status)
+            self.alerts.extend(alerts)
+            self.seq += 1
+            return {
+                "type": "delta",
+                "seq": self.seq,
+                "t": time.time(),
+                "samples": samples,
+                "status": status,
+                "alerts": alerts,
+            }
+
+    def snapshot(self):
+        """新しく接続したブラウザに送る履歴（seq 以下の差分は反映済み）"""
+        with self.lock:
+            return {
+                "type": "snapshot",
+                "seq": self.seq,
+                "t": time.time(),
+                "history": self.history,
+                "series": {key: list(values) for key, values in self.series.items()},
+                "status": dict(self.status),
+                "alerts": list(self.alerts),
+            }
+
+def main():
+    parser = argparse.ArgumentParser(description="ブラウザで見るダッシュボード")
+    parser.add_argument("--host", default=BROKER, help="MQTTブローカーのホスト")
+    parser.add_argument("--port", type=int, default=PORT, help="MQTTブローカーのポート")
+    parser.add_argument("--http-host", default="0.0.0.0", help="HTTPサーバーのアドレス")
+    parser.add_argument("--http-port", type=int, default=HTTP_PORT, help="HTTPサーバーのポート")
+    parser.add_argument("--push-interval", type=float, default=0.5, help="差分をまとめて送る間隔（秒）")
+    parser.add_argument("--history", type=int, default=300, help="センサー・種別ごとに保持する件数")
+    parser.add_argument("--max-buffer", type=int, default=1024 * 1024,
+                        help="1接続の送信バッファの上限（バイト、超えた遅いブラウザは切断）")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="統計の表示間隔（秒）")
+    parser.add_argument("--embedded-broker", action="store_true",
+                        help="プロセス内の軽量ブローカー（common/mini_broker.py）を --port で起動して使う")
+    args = parser.parse_args()
+
+    broker = None
+    if args.embedded_broker:
+        broker = start_broker_thread(port=args.port)
+        args.host, args.port = broker.host, broker.port
+
+    state = DashboardState(args.history)
+    reader = SampleReader()
+
+    with open(INDEX_HTML, 'rb') as f:
+        index_html = f.read()
+
+    server = start_push_server_thread(
+        args.http_host, args.http_port,
+        routes={
+            "/": ("text/html; charset=utf-8", index_html),
+            "/snapshot.json": ("application/json", state.snapshot),
+        },
+        snapshot=state.snapshot,
+        max_buffer=args.max_buffer,
+    )
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print(f"✅ ブローカーに接続: {args.host}:{args.port}")
+            client.subscribe("sensors/#", qos=1)
+            client.subscribe("alerts/#", qos=2)
+            print("📥 トピック購読: sensors/#, alerts/#")
+        else:
+            print(f"❌ 接続失敗: {rc}")
+
+    def on_message(client, userdata, msg):
+        topic = msg.topic
+        try:
+            if is_reading_topic(topic):
+                now = time.time()
+                for sensor_id, kind, value, measured_at in reader.readings(topic, msg.payload):
+                    # 画面に出すのは既知の種別だけ（series の種別はトピックの任意の文字列）
+                    if kind not in KINDS:
+                        continue
+                    state.add_sample(sensor_id, kind, value, measured_at or now)
+            elif topic.startswith("sensors/") and topic.endswith("/status"):
+                state.set_status(topic.split('/')[1], msg.payload.decode())
+            elif topic.startswith("alerts/"):
+                state.add_alert(decode_alert(msg.payload))
+        except ValueError:
+            print(f"⚠️  不正なデータ: {topic} {msg.payload[:40]}")
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, f"WebDashboard-{os.getpid()}")
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.host, args.port, 60)
+    client.loop_start()
+
+    print("🌐 Webダッシュボード起動")
+    print(f"🔗 http://localhost:{server.port}/ をブラウザで開いてください")
+    print(f"⚙️  差分の配信間隔 {args.push_interval}秒 | 履歴 {args.history}件")
+    print("Ctrl+C で停止")
+    print("-" * 80)
+
+    start = time.monotonic()
+    next_push = start
+    next_report = start + args.report_interval
+    try:
+        while True:
+            next_push += args.push_interval
+            delay = next_push - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            delta = state.take_delta()
+            if delta is not None:
+                server.broadcast(delta)
+
+            now = time.monotonic()
+            if now >= next_report:
+                print(f"[{now - start:7.1f}s] 受信 {state.received}件 | {format_stats(server.stats())}")
+                next_report += args.report_interval
+    except KeyboardInterrupt:
+        print("\n🛑 停止します...")
+
+    client.loop_stop()
+    client.disconnect()
+    print(f"📊 {format_stats(server.stats())}")
+    server.stop()
+    if broker is not None:
+        broker.stop()
+    print("✅ 停止完了")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@
 - 温度データをリアルタイムでグラフ表示
 - センサーのステータスを監視
 - matplotlib でアニメーション表示
+- --headless で画面なしに PNG / GIF / MP4 へ描画（common/headless.py）
 """
 
 import paho.mqtt.client as mqtt
@@ -12,6 +13,12 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from collections import deque
 from datetime import datetime
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.headless import add_headless_arguments, run_headless, use_agg
 
 BROKER = "localhost"
 PORT = 1883
@@ -84,6 +91,12 @@ def update_plot(frame):
 def main():
     global fig, ax, line
 
+    parser = argparse.ArgumentParser(description="リアルタイム温度ダッシュボード")
+    add_headless_arguments(parser)
+    args = parser.parse_args()
+    if args.headless:
+        use_agg()
+
     # MQTTクライアント設定
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "Dashboard01")
     client.on_connect = on_connect
@@ -95,7 +108,7 @@ def main():
 
         print("-" * 40)
         print("📊 ダッシュボード起動")
-        print("グラフウィンドウを閉じて終了")
+        print("Ctrl+C で終了" if args.headless else "グラフウィンドウを閉じて終了")
         print("-" * 40)
 
         # グラフの初期化
@@ -106,13 +119,17 @@ def main():
         ax.set_title('リアルタイム温度モニター', fontsize=14, fontweight='bold')
         ax.grid(True, alpha=0.3)
 
-        # アニメーション開始
-        ani = animation.FuncAnimation(
-            fig, update_plot, init_func=init_plot,
-            interval=1000, blit=True, cache_frame_data=False
-        )
-
-        plt.show()
+        if args.headless:
+            # 画面を使わずに一定間隔で描画してファイルに保存（線やタイトルは作り直さない）
+            run_headless(fig, update_plot, init_plot, args)
+        else:
+            # アニメーション開始
+            ani = animation.FuncAnimation(
+                fig, update_plot, init_func=init_plot,
+                interval=1000, blit=True, cache_frame_data=False
+            )
+
+            plt.show()
 
     except KeyboardInterrupt:
         print("\n🛑 ダッシュボードを停止します...")
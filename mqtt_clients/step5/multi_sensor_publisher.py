@@ -5,18 +5,28 @@
 - 温度、湿度、照度の3種類のセンサーをシミュレート
 - 各センサーに適したQoS設定
 - 異常値の検出とアラート送信
+- --payload binary でバイナリ形式のペイロード（common/codec.py）を送信
+- --format batch で1サンプルの全種別を1メッセージ（sensors/<ID>/batch）にまとめて送信
 """
 
 import paho.mqtt.client as mqtt
+import argparse
+import os
 import random
+import sys
 import time
-import json
 from datetime import datetime
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from common.codec import FORMATS, encode_alert, encode_batch, encode_reading
+
 BROKER = "localhost"
 PORT = 1883
 SENSOR_ID = "MultiSensor01"
 
+# ペイロード形式（text: 従来の数値文字列・JSON、binary: 固定長のバイナリ）
+payload_format = "text"
+
 # センサーの現在値
 current_temp = 25.0
 current_humid = 50.0
@@ -85,12 +95,24 @@ def check_alert(client, sensor_type, value):
         # アラートはQoS 2で確実に送信
         client.publish(
             f"alerts/{sensor_type}",
-            json.dumps(alert_data, ensure_ascii=False),
+            encode_alert(alert_data, payload_format),
             qos=2
         )
         print(f"🚨 {alert}: {value}")
 
 def main():
+    global payload_format
+
+    parser = argparse.ArgumentParser(description="複数センサー統合Publisher")
+    parser.add_argument("--payload", choices=FORMATS, default="text",
+                        help="ペイロード形式（text: 数値の文字列とJSON、binary: 固定長のバイナリ）")
+    parser.add_argument("--format", choices=["split", "batch", "both"], default="split",
+                        help="送信方法（split: 種別ごとのトピック、batch: sensors/<ID>/batch にまとめる、both: 両方）")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="batch で1メッセージにまとめるサンプル数（1秒に1サンプル）")
+    args = parser.parse_args()
+    payload_format = args.payload
+
     # クライアント作成
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, SENSOR_ID)
 
@@ -99,12 +121,16 @@ def main():
 
     client.on_connect = on_connect
 
+    # batch で送信待ちのサンプル
+    pending = []
+
     try:
         client.connect(BROKER, PORT, 60)
         client.loop_start()
 
         print("🌡️  マルチセンサー稼働中...")
         print("センサー: 温度、湿度、照度")
+        print(f"ペイロード形式: {payload_format} | 送信方法: {args.format}")
         print("Ctrl+C で停止")
         print("-" * 50)
 
@@ -113,15 +139,28 @@ def main():
             temp = generate_temperature()
             humid = generate_humidity()
             light = generate_light()
+            now = time.time()
+
+            if args.format in ("batch", "both"):
+                # 全種別を1サンプルにまとめ、--samples 件たまったら1メッセージで送信
+                # （both では受信側が batch を先に知るよう、種別ごとのトピックより先に送る）
+                pending.append({"timestamp": now, "temperature": temp, "humidity": humid, "light": light})
+                if len(pending) >= args.samples:
+                    client.publish(f"sensors/{SENSOR_ID}/batch", encode_batch(pending, payload_format), qos=0)
+                    pending = []
 
-            # 温度データ送信（QoS 0: 高速）
-            client.publish(f"sensors/{SENSOR_ID}/temperature", str(temp), qos=0)
+            if args.format in ("split", "both"):
+                # 温度データ送信（QoS 0: 高速）
+                client.publish(f"sensors/{SENSOR_ID}/temperature",
+                               encode_reading("temperature", temp, payload_format, now), qos=0)
 
-            # 湿度データ送信（QoS 0: 高速）
-            client.publish(f"sensors/{SENSOR_ID}/humidity", str(humid), qos=0)
+                # 湿度データ送信（QoS 0: 高速）
+                client.publish(f"sensors/{SENSOR_ID}/humidity",
+                               encode_reading("humidity", humid, payload_format, now), qos=0)
 
-            # 照度データ送信（QoS 0: 高速）
-            client.publish(f"sensors/{SENSOR_ID}/light", str(light), qos=0)
+                # 照度データ送信（QoS 0: 高速）
+                client.publish(f"sensors/{SENSOR_ID}/light",
+                               encode_reading("light", light, payload_format, now), qos=0)
 
             # 異常値チェック
             check_alert(client, "temperature", temp)
@@ -135,6 +174,8 @@ def main():
 
     except KeyboardInterrupt:
         print("\n🛑 センサーシステムを停止します...")
+        if pending:
+            client.publish(f"sensors/{SENSOR_ID}/batch", encode_batch(pending, payload_format), qos=0)
         # 正常停止時もステータスを更新
         client.publish(f"sensors/{SENSOR_ID}/status", "OFFLINE", qos=1, retain=True)
         time.sleep(0.5)